@@ -31,9 +31,13 @@ class Path:
     """Holds the paths of folders and files used by the application"""
 
     __base: str
+    __cache: str
 
     def __init__(self, root: str = os.path.expanduser(f"~/.{APP_NAME.lower()}.d")) -> None:  # noqa
         self.__base = root
+        self.__cache = os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            APP_NAME.lower())
 
     def base(self, folder: str = "") -> str:
         """Return the base directory for application specific files.
@@ -56,6 +60,17 @@ class Path:
         """Return the path to the log file"""
         return os.path.join(self.__base, f"{APP_NAME.lower()}.log")
 
+    def cache(self, folder: str = "") -> str:
+        """Return the path to the tag cache.
+
+        Unlike everything else, the cache does not live in the base
+        directory, so it can be shared by all databases. If folder is a
+        non-empty string, put the cache there instead.
+        """
+        if folder != "":
+            self.__cache = folder
+        return os.path.join(self.__cache, "tags.db")
+
 
 path: Path = Path(os.path.expanduser(f"~/.{APP_NAME.lower()}.d"))
 
@@ -19,7 +19,11 @@ vox.data
 
 import os
 from datetime import datetime
-from typing import Optional, Union
+from typing import Final, NamedTuple, Optional, Union
+
+# Most Files have never been played, so we share a single timestamp between
+# them instead of creating one for each.
+EPOCH: Final[datetime] = datetime.fromtimestamp(0)
 
 
 # pylint: disable-msg=R0903
@@ -46,6 +50,30 @@ class Folder:
         else:
             self.last_scan = datetime.fromtimestamp(0)
 
+    @classmethod
+    def from_row(cls, row: tuple) -> 'Folder':
+        """Create a Folder from a database row of ID, path and last scan.
+
+        Rows from the database are trusted, so nothing is checked.
+        """
+        f = object.__new__(cls)
+        f.folder_id, f.path, stamp = row
+        f.last_scan = datetime.fromtimestamp(stamp)
+        return f
+
+
+class Fingerprint(NamedTuple):
+    """The parts of a file's stat data we use to tell if it has changed."""
+
+    size: int
+    mtime: int
+    inode: int
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> 'Fingerprint':
+        """Create a Fingerprint from the result of os.stat()"""
+        return cls(st.st_size, st.st_mtime_ns, st.st_ino)
+
 
 class File:  # pylint: disable-msg=R0902,R0903
     """File represents an audio file."""
@@ -61,6 +89,10 @@ class File:  # pylint: disable-msg=R0902,R0903
         "position",
         "last_played",
         "url",
+        "size",
+        "mtime",
+        "inode",
+        "digest",
     ]
 
     file_id: int
@@ -73,8 +105,14 @@ class File:  # pylint: disable-msg=R0902,R0903
     position: int
     last_played: datetime
     url: str
+    size: int
+    mtime: int
+    inode: int
+    # Hash over the size and the beginning and end of the file's content,
+    # used to recognize a file that has been moved.
+    digest: str
 
-    # pylint: disable-msg=R0912
+    # pylint: disable-msg=R0912,R0915
     def __init__(self, **fields) -> None:
         if "file_id" in fields:
             assert isinstance(fields["file_id"], int)
@@ -109,6 +147,8 @@ class File:  # pylint: disable-msg=R0902,R0903
         if "title" in fields:
             assert isinstance(fields["title"], str)
             self.title = fields["title"]
+        else:
+            self.title = ""
         if "position" in fields:
             assert isinstance(fields["position"], int)
             self.position = fields["position"]
@@ -120,6 +160,46 @@ class File:  # pylint: disable-msg=R0902,R0903
         if "url" in fields:
             assert isinstance(fields["url"], str)
             self.url = fields["url"]
+        if "fingerprint" in fields:
+            assert isinstance(fields["fingerprint"], Fingerprint)
+            self.set_fingerprint(fields["fingerprint"])
+        else:
+            self.size = 0
+            self.mtime = 0
+            self.inode = 0
+        if "digest" in fields:
+            assert isinstance(fields["digest"], str)
+            self.digest = fields["digest"]
+        else:
+            self.digest = ""
+
+    @classmethod
+    def from_row(cls, row: tuple) -> 'File':
+        """Create a File from a database row.
+
+        The row has to contain ID, Program ID, Folder ID, path, title,
+        position, last played, URL, ord1, ord2, size, mtime, inode and digest,
+        in that order. Rows from the database are trusted, so unlike the
+        regular constructor, this checks nothing.
+        """
+        f = object.__new__(cls)
+        (f.file_id, f.program_id, f.folder_id, f.path, f.title, f.position,
+         stamp, f.url, f.ord1, f.ord2, f.size, f.mtime, f.inode,
+         f.digest) = row
+        f.last_played = EPOCH if stamp == 0 else datetime.fromtimestamp(stamp)
+        if f.url is None:
+            f.url = ""
+        return f
+
+    def fingerprint(self) -> Fingerprint:
+        """Return the File's size, mtime and inode as a Fingerprint."""
+        return Fingerprint(self.size, self.mtime, self.inode)
+
+    def set_fingerprint(self, fp: Fingerprint) -> None:
+        """Set the File's size, mtime and inode from a Fingerprint."""
+        self.size = fp.size
+        self.mtime = fp.mtime
+        self.inode = fp.inode
 
     def display_title(self) -> str:
         """Return the File's title if set or the filename otherwise."""
@@ -184,6 +264,16 @@ class Program:  # pylint: disable-msg=R0903
         else:
             self.current_file = -1
 
+    @classmethod
+    def from_row(cls, row: tuple) -> 'Program':
+        """Create a Program from a database row of ID, title, creator, URL,
+        cover and current file. Nothing is checked.
+        """
+        p = object.__new__(cls)
+        (p.program_id, p.title, p.creator, p.url, p.cover,
+         p.current_file) = row
+        return p
+
 
 class Playlist:
     """A collection of files that are played in sequence"""
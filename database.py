@@ -17,17 +17,89 @@ vox.database
 """
 
 import logging
+import queue
+import re
 import sqlite3
 import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime
 from enum import Enum, auto
-from typing import Final, Optional, Union
+from typing import (Callable, Final, Iterator, NamedTuple, Optional, TypeVar,
+                    Union)
 
 import krylib
 
 from vox import common
-from vox.data import File, Folder, Program
+from vox.data import File, Fingerprint, Folder, Program
+
+BACKFILL_TABLE: Final[str] = """
+CREATE TABLE backfill (
+    version              INTEGER PRIMARY KEY,
+    next                 INTEGER NOT NULL,
+    last                 INTEGER NOT NULL
+) STRICT
+"""
+
+# Programs and Files are indexed for full-text search by their titles, the
+# creator and the path, respectively. The indexes keep a copy of the text,
+# so a row that has not been indexed yet can be updated or deleted safely
+# while the index is being backfilled.
+FTS_QUERIES: Final[list[str]] = [
+    """
+CREATE VIRTUAL TABLE program_fts USING fts5 (
+    title,
+    creator,
+    prefix = '2 3',
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+    """,
+    """
+CREATE VIRTUAL TABLE file_fts USING fts5 (
+    title,
+    path,
+    prefix = '2 3',
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+    """,
+    # Matches in the title count for more.
+    "INSERT INTO program_fts (program_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0)')",  # noqa: E501 # pylint: disable-msg=C0301
+    "INSERT INTO file_fts (file_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",  # noqa: E501 # pylint: disable-msg=C0301
+    """
+CREATE TRIGGER program_fts_add AFTER INSERT ON program BEGIN
+    INSERT INTO program_fts (rowid, title, creator)
+    VALUES (new.id, new.title, new.creator);
+END
+    """,
+    """
+CREATE TRIGGER program_fts_del AFTER DELETE ON program BEGIN
+    DELETE FROM program_fts WHERE rowid = old.id;
+END
+    """,
+    """
+CREATE TRIGGER program_fts_upd AFTER UPDATE OF title, creator ON program BEGIN
+    UPDATE program_fts SET title = new.title, creator = new.creator
+    WHERE rowid = new.id;
+END
+    """,
+    """
+CREATE TRIGGER file_fts_add AFTER INSERT ON file BEGIN
+    INSERT INTO file_fts (rowid, title, path)
+    VALUES (new.id, new.title, new.path);
+END
+    """,
+    """
+CREATE TRIGGER file_fts_del AFTER DELETE ON file BEGIN
+    DELETE FROM file_fts WHERE rowid = old.id;
+END
+    """,
+    """
+CREATE TRIGGER file_fts_upd AFTER UPDATE OF title, path ON file BEGIN
+    UPDATE file_fts SET title = new.title, path = new.path
+    WHERE rowid = new.id;
+END
+    """,
+]
 
 INIT_QUERIES: Final[list[str]] = [
     """
@@ -49,7 +121,6 @@ CREATE TABLE program (
     cur_file             INTEGER NOT NULL DEFAULT -1
 ) STRICT
     """,
-    "CREATE UNIQUE INDEX prog_title_idx ON program (title)",
     "CREATE INDEX prog_creator_idx ON program (creator)",
 
     """
@@ -64,6 +135,10 @@ CREATE TABLE file (
     position             INTEGER NOT NULL DEFAULT 0,
     last_played          INTEGER NOT NULL DEFAULT 0,
     url                  TEXT,
+    size                 INTEGER NOT NULL DEFAULT 0,
+    mtime                INTEGER NOT NULL DEFAULT 0,
+    inode                INTEGER NOT NULL DEFAULT 0,
+    digest               TEXT NOT NULL DEFAULT '',
     FOREIGN KEY (program_id) REFERENCES program (id)
         ON DELETE CASCADE
         ON UPDATE RESTRICT,
@@ -72,10 +147,10 @@ CREATE TABLE file (
         ON UPDATE RESTRICT
 ) STRICT
     """,
-    "CREATE INDEX file_prog_idx ON file (program_id)",
-    "CREATE INDEX file_path_idx ON file (path)",
+    # Files are listed by Program or Folder, in the order they are played.
+    "CREATE INDEX file_prog_ord_idx ON file (program_id, ord1, ord2, title, path)",  # noqa: E501 # pylint: disable-msg=C0301
+    "CREATE INDEX file_folder_ord_idx ON file (folder_id, ord1, ord2, title, path)",  # noqa: E501 # pylint: disable-msg=C0301
     "CREATE INDEX file_title_idx ON file (title)",
-    "CREATE INDEX file_ord_index ON file (ord1, ord2)",
 
     """
  CREATE TABLE playlist (
@@ -94,21 +169,214 @@ CREATE TABLE playlist_entry (
     CHECK (trackno > 0)
 ) STRICT
 """,
-    "CREATE INDEX pe_pl_idx ON playlist_entry (playlist_id)",
     "CREATE INDEX pe_fi_idx ON playlist_entry (file_id)",
+    BACKFILL_TABLE,
+    *FTS_QUERIES,
 ]
 
+
+class Backfill(NamedTuple):
+    """Backfill fills in data for the rows that existed before a Migration.
+
+    query is run for one range of rowids of table at a time, its parameters
+    are the lower (exclusive) and upper (inclusive) bound of the range. Rows
+    added after the Migration are the job of the regular code.
+    """
+
+    table: str
+    query: str
+
+
+class Migration(NamedTuple):
+    """Migration brings the database schema from one version to the next.
+
+    The columns are added unless they exist already, then the queries are
+    run. Both have to be cheap or at least bounded, since they run when the
+    database is opened. Anything that touches every row belongs into the
+    backfill, which runs in chunks later on, see Database.backfill().
+    """
+
+    description: str
+    columns: tuple[tuple[str, str, str], ...] = ()
+    queries: tuple[str, ...] = ()
+    backfill: Optional[Backfill] = None
+
+
+# Each step brings the database from the version that is its index in the
+# list to the next one. The version is kept in PRAGMA user_version, 0 means
+# a database created before we started counting. New steps go to the end,
+# INIT_QUERIES always create the latest version.
+MIGRATIONS: Final[list[Migration]] = [
+    Migration(
+        "Remember the size, mtime, inode and digest of Files",
+        columns=(
+            ("file", "size", "INTEGER NOT NULL DEFAULT 0"),
+            ("file", "mtime", "INTEGER NOT NULL DEFAULT 0"),
+            ("file", "inode", "INTEGER NOT NULL DEFAULT 0"),
+            ("file", "digest", "TEXT NOT NULL DEFAULT ''"),
+        )),
+    Migration(
+        "Index Files in the order they are listed",
+        queries=(
+            "CREATE INDEX IF NOT EXISTS file_prog_ord_idx ON file (program_id, ord1, ord2, title, path)",  # noqa: E501 # pylint: disable-msg=C0301
+            "CREATE INDEX IF NOT EXISTS file_folder_ord_idx ON file (folder_id, ord1, ord2, title, path)",  # noqa: E501 # pylint: disable-msg=C0301
+            "DROP INDEX IF EXISTS prog_title_idx",
+            "DROP INDEX IF EXISTS file_prog_idx",
+            "DROP INDEX IF EXISTS file_path_idx",
+            "DROP INDEX IF EXISTS file_ord_index",
+            "DROP INDEX IF EXISTS pe_pl_idx",
+        )),
+    Migration(
+        "Keep track of unfinished backfills",
+        queries=(BACKFILL_TABLE, )),
+    Migration(
+        "Index Programs and Files for full-text search",
+        queries=(
+            *FTS_QUERIES,
+            # There are few enough Programs to index them right away.
+            "INSERT INTO program_fts (rowid, title, creator) SELECT id, title, creator FROM program",  # noqa: E501 # pylint: disable-msg=C0301
+        ),
+        backfill=Backfill(
+            "file",
+            """
+            INSERT OR REPLACE INTO file_fts (rowid, title, path)
+            SELECT id, title, path FROM file WHERE id > ? AND id <= ?
+            """)),
+]
+
+SCHEMA_VERSION: Final[int] = len(MIGRATIONS)
+
+# How many rows a single chunk of a Backfill covers
+BACKFILL_CHUNK: Final[int] = 2000
+
+# How many seconds Database.backfill() works at most by default
+BACKFILL_BUDGET: Final[float] = 0.05
+
 OPEN_LOCK: Final[threading.Lock] = threading.Lock()
 
+# How many rows to insert with a single statement in the *_add_many methods.
+# Kept small enough to stay below SQLite's limit on host parameters.
+BULK_CHUNK: Final[int] = 100
+
+# How many prepared statements each connection keeps around. We have about
+# forty queries, plus the multi-row INSERTs for the chunk sizes we use.
+STATEMENT_CACHE: Final[int] = 256
+
+# How many rows the *_iter_* methods fetch at once by default
+FETCH_BATCH: Final[int] = 500
+
+# How many Files the *_page methods return by default
+PAGE_SIZE: Final[int] = 200
+
+# Selects the Files that sort after a given one, for paginated queries
+FILE_PAGE_KEY: Final[str] = "AND (ord1, ord2, title, path) > (?, ?, ?, ?)"
+
+# How many results Database.search() returns at most by default
+SEARCH_LIMIT: Final[int] = 100
+
+# How many read-only connections a Pool keeps around by default
+POOL_READERS: Final[int] = 2
+
+
+class Profile(NamedTuple):
+    """A set of PRAGMAs that tune a connection for a certain workload.
+
+    page_size only takes effect when a new database is created.
+    """
+
+    name: str
+    synchronous: str
+    # Negative values are in KiB, positive ones in pages
+    cache_size: int
+    mmap_size: int
+    temp_store: str
+    page_size: int
+    # In milliseconds
+    busy_timeout: int
+    # In pages
+    wal_autocheckpoint: int
+
+
+# For the GUI: Lots of small reads and the odd tiny write, which should not
+# keep the user waiting for long if a scan is holding the write lock.
+INTERACTIVE: Final[Profile] = Profile(
+    name="interactive",
+    synchronous="NORMAL",
+    cache_size=-16 * 1024,
+    mmap_size=64 * 2**20,
+    temp_store="MEMORY",
+    page_size=4096,
+    busy_timeout=5_000,
+    wal_autocheckpoint=1000,
+)
+
+# For the Scanner: Large transactions, which may as well wait a while for
+# the GUI to finish writing, and fewer, larger checkpoints.
+BULK: Final[Profile] = Profile(
+    name="bulk",
+    synchronous="NORMAL",
+    cache_size=-64 * 1024,
+    mmap_size=256 * 2**20,
+    temp_store="MEMORY",
+    page_size=4096,
+    busy_timeout=30_000,
+    wal_autocheckpoint=10_000,
+)
+
+
+class ChangeKind(Enum):
+    """The kinds of changes to Programs and Files we tell subscribers of"""
+
+    ProgramAdd = auto()
+    ProgramUpdate = auto()
+    ProgramDel = auto()
+    FileAdd = auto()
+    FileUpdate = auto()
+    FileDel = auto()
+
+
+class Change(NamedTuple):
+    """A Program or File that has been added, modified or removed"""
+
+    kind: ChangeKind
+    obj_id: int
+
+
+Subscriber = Callable[[list[Change]], None]
+
+# The callbacks to tell about committed changes, by database path
+SUBSCRIBERS: Final[dict[str, list[Subscriber]]] = {}
+SUB_LOCK: Final[threading.Lock] = threading.Lock()
+
+
+def subscribe(path: str, callback: Subscriber) -> None:
+    """Have callback called with the changes to the database at path, after
+    each commit that modifies Programs or Files.
+
+    The callback is called in whichever thread committed the changes, by
+    whatever Database, so it should return quickly.
+    """
+    with SUB_LOCK:
+        SUBSCRIBERS.setdefault(path, []).append(callback)
+
+
+def unsubscribe(path: str, callback: Subscriber) -> None:
+    """Stop calling callback about changes to the database at path."""
+    with SUB_LOCK:
+        if callback in SUBSCRIBERS.get(path, []):
+            SUBSCRIBERS[path].remove(callback)
+
 
 # pylint: disable-msg=C0103,R0904
 class QueryID(Enum):
     """Provides symbolic constants for database queries"""
 
     ProgramAdd = auto()
+    ProgramAddMany = auto()
     ProgramDel = auto()
     ProgramGetAll = auto()
     ProgramGetByID = auto()
+    ProgramGetByIDs = auto()
     ProgramGetByTitle = auto()
     ProgramSetTitle = auto()
     ProgramSetURL = auto()
@@ -116,16 +384,26 @@ class QueryID(Enum):
     ProgramSetCurFile = auto()
     ProgramSetCover = auto()
     FileAdd = auto()
+    FileAddMany = auto()
     FileDel = auto()
+    FileRelink = auto()
     FileGetByID = auto()
+    FileGetByIDs = auto()
     FileGetByPath = auto()
     FileGetByFolder = auto()
     FileGetByProgram = auto()
     FileGetNoProgram = auto()
+    FileGetByProgramPage = auto()
+    FileGetNoProgramPage = auto()
+    FileGetFingerprint = auto()
+    FileGetFingerprintsBelow = auto()
     FileSetTitle = auto()
     FileSetPosition = auto()
     FileSetProgram = auto()
     FileSetOrd = auto()
+    FileSetFingerprint = auto()
+    ProgramSearch = auto()
+    FileSearch = auto()
     FolderAdd = auto()
     FolderGetAll = auto()
     FolderGetByPath = auto()
@@ -139,6 +417,12 @@ db_queries: Final[dict[QueryID, str]] = {
                  VALUES (?,     ?,         ?)
     RETURNING id
     """,
+    QueryID.ProgramAddMany:    """
+    INSERT INTO program (title, creator, url)
+                 VALUES {values}
+    ON CONFLICT (title) DO NOTHING
+    RETURNING id, title
+    """,
     QueryID.ProgramDel:        "DELETE FROM program WHERE id = ?",
     QueryID.ProgramGetAll:     """
     SELECT
@@ -151,6 +435,7 @@ db_queries: Final[dict[QueryID, str]] = {
     FROM program""",
     QueryID.ProgramGetByID:    """
     SELECT
+        id,
         title,
         creator,
         url,
@@ -158,9 +443,20 @@ db_queries: Final[dict[QueryID, str]] = {
         cur_file
     FROM program
     WHERE id = ?""",
+    QueryID.ProgramGetByIDs:   """
+    SELECT
+        id,
+        title,
+        creator,
+        url,
+        cover,
+        cur_file
+    FROM program
+    WHERE id IN ({ids})""",
     QueryID.ProgramGetByTitle: """
     SELECT
         id,
+        title,
         creator,
         url,
         cover,
@@ -173,78 +469,201 @@ db_queries: Final[dict[QueryID, str]] = {
     QueryID.ProgramSetCurFile: "UPDATE program SET cur_file = ? WHERE id = ?",
     QueryID.ProgramSetCover:   "UPDATE program SET cover = ? WHERE id = ?",
     QueryID.FileAdd:           """
-    INSERT INTO file (path, folder_id, program_id, ord1, ord2)
-              VALUES (?,    ?,         ?,          ?,    ?   )
+    INSERT INTO file (path, folder_id, program_id, ord1, ord2, title,
+                      size, mtime, inode, digest)
+              VALUES (?,    ?,         ?,          ?,    ?,    ?,
+                      ?,    ?,     ?,     ?     )
     RETURNING id""",
+    QueryID.FileAddMany:       """
+    INSERT INTO file (path, folder_id, program_id, ord1, ord2, title,
+                      size, mtime, inode, digest)
+              VALUES {values}
+    RETURNING id, path""",
     QueryID.FileDel:           "DELETE FROM file WHERE id = ?",
+    QueryID.FileRelink:        """
+    UPDATE file SET
+        folder_id = ?,
+        path = ?,
+        size = ?,
+        mtime = ?,
+        inode = ?
+    WHERE id = ?""",
+    # The queries that load Files return the columns in the order
+    # File.from_row expects them.
     QueryID.FileGetByID:       """
     SELECT
+        id,
         COALESCE(program_id, 0),
         folder_id,
         path,
         title,
         position,
         last_played,
+        url,
         ord1,
-        ord2
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
     FROM file
     WHERE id = ?""",
+    QueryID.FileGetByIDs:      """
+    SELECT
+        id,
+        COALESCE(program_id, 0),
+        folder_id,
+        path,
+        title,
+        position,
+        last_played,
+        url,
+        ord1,
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
+    FROM file
+    WHERE id IN ({ids})""",
     QueryID.FileGetByPath:     """
     SELECT
         id,
         COALESCE(program_id, 0),
         folder_id,
+        path,
         title,
         position,
         last_played,
+        url,
         ord1,
-        ord2
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
     FROM file
     WHERE path = ?""",
     QueryID.FileGetByFolder: """
-SELECT
-    id,
-    program_id,
-    path,
-    title,
-    position,
-    last_played,
-    url,
-    ord1,
-    ord2
-FROM file
-WHERE folder_id = ?
-ORDER BY ord1, ord2, title, path ASC
+    SELECT
+        id,
+        program_id,
+        folder_id,
+        path,
+        title,
+        position,
+        last_played,
+        url,
+        ord1,
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
+    FROM file
+    WHERE folder_id = ?
+    ORDER BY ord1, ord2, title, path ASC
     """,
     QueryID.FileGetByProgram: """
-SELECT
-    id,
-    folder_id,
-    path,
-    title,
-    position,
-    last_played,
-    url,
-    ord1,
-    ord2
-FROM file
-WHERE program_id = ?
-ORDER BY ord1, ord2, title, path ASC
-""",
+    SELECT
+        id,
+        program_id,
+        folder_id,
+        path,
+        title,
+        position,
+        last_played,
+        url,
+        ord1,
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
+    FROM file
+    WHERE program_id = ?
+    ORDER BY ord1, ord2, title, path ASC
+    """,
     QueryID.FileGetNoProgram: """
-SELECT
-    id,
-    folder_id,
-    path,
-    title,
-    position,
-    last_played,
-    ord1,
-    ord2
-FROM file
-WHERE program_id IS NULL
-ORDER BY ord1, ord2, title, path ASC
-""",
+    SELECT
+        id,
+        program_id,
+        folder_id,
+        path,
+        title,
+        position,
+        last_played,
+        url,
+        ord1,
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
+    FROM file
+    WHERE program_id IS NULL
+    ORDER BY ord1, ord2, title, path ASC
+    """,
+    QueryID.FileGetByProgramPage: """
+    SELECT
+        id,
+        program_id,
+        folder_id,
+        path,
+        title,
+        position,
+        last_played,
+        url,
+        ord1,
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
+    FROM file
+    WHERE program_id = ? {after}
+    ORDER BY ord1, ord2, title, path ASC
+    LIMIT ?
+    """,
+    QueryID.FileGetNoProgramPage: """
+    SELECT
+        id,
+        program_id,
+        folder_id,
+        path,
+        title,
+        position,
+        last_played,
+        url,
+        ord1,
+        ord2,
+        size,
+        mtime,
+        inode,
+        digest
+    FROM file
+    WHERE program_id IS NULL {after}
+    ORDER BY ord1, ord2, title, path ASC
+    LIMIT ?
+    """,
+    QueryID.FileGetFingerprint: """
+    SELECT
+        id,
+        size,
+        mtime,
+        inode
+    FROM file
+    WHERE path = ?""",
+    QueryID.FileGetFingerprintsBelow: """
+    SELECT
+        id,
+        path,
+        size,
+        mtime,
+        inode,
+        digest
+    FROM file
+    WHERE path = ? OR (path > ? AND path < ?)""",
     QueryID.FileSetTitle:     "UPDATE file SET title = ? WHERE id = ?",
     QueryID.FileSetPosition:  """
     UPDATE file SET
@@ -257,16 +676,61 @@ ORDER BY ord1, ord2, title, path ASC
         ord1 = ?,
         ord2 = ?
     WHERE id = ?""",
+    QueryID.FileSetFingerprint: """
+    UPDATE file SET
+        size = ?,
+        mtime = ?,
+        inode = ?,
+        digest = COALESCE(?, digest)
+    WHERE id = ?""",
+    QueryID.ProgramSearch: """
+    SELECT
+        p.id,
+        p.title,
+        p.creator,
+        p.url,
+        p.cover,
+        p.cur_file
+    FROM program_fts
+    INNER JOIN program p ON p.id = program_fts.rowid
+    WHERE program_fts MATCH ?
+    ORDER BY program_fts.rank
+    LIMIT ?
+    """,
+    QueryID.FileSearch: """
+    SELECT
+        f.id,
+        f.program_id,
+        f.folder_id,
+        f.path,
+        f.title,
+        f.position,
+        f.last_played,
+        f.url,
+        f.ord1,
+        f.ord2,
+        f.size,
+        f.mtime,
+        f.inode,
+        f.digest
+    FROM file_fts
+    INNER JOIN file f ON f.id = file_fts.rowid
+    WHERE file_fts MATCH ?
+    ORDER BY file_fts.rank
+    LIMIT ?
+    """,
     QueryID.FolderAdd:        "INSERT INTO folder (path) VALUES (?) RETURNING id",  # noqa: E501
     QueryID.FolderGetAll:     "SELECT id, path, last_scan FROM folder",
     QueryID.FolderGetByPath:  """
     SELECT
         id,
+        path,
         last_scan
     FROM folder
     WHERE path = ?""",
     QueryID.FolderGetByID:    """
     SELECT
+        id,
         path,
         last_scan
     FROM folder
@@ -274,6 +738,8 @@ ORDER BY ord1, ord2, title, path ASC
     QueryID.FolderUpdateScan: "UPDATE folder SET last_scan = ? WHERE id = ?",
 }
 
+T = TypeVar("T")
+
 
 class Database:
     """Database provides a wrapper around the actual database connection."""
@@ -282,40 +748,229 @@ class Database:
         "db",
         "log",
         "path",
+        "depth",
+        "readonly",
+        "changes",
     ]
 
     db: sqlite3.Connection
     log: logging.Logger
     path: Final[str]
+    depth: int
+    readonly: bool
+    # Changes made in the current transaction, published once it commits
+    changes: list[Change]
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, readonly: bool = False, profile: Profile = INTERACTIVE) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Open the database at path, creating it if it does not exist.
+
+        A readonly Database refuses to modify anything, the database has to
+        exist already. profile tunes the connection for the workload it is
+        used for.
+        """
         self.path = path
+        self.depth = 0
+        self.readonly = readonly
+        self.changes = []
         self.log = common.get_logger("database")
         self.log.debug("Open database at %s", path)
         with OPEN_LOCK:
             exist: bool = krylib.fexist(path)
-            self.db = sqlite3.connect(path)  # pylint: disable-msg=C0103
+            # A Database may be handed from one thread to another by a Pool,
+            # but it must never be used by two threads at once.
+            self.db = sqlite3.connect(path,  # pylint: disable-msg=C0103
+                                      check_same_thread=False,
+                                      cached_statements=STATEMENT_CACHE)
             self.db.isolation_level = None
 
             cur: sqlite3.Cursor = self.db.cursor()
+            if not exist:
+                # This has to happen before anything is written.
+                cur.execute(f"PRAGMA page_size = {profile.page_size}")
             cur.execute("PRAGMA foreign_keys = true")
             cur.execute("PRAGMA journal_mode = WAL")
+            cur.execute(f"PRAGMA synchronous = {profile.synchronous}")
+            cur.execute(f"PRAGMA cache_size = {profile.cache_size}")
+            cur.execute(f"PRAGMA mmap_size = {profile.mmap_size}")
+            cur.execute(f"PRAGMA temp_store = {profile.temp_store}")
+            cur.execute(f"PRAGMA busy_timeout = {profile.busy_timeout}")
+            cur.execute(f"PRAGMA wal_autocheckpoint = {profile.wal_autocheckpoint}")  # noqa: E501 # pylint: disable-msg=C0301
 
-            if not exist:
+            if readonly:
+                cur.execute("PRAGMA query_only = true")
+            elif not exist:
                 self.__create_db()
+            else:
+                self.__migrate()
 
     def __create_db(self) -> None:
         """Initialize a freshly created database"""
-        with self.db:
+        with self:
+            cur: sqlite3.Cursor = self.db.cursor()
             for query in INIT_QUERIES:
-                cur: sqlite3.Cursor = self.db.cursor()
                 cur.execute(query)
+            cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def schema_version(self) -> int:
+        """Return the version of the database schema."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute("PRAGMA user_version")
+        return cur.fetchone()[0]
+
+    def __migrate(self) -> None:
+        """Bring a database created by an older version up to date.
+
+        All pending Migrations are applied in a single transaction, so a
+        failure leaves the database as it was. Their Backfills are only
+        recorded, to be run by backfill().
+        """
+        version: Final[int] = self.schema_version()
+        if version > SCHEMA_VERSION:
+            self.log.error("Database %s has schema version %d, we only know up to %d",  # noqa: E501 # pylint: disable-msg=C0301
+                           self.path,
+                           version,
+                           SCHEMA_VERSION)
+            return
+        if version == SCHEMA_VERSION:
+            return
+
+        cur: sqlite3.Cursor = self.db.cursor()
+        with self:
+            for idx in range(version, SCHEMA_VERSION):
+                step: Migration = MIGRATIONS[idx]
+                self.log.info("Migrate database to version %d: %s",
+                              idx + 1,
+                              step.description)
+                for table, column, decl in step.columns:
+                    # Databases from before we kept track of the version may
+                    # have some of the columns already.
+                    cur.execute(f"PRAGMA table_info({table})")
+                    if any(row[1] == column for row in cur.fetchall()):
+                        continue
+                    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")  # noqa: E501 # pylint: disable-msg=C0301
+                for query in step.queries:
+                    cur.execute(query)
+                if step.backfill is not None:
+                    cur.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {step.backfill.table}")  # noqa: E501 # pylint: disable-msg=C0301
+                    last: int = cur.fetchone()[0]
+                    cur.execute("INSERT INTO backfill (version, next, last) VALUES (?, 0, ?)",  # noqa: E501 # pylint: disable-msg=C0301
+                                (idx + 1, last))
+            cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def backfill(self, budget: float = BACKFILL_BUDGET) -> bool:
+        """Work on pending Backfills for about budget seconds, but at least
+        one chunk.
+
+        Each chunk is committed on its own, so a large database can be
+        upgraded bit by bit while it is in use, and an interrupted Backfill
+        picks up where it left off. Return True if nothing is left to do.
+        """
+        deadline: Final[float] = time.monotonic() + budget
+        cur: sqlite3.Cursor = self.db.cursor()
+        chunks: int = 0
+        while True:
+            cur.execute("SELECT version, next, last FROM backfill ORDER BY version LIMIT 1")  # noqa: E501 # pylint: disable-msg=C0301
+            row = cur.fetchone()
+            if row is None:
+                return True
+            if chunks > 0 and time.monotonic() >= deadline:
+                return False
+            chunks += 1
+            version, lo, last = row
+            hi: int = min(lo + BACKFILL_CHUNK, last)
+            bf: Optional[Backfill] = MIGRATIONS[version - 1].backfill
+            assert bf is not None
+            with self:
+                cur.execute(bf.query, (lo, hi))
+                if hi >= last:
+                    self.log.info("Backfill for schema version %d is complete",  # noqa: E501 # pylint: disable-msg=C0301
+                                  version)
+                    cur.execute("DELETE FROM backfill WHERE version = ?",
+                                (version, ))
+                else:
+                    cur.execute("UPDATE backfill SET next = ? WHERE version = ?",  # noqa: E501 # pylint: disable-msg=C0301
+                                (hi, version))
 
     def __enter__(self) -> None:
-        self.db.__enter__()
+        # Since we set isolation_level to None, the sqlite3 module does not
+        # begin transactions implicitly, so we have to do it ourselves.
+        # Nested with-blocks join the outermost transaction.
+        # A transaction that starts out reading and then writes cannot wait
+        # for another writer to finish, it fails right away if one has
+        # committed in the meantime. So we take the write lock up front,
+        # which waits for busy_timeout if need be. Read-only Databases get a
+        # read transaction, and see the same snapshot until it ends.
+        if self.depth == 0 and not self.db.in_transaction:
+            self.db.execute("BEGIN" if self.readonly else "BEGIN IMMEDIATE")
+        self.depth += 1
 
     def __exit__(self, ex_type, ex_val, traceback):
-        return self.db.__exit__(ex_type, ex_val, traceback)
+        self.depth -= 1
+        if self.depth > 0:
+            return False
+        try:
+            res = self.db.__exit__(ex_type, ex_val, traceback)
+        except sqlite3.Error:
+            self.changes = []
+            raise
+        if ex_type is None:
+            self.__publish()
+        else:
+            self.changes = []
+        return res
+
+    def __changed(self, kind: ChangeKind, *ids: int) -> None:
+        """Record changes, publish them right away unless we are in a
+        transaction.
+        """
+        self.changes.extend(Change(kind, obj_id) for obj_id in ids)
+        if not self.db.in_transaction:
+            self.__publish()
+
+    def __publish(self) -> None:
+        """Tell the subscribers about the changes committed so far."""
+        if len(self.changes) == 0:
+            return
+        changes: Final[list[Change]] = self.changes
+        self.changes = []
+        with SUB_LOCK:
+            subscribers: list[Subscriber] = list(SUBSCRIBERS.get(self.path, []))  # noqa: E501 # pylint: disable-msg=C0301
+        for callback in subscribers:
+            try:
+                callback(changes)
+            except Exception as e:  # pylint: disable-msg=W0718
+                self.log.error("Caught exception in change subscriber: %s", e)  # noqa: E501 # pylint: disable-msg=C0301
+
+    def __insert_many(self, qid: QueryID, rows: list[tuple]) -> list[tuple]:
+        """Insert rows in chunks of multi-row INSERTs, return the results."""
+        if len(rows) == 0:
+            return []
+        width: Final[int] = len(rows[0])
+        placeholder: Final[str] = "(" + ", ".join("?" * width) + ")"
+        results: list[tuple] = []
+        cur: sqlite3.Cursor = self.db.cursor()
+        with self:
+            for i in range(0, len(rows), BULK_CHUNK):
+                chunk = rows[i:i+BULK_CHUNK]
+                query = db_queries[qid].format(
+                    values=", ".join([placeholder] * len(chunk)))
+                cur.execute(query, [val for row in chunk for val in row])
+                results.extend(cur.fetchall())
+        return results
+
+    def __select_by_ids(self, qid: QueryID, ids: list[int]) -> list[tuple]:
+        """Fetch the rows with the given IDs, BULK_CHUNK IDs per query.
+
+        The caller has to hold a transaction for the rows to be consistent.
+        """
+        results: list[tuple] = []
+        cur: sqlite3.Cursor = self.db.cursor()
+        for i in range(0, len(ids), BULK_CHUNK):
+            chunk = ids[i:i+BULK_CHUNK]
+            cur.execute(db_queries[qid].format(ids=", ".join("?" * len(chunk))),  # noqa: E501 # pylint: disable-msg=C0301
+                        chunk)
+            results.extend(cur.fetchall())
+        return results
 
     def program_add(self, prog: Program) -> None:
         """Add a Program to the database."""
@@ -324,27 +979,44 @@ class Database:
                     (prog.title, prog.creator, prog.url))
         row = cur.fetchone()
         prog.program_id = row[0]
+        self.__changed(ChangeKind.ProgramAdd, prog.program_id)
+
+    def program_add_many(self, progs: list[Program]) -> None:
+        """Add several Programs to the database in one transaction.
+
+        A Program whose title someone else has added in the meantime is not
+        added again, it gets the ID of the existing one instead.
+        """
+        rows = [(p.title, p.creator, p.url) for p in progs]
+        with self:
+            ids: dict[str, int] = dict((row[1], row[0]) for row in
+                                       self.__insert_many(
+                                           QueryID.ProgramAddMany, rows))
+            added: Final[list[int]] = list(ids.values())
+            for p in progs:
+                if p.title in ids:
+                    p.program_id = ids[p.title]
+                    continue
+                existing = self.program_get_by_title(p.title)
+                assert existing is not None
+                p.program_id = existing.program_id
+        self.__changed(ChangeKind.ProgramAdd, *added)
 
     def program_delete(self, prog) -> None:
         """Remove a program from the database."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.ProgramDel], (prog.program_id, ))
+        self.__changed(ChangeKind.ProgramDel, prog.program_id)
 
     def program_get_all(self) -> list[Program]:
         """Load all Programs from the database."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.ProgramGetAll])
-        progs: list[Program] = []
-        for row in cur:
-            p = Program(
-                program_id=row[0],
-                title=row[1],
-                creator=row[2],
-                url=row[3],
-                cover=row[4],
-                current_file=row[5])
-            progs.append(p)
-        return progs
+        return [Program.from_row(row) for row in cur]
+
+    def program_iter_all(self, batch: int = FETCH_BATCH) -> Iterator[Program]:
+        """Yield all Programs, fetching batch rows at a time."""
+        return self.__stream(QueryID.ProgramGetAll, (), Program.from_row, batch)  # noqa: E501 # pylint: disable-msg=C0301
 
     def program_get_by_id(self, pid: int) -> Optional[Program]:
         """Fetch a Program by its database ID"""
@@ -352,32 +1024,23 @@ class Database:
         cur.execute(db_queries[QueryID.ProgramGetByID], (pid, ))
         row = cur.fetchone()
         if row is not None:
-            prog = Program(
-                program_id=pid,
-                title=row[0],
-                creator=row[1],
-                url=row[2],
-                cover=row[3],
-                current_file=row[4],
-            )
-            return prog
+            return Program.from_row(row)
         return None
 
+    def program_get_by_ids(self, ids: list[int]) -> list[Program]:
+        """Fetch several Programs by their IDs, leave out the ones that do
+        not exist.
+        """
+        return [Program.from_row(row) for row in
+                self.__select_by_ids(QueryID.ProgramGetByIDs, ids)]
+
     def program_get_by_title(self, title: str) -> Optional[Program]:
         """Fetch a Program by its title"""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.ProgramGetByTitle], (title, ))
         row = cur.fetchone()
         if row is not None:
-            prog = Program(
-                program_id=row[0],
-                title=title,
-                creator=row[1],
-                url=row[2],
-                cover=row[3],
-                cur_file=row[4],
-            )
-            return prog
+            return Program.from_row(row)
         return None
 
     def program_set_title(self, prog: Program, title: str) -> None:
@@ -385,12 +1048,14 @@ class Database:
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.ProgramSetTitle], (title, prog.program_id))  # noqa: E501
         prog.title = title
+        self.__changed(ChangeKind.ProgramUpdate, prog.program_id)
 
     def program_set_creator(self, prog: Program, creator: str) -> None:
         """Update the Program creator in the database."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.ProgramSetCreator], (creator, prog.program_id))  # noqa: E501
         prog.creator = creator
+        self.__changed(ChangeKind.ProgramUpdate, prog.program_id)
 
     def program_set_url(self, prog: Program, url: str) -> None:
         """Update the program's URL."""
@@ -398,6 +1063,7 @@ class Database:
         cur.execute(db_queries[QueryID.ProgramSetURL],
                     (url, prog.program_id))
         prog.url = url
+        self.__changed(ChangeKind.ProgramUpdate, prog.program_id)
 
     def program_set_cur_file(self, prog: Program, file_id: int) -> None:
         """Update the current file of a Program"""
@@ -405,6 +1071,7 @@ class Database:
         cur.execute(db_queries[QueryID.ProgramSetCurFile],
                     (file_id, prog.program_id))
         prog.current_file = file_id
+        self.__changed(ChangeKind.ProgramUpdate, prog.program_id)
 
     def program_set_cover(self, prog: Program, cover: str) -> None:
         """Update a Program's cover"""
@@ -422,27 +1089,55 @@ class Database:
             cur.execute(db_queries[QueryID.ProgramSetCover],
                         (cover, prog.program_id))
             prog.cover = cover
+            self.__changed(ChangeKind.ProgramUpdate, prog.program_id)
 
     def file_add(self, f: File) -> None:
         """Add a File to the database."""
         self.log.debug("file_add: %s", f.path)
         cur: sqlite3.Cursor = self.db.cursor()
-        pid: Optional[int] = None
-        if f.program_id is not None and f.program_id > 0:
-            pid = f.program_id
-        args = (f.path,
-                f.folder_id,
-                pid,
-                f.ord1,
-                f.ord2)
-        cur.execute(db_queries[QueryID.FileAdd], args)
+        cur.execute(db_queries[QueryID.FileAdd], file_add_args(f))
         row = cur.fetchone()
         f.file_id = row[0]
+        self.__changed(ChangeKind.FileAdd, f.file_id)
+
+    def file_add_many(self, files: list[File]) -> None:
+        """Add several Files to the database in one transaction."""
+        if len(files) == 0:
+            return
+        self.log.debug("file_add_many: %d files", len(files))
+        rows = [file_add_args(f) for f in files]
+        ids: dict[str, int] = dict((row[1], row[0]) for row in
+                                   self.__insert_many(QueryID.FileAddMany,
+                                                      rows))
+        for f in files:
+            f.file_id = ids[f.path]
+        self.__changed(ChangeKind.FileAdd, *ids.values())
 
     def file_delete(self, f: File) -> None:
         """Remove a file from the database."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.FileDel], (f.file_id, ))
+        self.__changed(ChangeKind.FileDel, f.file_id)
+
+    def file_delete_many(self, file_ids: list[int]) -> None:
+        """Remove several Files, given by their IDs, in one transaction."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        with self:
+            cur.executemany(db_queries[QueryID.FileDel],
+                            [(fid, ) for fid in file_ids])
+            self.__changed(ChangeKind.FileDel, *file_ids)
+
+    def file_relink(self, file_id: int, folder_id: int, path: str, fp: Fingerprint) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Point a File that has been moved to its new location.
+
+        Everything else about the File, including the playback position,
+        stays as it is.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.FileRelink],
+                    (folder_id, path, fp.size, fp.mtime, fp.inode, file_id))
+        # The File may be listed by its filename.
+        self.__changed(ChangeKind.FileUpdate, file_id)
 
     def file_get_by_id(self, file_id: int) -> Optional[File]:
         """Fetch a File by its ID"""
@@ -450,59 +1145,49 @@ class Database:
         cur.execute(db_queries[QueryID.FileGetByID], (file_id, ))
         row = cur.fetchone()
         if row is not None:
-            f = File(
-                file_id=file_id,
-                program_id=row[0],
-                folder_id=row[1],
-                path=row[2],
-                title=row[3],
-                position=row[4],
-                last_played=datetime.fromtimestamp(row[5]),
-                ord1=row[6],
-                ord2=row[7],
-            )
-            return f
+            return File.from_row(row)
         return None
 
+    def file_get_by_ids(self, ids: list[int]) -> list[File]:
+        """Fetch several Files by their IDs, leave out the ones that do not
+        exist.
+        """
+        return [File.from_row(row) for row in
+                self.__select_by_ids(QueryID.FileGetByIDs, ids)]
+
     def file_get_by_path(self, path: str) -> Optional[File]:
         """Fetch a File by its path"""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.FileGetByPath], (path, ))
         row = cur.fetchone()
         if row is not None:
-            f = File(
-                file_id=row[0],
-                program_id=row[1],
-                folder_id=row[2],
-                path=path,
-                title=row[3],
-                position=row[4],
-                last_played=datetime.fromtimestamp(row[5]),
-                ord1=row[6],
-                ord2=row[7],
-            )
-            return f
+            return File.from_row(row)
         return None
 
     def file_get_by_program(self, prog_id: int) -> list[File]:
         """Load all Files that belong to a given Program."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.FileGetByProgram], (prog_id, ))
-        files: list[File] = []
-        for row in cur:
-            f = File(
-                file_id=row[0],
-                program_id=prog_id,
-                folder_id=row[1],
-                path=row[2],
-                title=row[3],
-                position=row[4],
-                last_played=datetime.fromtimestamp(row[5]),
-                ord1=(row[7] or 0),
-                ord2=(row[8] or 0),
-            )
-            files.append(f)
-        return files
+        return [File.from_row(row) for row in cur]
+
+    def file_iter_by_program(self, prog_id: int, batch: int = FETCH_BATCH) -> Iterator[File]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Yield the Files that belong to a given Program, in order,
+        fetching batch rows at a time."""
+        return self.__stream(QueryID.FileGetByProgram,
+                             (prog_id, ),
+                             File.from_row,
+                             batch)
+
+    def file_get_by_program_page(self, prog_id: int, after: Optional[File] = None, limit: int = PAGE_SIZE) -> list[File]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Load up to limit Files of a given Program.
+
+        If after is not None, start with the File that sorts right after it,
+        so passing the last File of a page returns the next page.
+        """
+        return self.__page(QueryID.FileGetByProgramPage,
+                           (prog_id, ),
+                           after,
+                           limit)
 
     def file_get_by_folder(self, folder: Union[int, Folder]) -> list[File]:
         """Load all Files that live in the given Folder."""
@@ -513,47 +1198,98 @@ class Database:
             folder_id = folder.folder_id
 
         cur: sqlite3.Cursor = self.db.cursor()
-        cur.execute(db_queries[QueryID.FileGetByProgram], (folder_id, ))
-        files: list[File] = []
-        for row in cur:
-            f = File(
-                file_id=row[0],
-                folder_id=folder_id,
-                program_id=row[1],
-                path=row[2],
-                title=row[3],
-                position=row[4],
-                last_played=datetime.fromtimestamp(row[5]),
-                ord1=row[6],
-                ord2=row[7],
-            )
-            files.append(f)
-        return files
+        cur.execute(db_queries[QueryID.FileGetByFolder], (folder_id, ))
+        return [File.from_row(row) for row in cur]
 
     def file_get_no_program(self) -> list[File]:
         """Return all Files that have no program associated with them."""
         cur: sqlite3.Cursor = self.db.cursor()
-        files: list[File] = []
         cur.execute(db_queries[QueryID.FileGetNoProgram])
+        return [File.from_row(row) for row in cur]
+
+    def file_iter_no_program(self, batch: int = FETCH_BATCH) -> Iterator[File]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Yield all Files that have no Program, in order, fetching batch
+        rows at a time."""
+        return self.__stream(QueryID.FileGetNoProgram, (), File.from_row, batch)  # noqa: E501 # pylint: disable-msg=C0301
+
+    def file_get_no_program_page(self, after: Optional[File] = None, limit: int = PAGE_SIZE) -> list[File]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Load up to limit Files that have no Program.
+
+        Like file_get_by_program_page, pass the last File of a page as after
+        to get the next one.
+        """
+        return self.__page(QueryID.FileGetNoProgramPage, (), after, limit)
+
+    def __page(self, qid: QueryID, params: tuple, after: Optional[File], limit: int) -> list[File]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Run a paginated File query.
+
+        Pages are found by their sorting key rather than by an offset, so
+        fetching a page costs the same no matter how far in we are.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        if after is None:
+            query = db_queries[qid].format(after="")
+        else:
+            query = db_queries[qid].format(after=FILE_PAGE_KEY)
+            params = (*params, after.ord1, after.ord2, after.title, after.path)  # noqa: E501 # pylint: disable-msg=C0301
+        cur.execute(query, (*params, limit))
+        return [File.from_row(row) for row in cur]
+
+    def __stream(self, qid: QueryID, params: tuple, factory: Callable[[tuple], T], batch: int) -> Iterator[T]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Run a query and yield its results, fetching batch rows at a time.
+
+        No transaction is started here. All batches come from one snapshot
+        only if the caller holds a transaction for as long as it iterates,
+        as Pool.reader() does. Otherwise, writes made in between may show
+        up in later batches. The statement stays open until the iterator
+        is exhausted or closed, so callers should not hang on to it.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[qid], params)
+        try:
+            while len(rows := cur.fetchmany(batch)) > 0:
+                for row in rows:
+                    yield factory(row)
+        finally:
+            cur.close()
+
+    def file_get_fingerprint(self, path: str) -> Optional[tuple[int, Fingerprint]]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Return the ID and the stored Fingerprint of the File at path."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.FileGetFingerprint], (path, ))
+        row = cur.fetchone()
+        if row is not None:
+            return (row[0], Fingerprint(row[1], row[2], row[3]))
+        return None
+
+    def file_get_fingerprints_below(self, root: str) -> dict[str, tuple[int, Fingerprint, str]]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Return the IDs, Fingerprints and digests of all Files below root.
+
+        The result maps each File's path to its ID, Fingerprint and content
+        digest. Files are matched by path, not by Folder, so Files that
+        belong to a Folder nested inside root are included. If root is the
+        path of a File itself, that File is included, too.
+        """
+        prefix: Final[str] = root.rstrip("/") + "/"
+        # "0" is the character that follows "/", so this range contains
+        # exactly the paths starting with prefix and can use the path index.
+        limit: Final[str] = prefix[:-1] + "0"
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.FileGetFingerprintsBelow],
+                    (root, prefix, limit))
+        known: dict[str, tuple[int, Fingerprint, str]] = {}
         for row in cur:
-            f = File(
-                file_id=row[0],
-                folder_id=row[1],
-                path=row[2],
-                title=row[3],
-                position=row[4],
-                last_played=datetime.fromtimestamp(row[5]),
-                ord1=row[6],
-                ord2=row[7],
-            )
-            files.append(f)
-        return files
+            known[row[1]] = (row[0],
+                             Fingerprint(row[2], row[3], row[4]),
+                             row[5])
+        return known
 
     def file_set_title(self, f: File, title: str) -> None:
         """Update a File's title."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.FileSetTitle], (title, f.file_id))
         f.title = title
+        self.__changed(ChangeKind.FileUpdate, f.file_id)
 
     def file_set_position(self, f: File, pos: int) -> None:
         """Update a File's playback position."""
@@ -562,18 +1298,64 @@ class Database:
                     (pos, int(time.time()), f.file_id))
         f.position = pos
 
+    def file_set_position_many(self, positions: list[tuple[File, int, int]]) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Update the playback positions of several Files at once.
+
+        positions holds the File, its new position, and the time it was
+        last played at.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        with self:
+            cur.executemany(db_queries[QueryID.FileSetPosition],
+                            [(pos, stamp, f.file_id)
+                             for f, pos, stamp in positions])
+        for f, pos, _ in positions:
+            f.position = pos
+
     def file_set_ord(self, f: File, o1: int, o2: int) -> None:
         """Set a File's sorting indices."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.FileSetOrd], (o1, o2, f.file_id))
         f.ord1 = o1
         f.ord2 = o2
+        self.__changed(ChangeKind.FileUpdate, f.file_id)
+
+    def file_set_fingerprint(self, f: File, fp: Fingerprint, digest: Optional[str] = None) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Update a File's size, mtime and inode.
+
+        If digest is not None, update the File's content digest, too.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.FileSetFingerprint],
+                    (fp.size, fp.mtime, fp.inode, digest, f.file_id))
+        f.set_fingerprint(fp)
+        if digest is not None:
+            f.digest = digest
 
     def file_set_program(self, f: File, pid: int) -> None:
         """Set a File's Program."""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.FileSetProgram], (pid, f.file_id))
         f.program_id = pid
+        self.__changed(ChangeKind.FileUpdate, f.file_id)
+
+    def search(self, text: str, limit: int = SEARCH_LIMIT) -> tuple[list[Program], list[File]]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Find the Programs and Files that match all words in text.
+
+        Words match any word that starts with them, so "pratch disc" finds
+        Terry Pratchett's Discworld. Programs are matched by title and
+        creator, Files by title and path. The best matches come first, at
+        most limit of each.
+        """
+        match: Final[str] = fts_query(text)
+        if match == "":
+            return [], []
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.ProgramSearch], (match, limit))
+        progs: list[Program] = [Program.from_row(row) for row in cur]
+        cur.execute(db_queries[QueryID.FileSearch], (match, limit))
+        files: list[File] = [File.from_row(row) for row in cur]
+        return progs, files
 
     def folder_add(self, folder: Folder) -> None:
         """Add a Folder to the database."""
@@ -586,11 +1368,11 @@ class Database:
         """Fetch all folders from the database"""
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.FolderGetAll])
-        folders: list[Folder] = []
-        for row in cur:
-            f = Folder(row[0], row[1], row[2])
-            folders.append(f)
-        return folders
+        return [Folder.from_row(row) for row in cur]
+
+    def folder_iter_all(self, batch: int = FETCH_BATCH) -> Iterator[Folder]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Yield all Folders, fetching batch rows at a time."""
+        return self.__stream(QueryID.FolderGetAll, (), Folder.from_row, batch)  # noqa: E501 # pylint: disable-msg=C0301
 
     def folder_get_by_id(self, folder_id: int) -> Optional[Folder]:
         """Look up a Folder by its ID"""
@@ -598,8 +1380,7 @@ class Database:
         cur.execute(db_queries[QueryID.FolderGetByID], (folder_id, ))
         row = cur.fetchone()
         if row is not None:
-            f = Folder(folder_id, row[0], row[1])
-            return f
+            return Folder.from_row(row)
         return None
 
     def folder_get_by_path(self, path: str) -> Optional[Folder]:
@@ -608,8 +1389,7 @@ class Database:
         cur.execute(db_queries[QueryID.FolderGetByPath], (path, ))
         row = cur.fetchone()
         if row is not None:
-            f = Folder(row[0], path, row[1])
-            return f
+            return Folder.from_row(row)
         return None
 
     def folder_update_scan(self, folder: Folder, timestamp: datetime) -> None:
@@ -620,6 +1400,128 @@ class Database:
                      folder.folder_id))
         folder.last_scan = timestamp
 
+
+class Pool:
+    """Pool holds a fixed set of open Databases to be shared by threads.
+
+    There is a single writer, which only one thread at a time can check
+    out, and a number of read-only Databases. Connections are opened and
+    configured once, when the Pool is created, so checking one out is
+    cheap. Use the reader() and writer() context managers, or checkout()
+    and checkin() if a Database has to be held beyond a single block.
+    """
+
+    __slots__ = [
+        "log",
+        "path",
+        "write_db",
+        "write_lock",
+        "readers",
+        "size",
+    ]
+
+    log: logging.Logger
+    path: Final[str]
+    write_db: Database
+    write_lock: threading.RLock
+    readers: queue.LifoQueue[Database]
+    size: int
+
+    def __init__(self, path: str, readers: int = POOL_READERS) -> None:
+        assert readers > 0
+        self.path = path
+        self.log = common.get_logger("database")
+        self.log.debug("Open pool of %d readers for %s", readers, path)
+        # The writer creates or upgrades the database, so it has to come
+        # first.
+        self.write_db = Database(path)
+        self.write_lock = threading.RLock()
+        self.readers = queue.LifoQueue()
+        self.size = readers
+        for _ in range(readers):
+            self.readers.put(Database(path, readonly=True))
+
+    def checkout(self, write: bool = False) -> Database:
+        """Take a Database from the Pool, waiting until one is available.
+
+        The writer may be checked out several times by the same thread, it
+        has to be checked in as many times.
+        """
+        if write:
+            self.write_lock.acquire()  # pylint: disable-msg=R1732
+            return self.write_db
+        return self.readers.get()
+
+    def checkin(self, db: Database) -> None:
+        """Return a Database to the Pool."""
+        if db is self.write_db:
+            self.write_lock.release()
+        else:
+            self.readers.put(db)
+
+    @contextmanager
+    def reader(self) -> Iterator[Database]:
+        """Check out a read-only Database for the duration of a with-block.
+
+        All queries in the block see the database as it was when the first
+        of them ran, no matter what is written in the meantime, and nothing
+        that is written has to wait for them.
+        """
+        db = self.checkout()
+        try:
+            with db:
+                yield db
+        finally:
+            self.checkin(db)
+
+    @contextmanager
+    def writer(self) -> Iterator[Database]:
+        """Check out the writer for the duration of a with-block."""
+        db = self.checkout(True)
+        try:
+            yield db
+        finally:
+            self.checkin(db)
+
+    def close(self) -> None:
+        """Close all connections that are not checked out.
+
+        The Pool must not be used afterwards.
+        """
+        with self.write_lock:
+            self.write_db.db.close()
+        while True:
+            try:
+                self.readers.get_nowait().db.close()
+            except queue.Empty:
+                break
+
+
+def fts_query(text: str) -> str:
+    """Turn text into a full-text query for rows that contain all of its
+    words, or words starting with them.
+
+    Each word is quoted, so the user cannot trip over the query syntax.
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+def file_add_args(f: File) -> tuple:
+    """Return the parameters for inserting a File into the database."""
+    pid: Optional[int] = None
+    if f.program_id is not None and f.program_id > 0:
+        pid = f.program_id
+    return (f.path,
+            f.folder_id,
+            pid,
+            f.ord1,
+            f.ord2,
+            f.title,
+            f.size,
+            f.mtime,
+            f.inode,
+            f.digest)
+
 # Local Variables: #
 # python-indent: 4 #
 # End: #
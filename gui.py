@@ -17,14 +17,18 @@ vox.ui
 """
 
 # pylint: disable-msg=C0413,R0902,C0411
+import os
+import queue
+import sqlite3
+import time
+from collections import OrderedDict
 from enum import Enum, auto
-from threading import RLock, Thread, current_thread, local
+from threading import Event, RLock, Thread, current_thread
 from typing import Any, Callable, Final, Optional
 
 import gi  # type: ignore
-from krylib import cmp, sign
 
-from vox import common, database, scanner
+from vox import common, database, position, scanner, watcher
 from vox.data import File, Program
 
 gi.require_version("Gtk", "3.0")
@@ -34,6 +38,7 @@ gi.require_version("Gst", "1.0")
 gi.require_version("GLib", "2.0")
 from gi.repository import Gdk as gdk  # noqa: E402
 from gi.repository import GLib as glib  # noqa: E402
+from gi.repository import GObject as gobject  # noqa: E402
 from gi.repository import Gst as gst  # noqa: E402
 from gi.repository import \
     Gtk as gtk  # noqa: E402,E501 # pylint: disable-msg=C0411,E0611
@@ -41,6 +46,27 @@ from gi.repository import \
 # from gi.repository import GdkPixbuf as gdk_pixbuf  # noqa: E402,F401
 
 
+# How long, in seconds, nothing has to be written before we work on
+# upgrading the database
+BACKFILL_INTERVAL: Final[float] = 0.25
+
+# How many Programs keep their Files in the tree once they are collapsed.
+# Beyond that, the Files of the least recently expanded ones are dropped,
+# and loaded again from the database the next time they are expanded.
+LOADED_PROGRAMS: Final[int] = 32
+
+# How many rows the loader threads hand to the main loop at once, and for
+# how many seconds at most the main loop adds rows before it gets back to
+# handling events.
+LOAD_CHUNK: Final[int] = 200
+LOAD_BUDGET: Final[float] = 0.010
+
+# The column of the program tree holding the key its rows are sorted by.
+# Keeping the key in a plain integer column lets gtk compare rows itself,
+# without calling back into Python.
+SORT_KEY_COLUMN: Final[int] = 8
+
+
 class PlayerState(Enum):
     """Symbolic constants for the player's state."""
 
@@ -55,12 +81,49 @@ class VoxUI:
     """The graphical interface to the application, built using gtk3"""
 
     def __init__(self) -> None:  # pylint: disable-msg=R0915
-        self.local = local()
+        self.pool = database.Pool(common.path.db())
         self.log = common.get_logger("GUI")
         self.lock: Final[RLock] = RLock()
         self.playlist: list[File] = []
         self.playidx: int = 0
         self.prog: Optional[Program] = None
+        self.scanner: Optional[scanner.Scanner] = None
+        # Picks up files as they are added, changed or removed. What it
+        # writes reaches the tree through the database's change events.
+        self.watcher = watcher.Watcher()
+        # The Programs whose Files are in the tree, least recently expanded
+        # first
+        self.loaded: OrderedDict[int, gtk.TreeRowReference] = OrderedDict()
+        # The rows of the Programs in the tree, by their IDs, so we can find
+        # them without walking the tree.
+        self.prog_rows: dict[int, gtk.TreeRowReference] = {}
+        # The rows of the Files of each loaded Program, by their IDs. The
+        # iters of a gtk.TreeStore stay valid as long as their row exists,
+        # and unlike TreeRowReferences, they cost nothing when other rows
+        # are added or removed. An iter whose row is gone must not be used,
+        # so rows are only ever removed together with their iter.
+        self.file_iters: dict[int, dict[int, gtk.TreeIter]] = {}
+        # Rows of Programs read by the loader thread, waiting to be added to
+        # the tree, tagged with the generation of the load they belong to.
+        # Reloading starts a new generation, so rows from an older load that
+        # are still in flight are dropped.
+        self.load_queue: queue.SimpleQueue[tuple[int, list[list]]] = \
+            queue.SimpleQueue()
+        self.load_gen: int = 0
+        # Rows of Files read by a loader thread, waiting to be added to the
+        # tree, along with their Program and the index in file_iters they
+        # belong in. Rows for an index that has been dropped since, because
+        # the Program has been unloaded or the tree reloaded, are discarded.
+        self.file_queue: queue.SimpleQueue[tuple[int, dict[int, gtk.TreeIter], list[list]]] = queue.SimpleQueue()  # noqa: E501 # pylint: disable-msg=C0301
+        self.scan_msg: str = ""
+        self.positions = position.PositionBuffer()
+        # Everything we write to the database is handed to a thread of its
+        # own, so the main loop never waits for a scan or an upgrade of the
+        # database to let go of the write lock. None tells it to stop.
+        self.write_queue: queue.SimpleQueue[Optional[Callable[[database.Database], Any]]] = queue.SimpleQueue()  # noqa: E501 # pylint: disable-msg=C0301
+        # Changes to the database, waiting for a thread of their own to look
+        # up the Programs and Files involved. None tells it to stop.
+        self.change_queue: queue.SimpleQueue[Optional[list[database.Change]]] = queue.SimpleQueue()  # noqa: E501 # pylint: disable-msg=C0301
 
         # Prepare gstreamer pipeline for audio playback
         self.state: PlayerState = PlayerState.STOPPED
@@ -108,6 +171,10 @@ class VoxUI:
         self.play_menu = gtk.Menu()
 
         self.fm_scan_item = gtk.MenuItem.new_with_mnemonic("_Scan folder")
+        self.fm_rescan_item = \
+            gtk.MenuItem.new_with_mnemonic("Rescan _all folders")
+        self.fm_cancel_item = gtk.MenuItem.new_with_mnemonic("_Cancel scan")
+        self.fm_cancel_item.set_sensitive(False)
         self.fm_reload_item = gtk.MenuItem.new_with_mnemonic("_Reload")
         self.fm_quit_item = gtk.MenuItem.new_with_mnemonic("_Quit")
 
@@ -126,6 +193,8 @@ class VoxUI:
         self.play_menu_item.set_submenu(self.play_menu)
 
         self.file_menu.add(self.fm_scan_item)
+        self.file_menu.add(self.fm_rescan_item)
+        self.file_menu.add(self.fm_cancel_item)
         self.file_menu.add(self.fm_reload_item)
         self.file_menu.add(self.fm_quit_item)
 
@@ -149,13 +218,13 @@ class VoxUI:
             int,  # Ord2
             str,  # Duration
             str,  # Cover
+            gobject.TYPE_INT64,  # Sort key
         )
         self.sort_store = gtk.TreeModelSort(model=self.prog_store)
-        self.sort_store.set_default_sort_func(cmp_iter)
+        self.sort_store.set_sort_column_id(SORT_KEY_COLUMN,
+                                           gtk.SortType.ASCENDING)
         self.prog_view = gtk.TreeView(model=self.sort_store)
 
-        # self.sort_store.set_sort_func(
-
         columns = [
             (0, "PID"),
             (1, "Program"),
@@ -218,6 +287,8 @@ class VoxUI:
         self.win.connect("destroy", self.__quit)
         self.fm_quit_item.connect("activate", self.__quit)
         self.fm_scan_item.connect("activate", self.scan_folder)
+        self.fm_rescan_item.connect("activate", self.rescan_all)
+        self.fm_cancel_item.connect("activate", self.cancel_scan)
         self.fm_reload_item.connect("activate", self.__refresh)
         self.am_prog_add_item.connect("activate", self.create_program)
         self.pm_playpause_item.connect("activate", self.toggle_play_pause)
@@ -232,20 +303,23 @@ class VoxUI:
                                                  self.handle_seek)
         self.prog_view.connect("button-press-event",
                                self.__handle_prog_view_click)
+        self.prog_view.connect("test-expand-row", self.__expand_program)
+        database.subscribe(common.path.db(), self.__db_changed)
 
         self.loop_thr = Thread(target=self.__gst_loop)
         self.loop_thr.daemon = True
         self.loop_thr.start()
+        self.write_thr = Thread(target=self.__write_worker,
+                                name="write",
+                                daemon=True)
+        self.write_thr.start()
+        self.change_thr = Thread(target=self.__change_worker,
+                                 name="changes",
+                                 daemon=True)
+        self.change_thr.start()
         glib.timeout_add(1000, self.handle_tick)
         self.win.show_all()
-
-    def __get_db(self) -> database.Database:
-        """Return a database handle that's local to the current thread."""
-        try:
-            return self.local.db
-        except AttributeError:
-            self.local.db = database.Database(common.path.db())
-            return self.local.db
+        self.watcher.start()
 
     def __gst_loop(self) -> None:
         """Run the GStreamer mainloop"""
@@ -258,10 +332,59 @@ class VoxUI:
         finally:
             self.log.info("GStreamer loop has finished.")
 
+    def __write(self, job: Callable[[database.Database], Any]) -> None:
+        """Have job write to the database in the background.
+
+        Jobs run one after the other, in the order they were handed in, each
+        in a transaction of its own.
+        """
+        self.write_queue.put(job)
+
+    def __write_wait(self) -> None:
+        """Wait until the jobs handed to __write so far have been
+        committed.
+        """
+        done: Final[Event] = Event()
+        self.__write(lambda _db: done.set())
+        done.wait()
+
+    def __write_worker(self) -> None:
+        """Run the jobs handed to __write, and upgrade the database a little
+        at a time while there are none.
+        """
+        backfill: bool = True
+        while True:
+            try:
+                job = self.write_queue.get(
+                    timeout=BACKFILL_INTERVAL if backfill else None)
+            except queue.Empty:
+                try:
+                    with self.pool.writer() as db:
+                        backfill = not db.backfill()
+                except sqlite3.Error as e:
+                    self.log.error("Cannot upgrade database: %s", e)
+                    backfill = False
+                continue
+            if job is None:
+                return
+            try:
+                with self.pool.writer() as db, db:
+                    job(db)
+            except sqlite3.Error as e:
+                self.log.error("Cannot write to database: %s", e)
+
     def __quit(self, *_ignore: Any) -> None:
-        self.win.destroy()
+        database.unsubscribe(common.path.db(), self.__db_changed)
+        self.watcher.stop()
         self.stop()
+        # Wait for the last playback position to be saved.
+        self.write_queue.put(None)
+        self.write_thr.join()
+        self.change_queue.put(None)
+        self.change_thr.join()
+        self.win.destroy()
         self.gstloop.quit()
+        self.pool.close()
         gtk.main_quit()
 
     def __handle_prog_view_click(self, _widget, evt: gdk.Event) -> None:
@@ -300,8 +423,9 @@ class VoxUI:
         menu.popup_at_pointer(evt)
 
     def __mk_context_menu_file(self, fiter: gtk.TreeIter, file_id: int) -> Optional[gtk.Menu]:  # noqa: E501 # pylint: disable-msg=C0301
-        db = self.__get_db()
-        file: Optional[File] = db.file_get_by_id(file_id)
+        with self.pool.reader() as db:
+            file: Optional[File] = db.file_get_by_id(file_id)
+            progs: list[Program] = db.program_get_all()
 
         if file is not None:
             self.log.debug("Make context menu for %s", file.display_title())
@@ -309,7 +433,6 @@ class VoxUI:
             self.log.error("File %d was not found in database", file_id)
             return None
 
-        progs: list[Program] = db.program_get_all()
         menu: gtk.Menu = gtk.Menu()
         prog_menu: gtk.Menu = gtk.Menu()
         play_item = gtk.MenuItem.new_with_mnemonic("_Play")
@@ -338,8 +461,8 @@ class VoxUI:
         return menu
 
     def __mk_context_menu_program(self, piter: gtk.TreeIter, prog_id: int) -> Optional[gtk.Menu]:  # noqa: E501 # pylint: disable-msg=C0301,R1711
-        db = self.__get_db()
-        prog: Optional[Program] = db.program_get_by_id(prog_id)
+        with self.pool.reader() as db:
+            prog: Optional[Program] = db.program_get_by_id(prog_id)
         if prog is None:
             self.log.error("Did not find Program %d in database", prog_id)
             return None
@@ -380,7 +503,7 @@ class VoxUI:
         return handler
 
     # pylint: disable-msg=R0914
-    def prog_edit_handler(self, _ignore: Any, prog: Program, piter: gtk.TreeIter) -> None:  # noqa: E501 pylint: disable-msg=C0301
+    def prog_edit_handler(self, _ignore: Any, prog: Program, _piter: gtk.TreeIter) -> None:  # noqa: E501 pylint: disable-msg=C0301
         """Present a Dialog to edit the Program."""
         self.log.debug("Edit Program %s: IMPLEMENTME",
                        prog.title)
@@ -436,18 +559,12 @@ class VoxUI:
         if title == prog.title and author == prog.creator and url == prog.url:
             return
 
-        db = self.__get_db()
-
-        with db:
-            cols: list[int] = []
-            vals: list[str] = []
+        def update(db: database.Database) -> None:
             if title != prog.title:
                 self.log.debug("Update title '%s' -> '%s'",
                                prog.title,
                                title)
                 db.program_set_title(prog, title)
-                cols.append(1)
-                vals.append(title)
             if author != prog.creator:
                 self.log.debug("Update author: '%s' -> '%s'",
                                prog.creator,
@@ -459,47 +576,337 @@ class VoxUI:
                                url)
                 db.program_set_url(prog, url)
 
-            if len(cols) > 0:
-                self.log.debug("Update columns: %r", cols)
-                assert len(cols) == len(vals)
-                self.prog_store.set(piter, cols, vals)
+        # The tree is updated once the changes have been committed.
+        self.__write(update)
 
     def __refresh(self, *_ignore: Any) -> None:
         """Wipe and recreate the data model"""
         self.prog_store.clear()
+        self.loaded.clear()
+        self.prog_rows.clear()
+        self.file_iters.clear()
         self.__load_data()
 
     def __load_data(self) -> None:
-        """Load programs and files from the database, display them."""
-        # Fill the model!
-        db = self.__get_db()
-        programs: list[Program] = db.program_get_all()
-
-        for p in programs:
-            piter = self.prog_store.append(None)
-            self.prog_store[piter][0] = p.program_id
-            self.prog_store[piter][1] = p.title
-            files = db.file_get_by_program(p.program_id)
-            for f in files:
-                citer = self.prog_store.append(piter)
-                self.prog_store[citer][0] = -p.program_id
-                self.prog_store[citer][2] = f.file_id
-                self.prog_store[citer][3] = f.display_title()
-                self.prog_store[citer][4] = f.ord1
-                self.prog_store[citer][5] = f.ord2
-
-        no_prog: list[File] = db.file_get_no_program()
-        if len(no_prog) > 0:
-            piter = self.prog_store.append(None)
-            self.prog_store[piter][0] = 0
-            self.prog_store[piter][1] = "None"
-            for f in no_prog:
-                citer = self.prog_store.append(piter)
-                self.prog_store[citer][0] = -1
-                self.prog_store[citer][2] = f.file_id
-                self.prog_store[citer][3] = f.display_title()
-                self.prog_store[citer][4] = f.ord1
-                self.prog_store[citer][5] = f.ord2
+        """Load the Programs from the database in the background, display
+        them as they arrive.
+
+        Their Files are only loaded once a Program is expanded, until then
+        each Program gets a placeholder, so it can be expanded at all.
+        """
+        self.load_gen += 1
+        thr: Thread = Thread(target=self.__load_worker,
+                             args=(self.load_gen, ),
+                             name="load",
+                             daemon=True)
+        thr.start()
+
+    def __load_worker(self, gen: int) -> None:
+        """Read the Programs and pass their rows to the main loop in chunks.
+
+        This method is meant to be called in a background thread, it must
+        not touch any widgets.
+        """
+        rows: list[list] = []
+        try:
+            with self.pool.reader() as db:
+                if len(db.file_get_no_program_page(limit=1)) > 0:
+                    rows.append(program_row(None))
+                for p in db.program_iter_all():
+                    rows.append(program_row(p))
+                    if len(rows) >= LOAD_CHUNK:
+                        self.load_queue.put((gen, rows))
+                        glib.idle_add(self.__add_loaded_rows)
+                        rows = []
+        except sqlite3.Error as e:
+            self.log.error("Cannot load Programs: %s", e)
+        if len(rows) > 0:
+            self.load_queue.put((gen, rows))
+            glib.idle_add(self.__add_loaded_rows)
+
+    def __add_loaded_rows(self) -> bool:
+        """Add the rows the loader thread has read so far to the tree.
+
+        We stop after LOAD_BUDGET seconds and continue the next time the
+        main loop is idle, so playback controls stay responsive.
+        """
+        deadline: Final[float] = time.monotonic() + LOAD_BUDGET
+        while time.monotonic() < deadline:
+            try:
+                gen, rows = self.load_queue.get_nowait()
+            except queue.Empty:
+                return False
+            if gen != self.load_gen:
+                continue
+            for row in rows:
+                # A change event may have beaten us to it.
+                if self.__find_program(row[0]) is None:
+                    self.__add_program_row(row)
+        return True
+
+    def __expand_program(self, _view: gtk.TreeView, siter: gtk.TreeIter, _path: gtk.TreePath) -> bool:  # noqa: E501 # pylint: disable-msg=C0301
+        """Load the Files of a Program that is about to be expanded in the
+        background. The placeholder stays until they arrive.
+        """
+        piter: gtk.TreeIter = self.sort_store.convert_iter_to_child_iter(siter)  # noqa: E501 # pylint: disable-msg=C0301
+        pid: int = self.prog_store[piter][0]
+        if pid < 0:
+            return False
+        if pid in self.loaded:
+            self.loaded.move_to_end(pid)
+            return False
+
+        index: dict[int, gtk.TreeIter] = {}
+        self.file_iters[pid] = index
+        self.loaded[pid] = gtk.TreeRowReference.new(
+            self.prog_store,
+            self.prog_store.get_path(piter))
+        thr: Thread = Thread(target=self.__load_files_worker,
+                             args=(pid, index),
+                             name="load-files",
+                             daemon=True)
+        thr.start()
+        self.__unload_programs()
+        return False
+
+    def __load_files_worker(self, pid: int, index: dict[int, gtk.TreeIter]) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Read the Files of a Program and pass their rows to the main loop
+        in chunks.
+
+        This method is meant to be called in a background thread, it must
+        not touch any widgets, nor index.
+        """
+        rows: list[list] = []
+        try:
+            with self.pool.reader() as db:
+                files = db.file_iter_no_program() if pid == 0 \
+                    else db.file_iter_by_program(pid)
+                for f in files:
+                    rows.append(file_row(f))
+                    if len(rows) >= LOAD_CHUNK:
+                        self.file_queue.put((pid, index, rows))
+                        glib.idle_add(self.__add_loaded_files)
+                        rows = []
+        except sqlite3.Error as e:
+            self.log.error("Cannot load Files of Program %d: %s", pid, e)
+        # The last chunk is handed over even if it is empty, so the
+        # placeholder of a Program without Files goes away, too.
+        self.file_queue.put((pid, index, rows))
+        glib.idle_add(self.__add_loaded_files)
+
+    def __add_loaded_files(self) -> bool:
+        """Add the rows of Files the loader threads have read so far to the
+        tree, within the same budget as __add_loaded_rows.
+        """
+        deadline: Final[float] = time.monotonic() + LOAD_BUDGET
+        while time.monotonic() < deadline:
+            try:
+                pid, index, rows = self.file_queue.get_nowait()
+            except queue.Empty:
+                return False
+            if self.file_iters.get(pid) is not index:
+                continue
+            piter = self.__find_program(pid)
+            if piter is None:
+                continue
+            citer = self.prog_store.iter_children(piter)
+            if citer is not None and self.prog_store[citer][2] == 0:
+                self.prog_store.remove(citer)
+            for row in rows:
+                # A change event may have beaten us to it.
+                if row[2] not in index:
+                    self.__add_file_row(piter, row)
+        return True
+
+    def __unload_programs(self) -> None:
+        """Drop the Files of the least recently expanded Programs, unless
+        they are still expanded.
+        """
+        excess: int = len(self.loaded) - LOADED_PROGRAMS
+        # The last one is about to be expanded.
+        for pid, ref in list(self.loaded.items())[:-1]:
+            if excess <= 0:
+                break
+            if not ref.valid():
+                del self.loaded[pid]
+                self.file_iters.pop(pid, None)
+                excess -= 1
+                continue
+            path: gtk.TreePath = ref.get_path()
+            spath = self.sort_store.convert_child_path_to_path(path)
+            if spath is not None and self.prog_view.row_expanded(spath):
+                continue
+            piter: gtk.TreeIter = self.prog_store.get_iter(path)
+            self.__remove_file_rows(piter)
+            self.prog_store.append(piter, placeholder_row(pid))
+            del self.loaded[pid]
+            excess -= 1
+
+    def __db_changed(self, changes: list[database.Change]) -> None:
+        """Pass changes to the database on to the change worker.
+
+        This is called by whichever thread committed them, e.g. a Scanner
+        running in the background.
+        """
+        self.change_queue.put(changes)
+
+    def __change_worker(self) -> None:
+        """Look up the Programs and Files that have changed and pass them on
+        to the main loop.
+
+        This method is meant to be called in a background thread, it must
+        not touch any widgets.
+        """
+        while True:
+            changes = self.change_queue.get()
+            if changes is None:
+                return
+            # Take whatever else has piled up in the meantime along.
+            batch: list[database.Change] = list(changes)
+            stop: bool = False
+            while not stop:
+                try:
+                    changes = self.change_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if changes is None:
+                    stop = True
+                else:
+                    batch.extend(changes)
+
+            # Only the last change to each Program or File matters, and we
+            # look up their current state anyway.
+            progs: dict[int, bool] = {}
+            files: dict[int, bool] = {}
+            for c in batch:
+                match c.kind:
+                    case database.ChangeKind.ProgramAdd | database.ChangeKind.ProgramUpdate:  # noqa: E501 # pylint: disable-msg=C0301
+                        progs[c.obj_id] = True
+                    case database.ChangeKind.ProgramDel:
+                        progs[c.obj_id] = False
+                    case database.ChangeKind.FileAdd | database.ChangeKind.FileUpdate:  # noqa: E501 # pylint: disable-msg=C0301
+                        files[c.obj_id] = True
+                    case database.ChangeKind.FileDel:
+                        files[c.obj_id] = False
+
+            try:
+                with self.pool.reader() as db:
+                    found_progs: dict[int, Program] = {
+                        p.program_id: p for p in db.program_get_by_ids(
+                            [pid for pid, exists in progs.items() if exists])}
+                    found_files: dict[int, File] = {
+                        f.file_id: f for f in db.file_get_by_ids(
+                            [fid for fid, exists in files.items() if exists])}
+            except sqlite3.Error as e:
+                self.log.error("Cannot look up %d changes: %s",
+                               len(batch),
+                               e)
+            else:
+                glib.idle_add(self.__apply_changes,
+                              {pid: found_progs.get(pid) for pid in progs},
+                              {fid: found_files.get(fid) for fid in files})
+            if stop:
+                return
+
+    def __apply_changes(self, progs: dict[int, Optional[Program]], files: dict[int, Optional[File]]) -> bool:  # noqa: E501 # pylint: disable-msg=C0301
+        """Update the rows of the Programs and Files that have changed,
+        leave the rest of the tree alone.
+
+        progs and files hold the current state of each, None for the ones
+        that are gone.
+        """
+        for pid, prog in progs.items():
+            self.__update_program_row(pid, prog)
+        for fid, f in files.items():
+            self.__update_file_row(fid, f)
+        return False
+
+    def __update_program_row(self, pid: int, prog: Optional[Program]) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Add, update or remove the row of a Program."""
+        piter = self.__find_program(pid)
+        if prog is None:
+            if piter is not None:
+                self.__remove_file_rows(piter)
+                self.prog_store.remove(piter)
+            self.loaded.pop(pid, None)
+            self.prog_rows.pop(pid, None)
+        elif piter is None:
+            self.__add_program_row(program_row(prog))
+        else:
+            self.prog_store.set(piter, [1], [prog.title])
+
+    def __update_file_row(self, fid: int, f: Optional[File]) -> None:
+        """Add, update, move or remove the row of a File.
+
+        Files of Programs that have not been loaded are left out, they show
+        up once their Program is expanded.
+        """
+        found = self.__find_file(fid)
+        pid: Final[int] = -1 if f is None else f.program_id or 0
+        if found is not None:
+            old_pid, fiter = found
+            if f is not None and old_pid == pid:
+                row: Final[list] = file_row(f)
+                self.prog_store.set(fiter, list(range(len(row))), row)
+                return
+            del self.file_iters[old_pid][fid]
+            self.prog_store.remove(fiter)
+        if f is None:
+            return
+
+        piter = self.__find_program(pid)
+        if piter is None and pid == 0:
+            # The first File without a Program
+            self.__add_program_row(program_row(None))
+        elif piter is not None and pid in self.file_iters:
+            self.__add_file_row(piter, file_row(f))
+
+    def __add_program_row(self, row: list) -> None:
+        """Add the row of a Program to the tree, along with the placeholder
+        for its Files.
+        """
+        piter = self.prog_store.append(None, row)
+        self.prog_store.append(piter, placeholder_row(row[0]))
+        self.prog_rows[row[0]] = gtk.TreeRowReference.new(
+            self.prog_store,
+            self.prog_store.get_path(piter))
+
+    def __add_file_row(self, piter: gtk.TreeIter, row: list) -> None:
+        """Add the row of a File below the row of its loaded Program."""
+        fiter = self.prog_store.append(piter, row)
+        self.file_iters[self.prog_store[piter][0]][row[2]] = fiter
+
+    def __remove_file_rows(self, piter: gtk.TreeIter) -> None:
+        """Remove all rows below the row of a Program."""
+        self.file_iters.pop(self.prog_store[piter][0], None)
+        while (citer := self.prog_store.iter_children(piter)) is not None:
+            self.prog_store.remove(citer)
+
+    def __find_program(self, pid: int) -> Optional[gtk.TreeIter]:
+        """Return the row of a Program, if it is in the tree."""
+        return self.__find_row(self.prog_rows, pid)
+
+    def __find_file(self, fid: int) -> Optional[tuple[int, gtk.TreeIter]]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Return the Program and the row of a File, if it is in the tree.
+
+        Only the Files of loaded Programs are, and there are only ever a few
+        of those to look through.
+        """
+        for pid, index in self.file_iters.items():
+            fiter = index.get(fid)
+            if fiter is not None:
+                return pid, fiter
+        return None
+
+    def __find_row(self, rows: dict[int, gtk.TreeRowReference], oid: int) -> Optional[gtk.TreeIter]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Look up the row of a Program or File by its ID."""
+        ref = rows.get(oid)
+        if ref is None:
+            return None
+        if not ref.valid():
+            del rows[oid]
+            return None
+        return self.prog_store.get_iter(ref.get_path())
 
     def scan_folder(self, *_ignored) -> None:
         """Prompt the user for a folder to scan, then scan it."""
@@ -527,19 +934,62 @@ class VoxUI:
         finally:
             dlg.destroy()
 
-    def __scan_worker(self, path: str) -> None:
-        """Scan a single directory tree.
+    def rescan_all(self, *_ignored) -> None:
+        """Look at every file in every Folder again.
+
+        Regular scans skip directories that have not been modified, so they
+        miss files that have been changed in place, e.g. by a tag editor.
+        """
+        self.log.info("Rescan all folders")
+        thr: Thread = Thread(target=self.__scan_worker, args=(None, ))
+        thr.start()
+
+    def cancel_scan(self, *_ignored) -> None:
+        """Cancel the running scan, if any."""
+        with self.lock:
+            if self.scanner is not None:
+                self.log.info("Cancel scan")
+                self.scanner.cancel()
+
+    def __scan_worker(self, path: Optional[str]) -> None:
+        """Scan a single directory tree, or all Folders in full if path is
+        None.
 
         This method is meant to be called in a background thread.
         """
-        sc = scanner.Scanner()
+        sc = scanner.Scanner(os.cpu_count() or 1)
+        with self.lock:
+            self.scanner = sc
+        glib.idle_add(self.fm_cancel_item.set_sensitive, True)
 
         try:
             self.log.debug("Start scanning %s", path)
-            sc.scan(path)
+            if path is None:
+                sc.refresh(full=True, progress=self.__scan_progress)
+            else:
+                sc.scan(path, progress=self.__scan_progress)
             # files = sc.db.file_get_by_folder(folder)  # noqa: F841
         finally:
             self.log.debug("Finished scanning %s", path)
+            with self.lock:
+                self.scanner = None
+            glib.idle_add(self.fm_cancel_item.set_sensitive, False)
+
+    def __scan_progress(self, progress: scanner.ScanProgress) -> None:
+        """Pass the Scanner's progress to the main thread.
+
+        The Scanner calls this from the scanning thread.
+        """
+        msg: Final[str] = "" if progress.done else str(progress)
+        if progress.done:
+            self.log.info("%s", progress)
+        glib.idle_add(self.__show_scan_progress, msg)
+
+    def __show_scan_progress(self, msg: str) -> bool:
+        """Display the Scanner's progress in the status line."""
+        self.scan_msg = msg
+        self.format_status_line()
+        return False
 
     def display_msg(self, msg: str) -> None:
         """Display a message in a dialog."""
@@ -580,7 +1030,6 @@ class VoxUI:
         # self.log.debug("Got Message from Player: %s", mtype)
         match mtype:
             case gst.MessageType.EOS:
-                db = self.__get_db()
                 with self.lock:
                     if self.prog is None:
                         return
@@ -588,16 +1037,13 @@ class VoxUI:
                         old = self.playlist[self.playidx]
                         self.playidx += 1
                         fid: Final[int] = self.playlist[self.playidx].file_id
-                        with db:
-                            db.file_set_position(old, 0)
-                            db.program_set_cur_file(self.prog,
-                                                    fid)
+                        self.positions.update(old, 0)
+                        self.__write(self.__mk_set_cur_file(self.prog, fid))
                         self.play_file(self.playlist[self.playidx])
                     else:
                         f = self.playlist[self.playidx]
-                        with db:
-                            db.file_set_position(f, 0)
-                            db.program_set_cur_file(self.prog, -1)
+                        self.positions.update(f, 0)
+                        self.__write(self.__mk_set_cur_file(self.prog, -1))
                         self.prog = None
                         self.playlist = []
                         self.playidx = 0
@@ -637,11 +1083,11 @@ class VoxUI:
                 self.seek.handler_block(self.seek_handler_id)
                 self.seek.set_value(float(position) / gst.SECOND)
                 self.seek.handler_unblock(self.seek_handler_id)
-                db = self.__get_db()
                 f: File = self.playlist[self.playidx]
                 pos: int = int(position / gst.SECOND)
-                with db:
-                    db.file_set_position(f, pos)
+                self.positions.update(f, pos)
+                if self.positions.due():
+                    self.__write(self.positions.flush)
         finally:
             return True  # noqa: B012 pylint: disable-msg=W0134,W0150
 
@@ -669,7 +1115,8 @@ class VoxUI:
         """Update the status line.
 
         If playing or paused, display the program title, the track number
-        and the title of the current track.
+        and the title of the current track. While a scan is running, its
+        progress is displayed, too.
         """
         with self.lock:
             if txt is None:
@@ -682,9 +1129,13 @@ class VoxUI:
                             self.playlist[self.playidx].display_title()
                         status: Final[str] = \
                             f"{ptitle} - {pidx:4d} - {ftitle}"
-                        self.slabel.set_label(status)
+                        if self.scan_msg != "":
+                            self.slabel.set_label(
+                                f"{status} | {self.scan_msg}")
+                        else:
+                            self.slabel.set_label(status)
                     case _:
-                        self.slabel.set_label("")
+                        self.slabel.set_label(self.scan_msg)
             else:
                 self.slabel.set_label(txt)
 
@@ -696,6 +1147,7 @@ class VoxUI:
                     self.player.set_state(gst.State.PAUSED)
                     self.state = PlayerState.PAUSED
                     self.log.debug("Playback is paused now")
+                    self.save_position()
                 case PlayerState.PAUSED:
                     self.player.set_state(gst.State.PLAYING)
                     self.state = PlayerState.PLAYING
@@ -707,8 +1159,12 @@ class VoxUI:
 
     def play_program(self, prog: Program) -> None:
         """Start playing a Program"""
-        db = self.__get_db()
-        files: list[File] = db.file_get_by_program(prog.program_id)
+        # The Files we load have to include the positions we have just
+        # saved, so wait for them to be committed.
+        self.save_position()
+        self.__write_wait()
+        with self.pool.reader() as db:
+            files: list[File] = db.file_get_by_program(prog.program_id)
         if len(files) == 0:
             self.display_msg(f"Program {prog.title} has 0 files")
             return
@@ -722,7 +1178,7 @@ class VoxUI:
             if prog.current_file < 1:
                 self.log.debug("Play Program %s from the beginning",
                                prog.title)
-                db.program_set_cur_file(prog, files[0].file_id)
+                self.__write(self.__mk_set_cur_file(prog, files[0].file_id))
                 self.playidx = 0
             else:
                 self.log.debug("Current file is %d, looking for index",
@@ -754,7 +1210,6 @@ class VoxUI:
     def play_previous(self, _ignore) -> None:
         """Skip backwards one track in the playlist."""
         self.log.debug("Skipping backwards one title.")
-        db = self.__get_db()
         with self.lock:
             if len(self.playlist) == 0:
                 self.log.info("Playlist is empty.")
@@ -765,16 +1220,17 @@ class VoxUI:
             if self.prog is None:
                 self.log.info("No Program is currently playing.")
                 return
+            self.save_position()
             self.playidx -= 1
-        db.program_set_cur_file(self.prog,
-                                self.playlist[self.playidx].file_id)
+            self.__write(self.__mk_set_cur_file(
+                self.prog,
+                self.playlist[self.playidx].file_id))
         self.play_file(self.playlist[self.playidx])
         self.format_status_line()
 
     def play_next(self, _ignore) -> None:
         """Skip forward one track in the playlist."""
         self.log.debug("Skipt to next track")
-        db = self.__get_db()
         with self.lock:
             if len(self.playlist) == 0:
                 self.log.info("Playlist is empty.")
@@ -785,16 +1241,17 @@ class VoxUI:
             if self.prog is None:
                 self.log.info("No Program is currently playing.")
                 return
+            self.save_position()
             self.playidx += 1
-        db.program_set_cur_file(self.prog,
-                                self.playlist[self.playidx].file_id)
+            self.__write(self.__mk_set_cur_file(
+                self.prog,
+                self.playlist[self.playidx].file_id))
         self.play_file(self.playlist[self.playidx])
         self.format_status_line()
 
     def play_file(self, file: File) -> None:
         """Play a single file."""
         with self.lock:
-            # db = self.__get_db()
             self.log.debug("Play file %s",
                            file.display_title())
             uri: Final[str] = f"file://{file.path}"
@@ -812,6 +1269,7 @@ class VoxUI:
     def stop(self, *_ignore) -> None:
         """Stop the player (if it's playing)"""
         with self.lock:
+            self.save_position()
             self.state = PlayerState.STOPPED
             self.player.set_state(gst.State.NULL)
             self.seek.handler_block(self.seek_handler_id)
@@ -820,6 +1278,29 @@ class VoxUI:
             self.seek.handler_unblock(self.seek_handler_id)
             self.format_status_line("")
 
+    def save_position(self) -> None:
+        """Record the position of the current track and write all pending
+        positions to the database.
+        """
+        with self.lock:
+            if self.state in (PlayerState.PLAYING, PlayerState.PAUSED) and \
+                    self.playidx < len(self.playlist):
+                success, pos = self.player.query_position(gst.Format.TIME)
+                if success:
+                    self.positions.update(self.playlist[self.playidx],
+                                          int(pos / gst.SECOND))
+        self.__write(self.positions.flush)
+
+    def __mk_set_cur_file(self, prog: Program, fid: int) -> Callable[[database.Database], None]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Return a job for __write that saves the pending playback positions
+        and the File a Program is at.
+        """
+
+        def job(db: database.Database) -> None:
+            self.positions.flush(db)
+            db.program_set_cur_file(prog, fid)
+        return job
+
     def __resume_position(self, f: File) -> bool:
         """Seek to the position we last stopped playback at."""
         self.log.debug("Resume playback at %d", f.position)
@@ -874,74 +1355,59 @@ class VoxUI:
                 creator=creator,
                 url=url,
             )
-            db = self.__get_db()
-            with db:
-                db.program_add(prog)
-
-            # Now we need to add the new Program to the TreeStore.
-            piter = self.prog_store.append(None)
-            self.prog_store[piter][0] = prog.program_id
-            self.prog_store[piter][1] = prog.title
+            # The Program shows up in the tree once it has been committed.
+            self.__write(lambda db: db.program_add(prog))
         finally:
             dlg.destroy()
 
-    def file_set_program(self, fiter: gtk.TreeIter, fid: int, pid: int) -> None:  # noqa: E501
+    def file_set_program(self, _fiter: gtk.TreeIter, fid: int, pid: int) -> None:  # noqa: E501
         """Set the Program a given File belongs to"""
         self.log.debug("Set Program of File %d to %d",
                        fid,
                        pid)
-        db = self.__get_db()
-        with db:
+
+        def job(db: database.Database) -> None:
             f = db.file_get_by_id(fid)
             if f is not None:
                 db.file_set_program(f, pid)
             else:
                 self.log.debug("File %d does not exist in database", fid)
-                return
-            # Now we need to find and update/move the entry in our TreeStore.
-            self.prog_store.remove(fiter)
-            piter: gtk.TreeIter = self.prog_store.get_iter_first()
 
-            while (piter is not None) and (self.prog_store[piter][0] != pid):
-                piter = self.prog_store.iter_next(piter)
+        # The File is moved in the tree once the change has been committed.
+        self.__write(job)
 
-            if piter is None:
-                self.log.debug("Did not find Program %d in TreeStore!", pid)
-                return
 
-            fiter = self.prog_store.append(piter)
-            self.prog_store[fiter][0] = -pid
-            self.prog_store[fiter][2] = f.file_id
-            self.prog_store[fiter][3] = f.display_title()
-            self.prog_store[fiter][4] = f.ord1
-            self.prog_store[fiter][5] = f.ord2
-
-
-def cmp_iter(m: gtk.TreeModel, a, b: gtk.TreeIter, _) -> int:
-    """Comparison function for sorting."""
-    v1 = m.get(a, 0, 1, 2, 3, 4, 5, 6)
-    v2 = m.get(b, 0, 1, 2, 3, 4, 5, 6)
-    res: int = 0
-    match (sign(v1[0]), sign(v2[0])):
-        case (1, 1):
-            res = cmp(v1[0], v2[0])
-        case (-1, -1):
-            if v1[0] == v2[0]:
-                match cmp(v1[4], v2[4]):
-                    case -1:
-                        res = -1
-                    case 1:
-                        res = 1
-                    case 0:
-                        res = cmp(v1[5], v2[5])
-            else:
-                res = cmp(v2[0], v1[0])
-        case (1, -1):
-            res = cmp(v1[0], -v2[0])
-        case (-1, 1):
-            res = cmp(-v1[0], v2[0])
+def program_row(prog: Optional[Program]) -> list:
+    """Return the row for a Program in the program tree.
+
+    None stands for the Files that belong to no Program.
+    """
+    if prog is None:
+        return [0, "None", 0, "", 0, 0, "", "", 0]
+    return [prog.program_id, prog.title, 0, "", 0, 0, "", "",
+            prog.program_id]
+
+
+def file_row(f: File) -> list:
+    """Return the row for a File in the program tree."""
+    return [-(f.program_id or 1), "", f.file_id, f.display_title(),
+            f.ord1, f.ord2, "", "", file_sort_key(f.ord1, f.ord2)]
+
+
+def placeholder_row(pid: int) -> list:
+    """Return the row standing in for the Files of a Program that have not
+    been loaded yet.
+    """
+    return [-(pid or 1), "", 0, "...", 0, 0, "", "", 0]
+
 
-    return res
+def file_sort_key(ord1: int, ord2: int) -> int:
+    """Pack the disc and track number of a File into one 64 bit integer
+    that sorts the same way as the pair.
+    """
+    ord1 = min(max(ord1, 0), 0x7fffffff)
+    ord2 = min(max(ord2, 0), 0xffffffff)
+    return (ord1 << 32) | ord2
 
 
 def main() -> None:
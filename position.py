@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 17:24:16 krylon>
+#
+# /data/code/python/vox/position.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.position
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import logging
+import sqlite3
+import time
+from threading import Lock
+from typing import Final
+
+from vox import common
+from vox.data import File
+from vox.database import Database
+
+# How many seconds of listening progress we are willing to lose at most
+FLUSH_INTERVAL: Final[float] = 15.0
+
+
+class PositionBuffer:
+    """PositionBuffer keeps the latest playback position of each File in
+    memory and writes them to the database in one go, every interval seconds
+    at most, or whenever flush() is called.
+
+    The player updates the position every second. Writing each of those
+    updates in a transaction of its own means a write to the WAL and an fsync
+    per second of playback, so we would rather lose a few seconds of progress
+    if we crash.
+    """
+
+    __slots__ = [
+        "log",
+        "lock",
+        "interval",
+        "pending",
+        "flushed",
+    ]
+
+    log: logging.Logger
+    lock: Lock
+    interval: float
+    # The latest position of each File, and when it was recorded, by ID
+    pending: dict[int, tuple[File, int, int]]
+    flushed: float
+
+    def __init__(self, interval: float = FLUSH_INTERVAL) -> None:
+        self.log = common.get_logger("position")
+        self.lock = Lock()
+        self.interval = interval
+        self.pending = {}
+        self.flushed = time.monotonic()
+
+    def update(self, f: File, pos: int) -> None:
+        """Record the playback position of a File."""
+        with self.lock:
+            self.pending[f.file_id] = (f, pos, int(time.time()))
+            f.position = pos
+
+    def due(self) -> bool:
+        """Return True if interval seconds have passed since the last time
+        we wrote the pending positions.
+        """
+        return time.monotonic() - self.flushed >= self.interval
+
+    def maybe_flush(self, db: Database) -> None:
+        """Write the pending positions, if interval seconds have passed
+        since the last time we did.
+        """
+        if self.due():
+            self.flush(db)
+
+    def flush(self, db: Database) -> None:
+        """Write all pending positions to the database in one transaction."""
+        with self.lock:
+            self.flushed = time.monotonic()
+            if len(self.pending) == 0:
+                return
+            positions: Final[list[tuple[File, int, int]]] = \
+                list(self.pending.values())
+            self.pending = {}
+
+        try:
+            db.file_set_position_many(positions)
+        except sqlite3.Error as e:
+            self.log.error("Cannot save playback position of %d files: %s",
+                           len(positions),
+                           e)
+            # Try again next time, unless the position has changed since.
+            with self.lock:
+                for f, pos, stamp in positions:
+                    self.pending.setdefault(f.file_id, (f, pos, stamp))
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
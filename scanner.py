@@ -17,122 +17,897 @@ vox.scanner
 """
 
 
+import hashlib
 import logging
+import multiprocessing
 import os
 import os.path
+import queue
 import re
+import sqlite3
+import time
 import traceback
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
-from typing import Final
+from threading import Event, Thread
+from typing import Callable, Final, Iterable, Iterator, Optional
 
 import mutagen
 
-from vox import common, database
-from vox.data import File, Folder, Program
+from vox import common, database, tagcache, tagreader
+from vox.data import File, Fingerprint, Folder, Program
 
 AUDIO_PAT: Final[re.Pattern] = \
     re.compile("[.](?:mp3|og[ga]|opus|m4b|aac|flac)", re.I)
 DISC_NO_PAT: Final[re.Pattern] = re.compile("(\\d+)\\s*/\\s*(\\d+)")
+QUEUE_SIZE: Final[int] = 256
+# How many files per worker process may be in flight at once
+POOL_DEPTH: Final[int] = 4
+# How many new files to collect before adding them to the database in bulk
+FLUSH_SIZE: Final[int] = 1000
+# How many files to write in a single transaction at most, and how many
+# seconds to wait at most before writing the ones we have. Other writers,
+# like the player saving the playback position, only have to wait for one
+# of these transactions, not for the whole scan.
+COMMIT_SIZE: Final[int] = 1000
+COMMIT_INTERVAL: Final[float] = 1.0
+# How many bytes from the beginning and the end of a file go into its digest
+DIGEST_SPAN: Final[int] = 16 * 1024
+# The least number of seconds between two progress reports
+PROGRESS_INTERVAL: Final[float] = 0.25
+
+# A file found by the walker: its path, its Fingerprint, and the ID of its
+# row in the database, or 0 if it is new.
+ScanItem = tuple[str, Fingerprint, int]
+# A ScanItem along with its tags and content digest
+TagResult = tuple[ScanItem, dict[str, str], str]
+# The Files in the database, grouped by directory, mapping each path to the
+# File's ID, Fingerprint and content digest.
+KnownFiles = dict[str, dict[str, tuple[int, Fingerprint, str]]]
+
+
+class ScanProgress:
+    """ScanProgress tells how far a scan has come.
+
+    The counters are updated by the stages of the scan as they go along, so
+    a ScanProgress should be treated as read-only by anyone else. Every
+    counter is only ever written to by a single thread.
+    """
+
+    __slots__ = [
+        "root",
+        "started",
+        "dirs",
+        "files_seen",
+        "files_found",
+        "files_read",
+        "files_added",
+        "errors",
+        "walking",
+        "done",
+        "cancelled",
+    ]
+
+    root: str
+    started: float
+    # How many directories we have visited
+    dirs: int
+    # How many audio files we have come across
+    files_seen: int
+    # How many of those are new or have changed, so we have to read them
+    files_found: int
+    # How many of those we have read, or found in the tag cache
+    files_read: int
+    # How many new Files we have added to the database
+    files_added: int
+    # How many files we could not read
+    errors: int
+    walking: bool
+    done: bool
+    cancelled: bool
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.started = time.monotonic()
+        self.dirs = 0
+        self.files_seen = 0
+        self.files_found = 0
+        self.files_read = 0
+        self.files_added = 0
+        self.errors = 0
+        self.walking = True
+        self.done = False
+        self.cancelled = False
+
+    def elapsed(self) -> float:
+        """Return the number of seconds since the scan started."""
+        return time.monotonic() - self.started
+
+    def rate(self) -> float:
+        """Return the number of files read per second."""
+        elapsed: Final[float] = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return self.files_read / elapsed
+
+    def eta(self) -> Optional[float]:
+        """Return the estimated number of seconds until the scan is done.
+
+        Until we have seen all directories, we cannot tell, so we return None.
+        """
+        if self.done:
+            return 0.0
+        rate: Final[float] = self.rate()
+        if self.walking or rate == 0.0:
+            return None
+        return (self.files_found - self.files_read) / rate
+
+    def __str__(self) -> str:
+        state: str = ""
+        if self.cancelled:
+            state = "cancelled, "
+        elif self.done:
+            state = "done, "
+        eta = self.eta()
+        eta_str: Final[str] = "?" if eta is None else \
+            f"{int(eta) // 60}:{int(eta) % 60:02d}"
+        return f"Scan {self.root}: {state}{self.dirs} dirs, " + \
+            f"{self.files_seen} files, " + \
+            f"{self.files_read}/{self.files_found} read, " + \
+            f"{self.files_added} added, {self.errors} errors, " + \
+            f"{self.rate():.1f} files/s, ETA {eta_str}"
+
+
+ProgressCallback = Callable[[ScanProgress], None]
 
 
 class Scanner:
-    """The Scanner traverses directory trees and attempts to spot audio files."""
+    """The Scanner traverses directory trees and attempts to spot audio files.
+
+    Rescans are incremental: Directories that have not been modified since the
+    Folder's last scan are not looked into (their subdirectories still are),
+    and tags are only read from files whose size, mtime or inode differ from
+    what we stored in the database. A file that is rewritten in place does
+    not modify its directory, so only a full scan or the Watcher notices it.
+    The paths known to the database are loaded once per scan; the Files that
+    no longer exist on disk are removed from the database at the end of a
+    scan. A new file that has the same size and content digest as one of
+    those is taken to be the same file moved to a new location, and the
+    existing File is pointed to it, so it keeps its playback position.
+
+    While scanning, the progress callback passed to scan() is called with a
+    ScanProgress at most every PROGRESS_INTERVAL seconds, always from the
+    thread that called scan(). A scan can be cancelled from another thread
+    by calling cancel(), the files that have been added so far are kept.
+
+    Unless cache is False, the tags of every file we read are stored in the
+    TagCache, and files found there are not read again, even when the
+    database has been created from scratch. The TagCache keeps up to
+    cache_entries files, which should be well above the size of the library.
+
+    If workers is greater than 1, scanning is split into three stages
+    connected by bounded queues: A thread walks the directory tree, a pool of
+    worker processes extracts the metadata, and the calling thread adds the
+    files to the database. The database is only ever touched from the calling
+    thread.
+
+    Files are written in batches, each in a transaction of its own, so the
+    database is not locked for the duration of the scan. A scan that fails
+    keeps the batches written before.
+    """
 
     __slots__ = [
         "db",
         "log",
+        "workers",
+        "vanished",
+        "pending",
+        "programs",
+        "movable",
+        "candidates",
+        "batch",
+        "batch_started",
+        "cache",
+        "progress",
+        "callback",
+        "reported",
+        "stop",
     ]
 
     db: database.Database
     log: logging.Logger
-
-    def __init__(self):
+    workers: int
+    vanished: dict[str, int]
+    # New Files waiting to be added, along with their album and artist tags
+    pending: list[tuple[File, str, str]]
+    # All Programs, by title. Primed at the start of each scan and updated
+    # as the scan creates new Programs, so the program table is only hit
+    # once per album.
+    programs: dict[str, Program]
+    # The IDs of all known Files below the Folder, by size and digest
+    movable: dict[tuple[int, str], list[int]]
+    # New files that look like they might be known Files that have moved
+    candidates: list[TagResult]
+    # Files waiting to be written in the next transaction, and since when
+    batch: list[TagResult]
+    batch_started: float
+    cache: Optional[tagcache.TagCache]
+    progress: ScanProgress
+    callback: Optional[ProgressCallback]
+    reported: float
+    stop: Event
+
+    def __init__(self, workers: int = 0, cache: bool = True, cache_entries: int = tagcache.MAX_ENTRIES):  # noqa: E501 # pylint: disable-msg=C0301
         self.log = common.get_logger("scanner")
-        self.db = database.Database(common.path.db())
-
-    def scan(self, path: str) -> Folder:
-        """Scan a directory tree"""
+        self.db = database.Database(common.path.db(), profile=database.BULK)
+        self.workers = workers
+        self.vanished = {}
+        self.pending = []
+        self.programs = {}
+        self.movable = {}
+        self.candidates = []
+        self.batch = []
+        self.batch_started = 0.0
+        self.progress = ScanProgress("")
+        self.callback = None
+        self.reported = 0.0
+        self.stop = Event()
+        self.cache = None
+        if cache:
+            try:
+                self.cache = tagcache.TagCache(max_entries=cache_entries)
+            except (OSError, sqlite3.Error) as e:
+                self.log.warning("Cannot open tag cache: %s", e)
+
+    def cancel(self) -> None:
+        """Ask a running scan to stop as soon as possible."""
+        self.stop.set()
+
+    def cancelled(self) -> bool:
+        """Return True if the current scan has been cancelled."""
+        return self.stop.is_set()
+
+    def scan(self, path: str, full: bool = False, progress: Optional[ProgressCallback] = None) -> Folder:  # noqa: E501 # pylint: disable-msg=C0301
+        """Scan a directory tree
+
+        If full is True, look at every file, even in directories that have
+        not changed since the last scan. If the scan is cancelled, the files
+        that have vanished are not removed, and the Folder's last scan time is
+        left alone, so the next scan picks up where this one stopped.
+        """
         self.log.debug("Scan folder %s", path)
+        started: Final[datetime] = datetime.now()
+        self.stop.clear()
+        self.progress = ScanProgress(path)
+        self.callback = progress
+        self.reported = 0.0
 
         with self.db:
             folder = self.db.folder_get_by_path(path)
             if folder is None:
-                folder = Folder(0, path, datetime.now())
+                folder = Folder(0, path)
                 self.db.folder_add(folder)
 
-            # pylint: disable-msg=R1702
-            for dirpath, _subfolders, files in os.walk(path):
-                for f in files:
-                    if AUDIO_PAT.search(f) is not None:
-                        full_path: str = os.path.join(dirpath, f)
-                        # self.log.debug("Found %s", full_path)
-                        db_file = self.db.file_get_by_path(full_path)
-
-                        if db_file is not None:
-                            continue
-
-                        self.log.debug("Found new file %s", full_path)
-
-                        db_file = File(
-                            folder_id=folder.folder_id,
-                            path=full_path,
-                        )
-                        try:
-                            meta = read_tags(full_path)
-                            if len(meta) == 0:
-                                continue
-                            if meta["album"] == "":
-                                db_file.program_id = 0
-                            else:
-                                prog = self.db.program_get_by_title(meta["album"])  # noqa: E501
-                                if prog is None:
-                                    prog = Program(
-                                        title=meta["album"],
-                                        creator=meta["artist"],
-                                        url="",
-                                    )
-                                    self.db.program_add(prog)
-                                    assert prog.program_id > 0
-                                db_file.program_id = prog.program_id
-
-                            db_file.ord1 = int(meta["ord1"])
-                            db_file.ord2 = int(meta["ord2"])
-                            db_file.title = meta["title"]
-                            self.db.file_add(db_file)
-                        except Exception as e:  # pylint: disable-msg=W0718
-                            self.log.error("Caught exception while handling metadata: %s", e)  # noqa: E501 # pylint: disable-msg=C0301
-                            traceback.print_tb(e.__traceback__)
-
-        self.db.folder_update_scan(folder, datetime.now())
+        since: float = 0.0
+        if not full:
+            since = folder.last_scan.timestamp()
+
+        self.__prepare()
+        known: KnownFiles = {}
+        for fpath, info in self.db.file_get_fingerprints_below(path).items():  # noqa: E501 # pylint: disable-msg=C0301
+            known.setdefault(os.path.dirname(fpath), {})[fpath] = info
+            if info[2] != "":
+                self.movable.setdefault((info[1].size, info[2]), []).append(info[0])  # noqa: E501 # pylint: disable-msg=C0301
+        total: Final[int] = sum(len(d) for d in known.values())
+
+        try:
+            if self.workers > 1:
+                self.__scan_parallel(folder, known, since)
+            else:
+                self.__scan_serial(folder, known, since)
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
 
+        with self.db:
+            self.__commit(folder)
+            if self.cancelled():
+                # We do not know what has vanished, or where it went.
+                self.log.info("Scan of %s has been cancelled", path)
+                self.candidates = []
+            else:
+                self.__relink_moved(folder)
+                self.__flush()
+                self.__purge_vanished(path, total)
+                # Use the time we started at, so directories that changed
+                # while we were scanning get looked at again next time.
+                self.db.folder_update_scan(folder, started)
+
+        self.progress.walking = False
+        self.progress.done = True
+        self.progress.cancelled = self.cancelled()
+        self.__report(True)
         return folder
 
-    def refresh(self) -> None:
+    def __report(self, force: bool = False) -> None:
+        """Pass the progress to the callback, unless we just did."""
+        if self.callback is None:
+            return
+        now: Final[float] = time.monotonic()
+        if not force and now - self.reported < PROGRESS_INTERVAL:
+            return
+        self.reported = now
+        try:
+            self.callback(self.progress)
+        except Exception as e:  # pylint: disable-msg=W0718
+            self.log.error("Caught exception in progress callback: %s", e)
+
+    def update(self, folder: Folder, changed: Iterable[str], removed: Iterable[str]) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Apply changes to individual paths below a Folder.
+
+        changed holds the files and directories that have been created,
+        modified or moved to where they are now, removed those that have been
+        deleted or moved away. Only those paths are looked at, so this is a
+        lot cheaper than scanning the whole Folder when we already know what
+        has changed.
+        """
+        self.progress = ScanProgress(folder.path)
+        self.callback = None
+        self.__prepare()
+        for path in removed:
+            for fpath, info in self.db.file_get_fingerprints_below(path).items():  # noqa: E501 # pylint: disable-msg=C0301
+                self.vanished[fpath] = info[0]
+                if info[2] != "":
+                    self.movable.setdefault((info[1].size, info[2]), []).append(info[0])  # noqa: E501 # pylint: disable-msg=C0301
+
+        found: list[tuple[str, Fingerprint]] = []
+        for path in changed:
+            try:
+                if os.path.isdir(path):
+                    for _, files in walk_audio(path):
+                        found.extend(files or [])
+                elif AUDIO_PAT.search(path) is not None:
+                    found.append((path, Fingerprint.from_stat(os.stat(path))))  # noqa: E501 # pylint: disable-msg=C0301
+            except OSError as e:
+                self.log.error("Cannot look at %s: %s", path, e)
+
+        for path, fp in found:
+            # It might have been removed and created again.
+            self.vanished.pop(path, None)
+            known = self.db.file_get_fingerprint(path)
+            if known is not None and known[1] == fp:
+                continue
+            item: ScanItem = (path, fp, 0 if known is None else known[0])
+            res = self.__inspect(item)
+            if res is not None:
+                self.__queue(folder, res)
+
+        if self.cache is not None:
+            self.cache.flush()
+        with self.db:
+            self.__commit(folder)
+            self.__relink_moved(folder)
+            self.__flush()
+            if len(self.vanished) > 0:
+                self.log.info("Remove %d vanished files below %s",
+                              len(self.vanished),
+                              folder.path)
+                self.db.file_delete_many(list(self.vanished.values()))
+
+    def __prepare(self) -> None:
+        """Reset the state kept for the duration of a scan or update.
+
+        Anything left over from a scan that failed is void anyway, since its
+        last transaction was rolled back.
+        """
+        self.pending = []
+        self.batch = []
+        self.programs = {p.title: p for p in self.db.program_get_all()}
+        self.vanished = {}
+        self.movable = {}
+        self.candidates = []
+
+    def __scan_serial(self, folder: Folder, known: KnownFiles, since: float) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Walk the Folder, read tags and add Files, all in one thread."""
+        for item in self.__find_changes(known, folder.path, since):
+            if self.cancelled():
+                break
+            res = self.__inspect(item)
+            self.progress.files_read += 1
+            if res is None:
+                self.progress.errors += 1
+            else:
+                self.__queue(folder, res)
+            self.__report()
+
+    def __inspect(self, item: ScanItem) -> Optional[TagResult]:
+        """Read the tags of a file, unless they are in the cache."""
+        path: Final[str] = item[0]
+        if self.cache is not None:
+            cached = self.cache.get(path, item[1])
+            if cached is not None:
+                return (item, normalize_tags(path, cached[0]), cached[1])
+        try:
+            tags, digest = inspect_file(path)
+        except Exception as e:  # pylint: disable-msg=W0718
+            self.log.error("Caught exception while reading tags from %s: %s",
+                           path,
+                           e)
+            return None
+        if self.cache is not None:
+            self.cache.put(path, item[1], tags, digest)
+        return (item, normalize_tags(path, tags), digest)
+
+    def __scan_parallel(self, folder: Folder, known: KnownFiles, since: float) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Walk the Folder, read tags in a process pool, add the Files."""
+        items: queue.Queue[Optional[ScanItem]] = queue.Queue(QUEUE_SIZE)
+        results: queue.Queue[Optional[TagResult]] = queue.Queue(QUEUE_SIZE)
+        ctx = multiprocessing.get_context("spawn")
+
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 mp_context=ctx) as pool:
+            walker = Thread(target=self.__walk_stage,
+                            args=(known, folder.path, since, items),
+                            name="scan-walk",
+                            daemon=True)
+            parser = Thread(target=self.__parse_stage,
+                            args=(pool, items, results),
+                            name="scan-parse",
+                            daemon=True)
+            walker.start()
+            parser.start()
+
+            done: bool = False
+            try:
+                while True:
+                    try:
+                        res = results.get(timeout=PROGRESS_INTERVAL)
+                    except queue.Empty:
+                        # The walker may be busy with directories that have
+                        # not changed, or the workers with large files.
+                        if self.__commit_due():
+                            with self.db:
+                                self.__commit(folder)
+                        self.__report()
+                        continue
+                    if res is None:
+                        done = True
+                        break
+                    self.progress.files_read += 1
+                    if not self.cancelled():
+                        self.__queue(folder, res)
+                    self.__report()
+            finally:
+                if not done:
+                    # We are bailing out with an error. Tell the other stages
+                    # to stop, and keep the results queue from filling up
+                    # until they have, so neither of them blocks forever.
+                    self.stop.set()
+                    while results.get() is not None:
+                        pass
+                # The parser must be done submitting files before the pool
+                # shuts down.
+                walker.join()
+                parser.join()
+
+    def __find_changes(self, known: KnownFiles, root: str, since: float) -> Iterator[ScanItem]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Yield the audio files below root that are new or have changed.
+
+        Entries are removed from known as their files are found, whatever is
+        left over at the end has vanished. If the scan is cancelled, we stop
+        without marking anything as vanished.
+        """
+        prog: Final[ScanProgress] = self.progress
+        for dirpath, files in walk_audio(root, since):
+            if self.cancelled():
+                return
+            prog.dirs += 1
+            in_dir = known.pop(dirpath, {})
+            if files is None:
+                # Nothing was added, removed or renamed in here.
+                prog.files_seen += len(in_dir)
+                continue
+            prog.files_seen += len(files)
+            for path, fp in files:
+                info = in_dir.pop(path, None)
+                if info is None:
+                    self.log.debug("Found new file %s", path)
+                    prog.files_found += 1
+                    yield (path, fp, 0)
+                elif info[1] != fp:
+                    self.log.debug("File %s has changed", path)
+                    prog.files_found += 1
+                    yield (path, fp, info[0])
+            self.__mark_vanished(in_dir)
+        prog.walking = False
+
+        # Directories we did not come across have been removed altogether.
+        for in_dir in known.values():
+            self.__mark_vanished(in_dir)
+        known.clear()
+
+    def __mark_vanished(self, files: dict[str, tuple[int, Fingerprint, str]]) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        for path, info in files.items():
+            self.vanished[path] = info[0]
+
+    def __walk_stage(self, known: KnownFiles, root: str, since: float, items: queue.Queue) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Feed all audio files that are new or have changed to items."""
+        try:
+            for item in self.__find_changes(known, root, since):
+                items.put(item)
+        except Exception as e:  # pylint: disable-msg=W0718
+            self.log.error("Caught exception while walking %s: %s", root, e)
+        finally:
+            items.put(None)
+
+    def __parse_stage(self,
+                      pool: ProcessPoolExecutor,
+                      items: queue.Queue,
+                      results: queue.Queue) -> None:
+        """Submit files to the process pool, pass the tags on to results.
+
+        Files found in the tag cache are passed on right away. The number of
+        files in flight is bounded, so a slow database does not cause us to
+        pile up parsed tags in memory.
+        """
+        pending: deque[tuple[ScanItem, Future]] = deque()
+        depth: Final[int] = self.workers * POOL_DEPTH
+        try:
+            while (item := items.get()) is not None:
+                if self.cancelled():
+                    # Keep draining items, so the walker is not blocked.
+                    while len(pending) > 0:
+                        pending.popleft()[1].cancel()
+                    continue
+                if self.cache is not None:
+                    cached = self.cache.get(item[0], item[1])
+                    if cached is not None:
+                        results.put((item,
+                                     normalize_tags(item[0], cached[0]),
+                                     cached[1]))
+                        continue
+                pending.append((item, pool.submit(inspect_file, item[0])))
+                if len(pending) >= depth:
+                    results.put(self.__collect(*pending.popleft()))
+            while len(pending) > 0:
+                item, fut = pending.popleft()
+                if fut.cancel():
+                    continue
+                results.put(self.__collect(item, fut))
+        finally:
+            results.put(None)
+
+    def __collect(self, item: ScanItem, fut: Future) -> TagResult:
+        """Wait for a tag reader to finish and return its result."""
+        try:
+            tags, digest = fut.result()
+        except Exception as e:  # pylint: disable-msg=W0718
+            self.log.error("Caught exception while reading tags from %s: %s",
+                           item[0],
+                           e)
+            return (item, {}, "")
+        if self.cache is not None:
+            self.cache.put(item[0], item[1], tags, digest)
+        return (item, normalize_tags(item[0], tags), digest)
+
+    def __queue(self, folder: Folder, res: TagResult) -> None:
+        """Add a File to the current batch, write the batch if it is due."""
+        if len(self.batch) == 0:
+            self.batch_started = time.monotonic()
+        self.batch.append(res)
+        if self.__commit_due():
+            with self.db:
+                self.__commit(folder)
+
+    def __commit_due(self) -> bool:
+        """Return True if the current batch is big enough, or old enough, to
+        be written.
+        """
+        return len(self.batch) >= COMMIT_SIZE or \
+            (len(self.batch) > 0 and
+             time.monotonic() - self.batch_started >= COMMIT_INTERVAL)
+
+    def __commit(self, folder: Folder) -> None:
+        """Store the Files in the current batch.
+
+        The caller has to hold a transaction, which should end right after.
+        """
+        batch: Final[list[TagResult]] = self.batch
+        self.batch = []
+        for res in batch:
+            self.__store(folder, res)
+        self.__flush()
+
+    def __store(self, folder: Folder, res: TagResult) -> None:
+        """Add a new File to the database, or update a changed one."""
+        item, meta, digest = res
+        if len(meta) == 0:
+            self.progress.errors += 1
+            return
+
+        try:
+            if item[2] != 0:
+                self.__update_file(item, meta, digest)
+            elif (item[1].size, digest) in self.movable:
+                # Whether it has been moved or copied, we can only tell once
+                # we know what has vanished.
+                self.candidates.append(res)
+            else:
+                self.__add_file(folder, item, meta, digest)
+        except Exception as e:  # pylint: disable-msg=W0718
+            self.log.error("Caught exception while handling metadata: %s", e)  # noqa: E501 # pylint: disable-msg=C0301
+            traceback.print_tb(e.__traceback__)
+
+    def __add_file(self, folder: Folder, item: ScanItem, meta: dict[str, str], digest: str) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Queue a newly discovered File to be added to the database."""
+        db_file = File(
+            folder_id=folder.folder_id,
+            path=item[0],
+            fingerprint=item[1],
+            digest=digest,
+            ord1=int(meta["ord1"]),
+            ord2=int(meta["ord2"]),
+            title=meta["title"],
+        )
+        self.pending.append((db_file, meta["album"], meta["artist"]))
+        if len(self.pending) >= FLUSH_SIZE:
+            self.__flush()
+
+    def __flush(self) -> None:
+        """Add the queued Files, and any Programs they need, in bulk."""
+        if len(self.pending) == 0:
+            return
+
+        new_progs: dict[str, Program] = {}
+        for _, album, artist in self.pending:
+            if album == "" or album in self.programs or album in new_progs:
+                continue
+            new_progs[album] = Program(
+                title=album,
+                creator=artist,
+                url="",
+            )
+        if len(new_progs) > 0:
+            self.db.program_add_many(list(new_progs.values()))
+            # Only now that they have been added successfully
+            self.programs.update(new_progs)
+
+        files: list[File] = []
+        for db_file, album, _ in self.pending:
+            if album == "":
+                db_file.program_id = 0
+            else:
+                db_file.program_id = self.programs[album].program_id
+            files.append(db_file)
+        self.pending = []
+
+        try:
+            self.db.file_add_many(files)
+            self.progress.files_added += len(files)
+        except sqlite3.Error as e:
+            self.log.error("Cannot add %d files in bulk, adding them one by one: %s",  # noqa: E501 # pylint: disable-msg=C0301
+                           len(files),
+                           e)
+            for db_file in files:
+                try:
+                    self.db.file_add(db_file)
+                    self.progress.files_added += 1
+                except sqlite3.Error as err:
+                    self.log.error("Cannot add file %s: %s",
+                                   db_file.path,
+                                   err)
+
+    def __update_file(self, item: ScanItem, meta: dict[str, str], digest: str) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Update the title and sorting indices of a File that has changed.
+
+        The Program is left alone, the user may have assigned the File to a
+        different one than its tags suggest.
+        """
+        db_file = self.db.file_get_by_id(item[2])
+        if db_file is None:
+            return
+
+        if db_file.title != meta["title"]:
+            self.db.file_set_title(db_file, meta["title"])
+        ord1, ord2 = int(meta["ord1"]), int(meta["ord2"])
+        if (db_file.ord1, db_file.ord2) != (ord1, ord2):
+            self.db.file_set_ord(db_file, ord1, ord2)
+        self.db.file_set_fingerprint(db_file, item[1], digest)
+
+    def __relink_moved(self, folder: Folder) -> None:
+        """Point vanished Files to the new files they have been moved to.
+
+        Candidates that do not match a vanished File are copies, they are
+        added as new Files.
+        """
+        gone: dict[int, str] = {fid: path for path, fid in self.vanished.items()}  # noqa: E501 # pylint: disable-msg=C0301
+        for item, meta, digest in self.candidates:
+            fid: int = 0
+            for known_id in self.movable[(item[1].size, digest)]:
+                if known_id in gone:
+                    fid = known_id
+                    break
+
+            if fid == 0:
+                try:
+                    self.__add_file(folder, item, meta, digest)
+                except Exception as e:  # pylint: disable-msg=W0718
+                    self.log.error("Caught exception while handling metadata of %s: %s",  # noqa: E501 # pylint: disable-msg=C0301
+                                   item[0],
+                                   e)
+                    self.progress.errors += 1
+                continue
+
+            old_path = gone.pop(fid)
+            self.log.info("File %s has moved to %s", old_path, item[0])
+            try:
+                self.db.file_relink(fid, folder.folder_id, item[0], item[1])
+            except sqlite3.Error as e:
+                self.log.error("Cannot relink file %s to %s: %s",
+                               old_path,
+                               item[0],
+                               e)
+                continue
+            del self.vanished[old_path]
+        self.candidates = []
+
+    def __purge_vanished(self, root: str, total: int) -> None:
+        """Remove the Files that have vanished from the database."""
+        if len(self.vanished) == 0:
+            return
+
+        # If the Folder lives on a network share or a removable disk that is
+        # not mounted right now, do not throw away all the listening progress.
+        if len(self.vanished) == total and \
+                (not os.path.isdir(root) or len(os.listdir(root)) == 0):
+            self.log.warning("All %d files below %s have vanished, is it mounted? Not removing them.",  # noqa: E501 # pylint: disable-msg=C0301
+                             total,
+                             root)
+            return
+
+        self.log.info("Remove %d vanished files below %s",
+                      len(self.vanished),
+                      root)
+        self.db.file_delete_many(list(self.vanished.values()))
+
+    def refresh(self, full: bool = False, progress: Optional[ProgressCallback] = None) -> None:  # noqa: E501 # pylint: disable-msg=C0301
         """Scan all folders in the database."""
         self.log.debug("Update all folders.")
         folders = self.db.folder_get_all()
         for f in folders:
-            self.scan(f.path)
+            self.scan(f.path, full, progress)
+            if self.cancelled():
+                break
+
+
+def walk_audio(root: str, since: float = 0.0) -> Iterator[tuple[str, Optional[list[tuple[str, Fingerprint]]]]]:  # noqa: E501 # pylint: disable-msg=C0301
+    """Yield the directories below root along with the audio files in them.
+
+    For each directory, yield its path and a list of the full paths and
+    Fingerprints of the audio files it contains. Directories that have not
+    been modified since the timestamp since are not listed, because no files
+    can have been added to, removed from or renamed in them. For those, the
+    list is None. Their subdirectories are still visited.
+    """
+    stack: list[str] = [root]
+    while len(stack) > 0:
+        dirpath = stack.pop()
+        try:
+            st = os.stat(dirpath)
+            entries = list(os.scandir(dirpath))
+        except FileNotFoundError:
+            continue
+        except OSError:
+            # We cannot tell what is in there, so treat it as unchanged
+            # rather than have its files count as vanished.
+            yield (dirpath, None)
+            continue
+
+        unchanged: bool = max(st.st_mtime, st.st_ctime) < since
+        files: Optional[list[tuple[str, Fingerprint]]] = None
+        if not unchanged:
+            files = []
+        subdirs: list[str] = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif files is not None and AUDIO_PAT.search(entry.name) is not None:  # noqa: E501 # pylint: disable-msg=C0301
+                try:
+                    files.append((entry.path,
+                                  Fingerprint.from_stat(entry.stat())))
+                except OSError:
+                    continue
+        yield (dirpath, files)
+        stack.extend(sorted(subdirs, reverse=True))
+
+
+def inspect_file(path: str) -> tuple[Optional[dict[str, str]], str]:
+    """Read the raw tags and compute the content digest of an audio file."""
+    return (read_raw_tags(path), content_digest(path))
+
+
+def content_digest(path: str) -> str:
+    """Compute a digest over a file's size and the beginning and end of its
+    content.
+
+    This is cheap even for huge files and good enough to recognize a file
+    that has been moved.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fh:
+        size: Final[int] = os.fstat(fh.fileno()).st_size
+        h.update(size.to_bytes(8, "little"))
+        h.update(fh.read(DIGEST_SPAN))
+        if size > DIGEST_SPAN:
+            fh.seek(max(DIGEST_SPAN, size - DIGEST_SPAN))
+            h.update(fh.read(DIGEST_SPAN))
+    return h.hexdigest()
 
 
-# pylint: disable-msg=R0912
 def read_tags(path: str) -> dict[str, str]:
     """Attempt to extract metadata from an audio file.
 
     path is expected to be the full, absolute path.
     """
+    return normalize_tags(path, read_raw_tags(path))
+
+
+def read_raw_tags(path: str) -> Optional[dict[str, str]]:
+    """Return the tags found in an audio file, or None if it cannot be read.
+
+    We try the header-only reader first, and only if that fails, we let
+    mutagen parse the file.
+    """
+    tags = tagreader.read_tags(path)
+    if tags is None:
+        tags = read_tags_mutagen(path)
+    return tags
+
+
+def normalize_tags(path: str, tags: Optional[dict[str, str]]) -> dict[str, str]:  # noqa: E501 # pylint: disable-msg=C0301
+    """Fill in missing tags and extract disc and track numbers.
+
+    If tags is None, the file could not be read, and we return an empty
+    dict.
+    """
+    if tags is None:
+        return {}
+
+    meta: dict[str, str] = {
+        "artist": tags.get("artist", ""),
+        "album": tags.get("album", os.path.basename(os.path.dirname(path))),
+        "title": tags.get("title", ""),
+        "ord1": tags.get("ord1", "0"),
+        "ord2": tags.get("ord2", "0"),
+    }
+
+    m1 = DISC_NO_PAT.search(meta["ord1"])
+    if m1 is not None:
+        meta["ord1"] = m1[1]
+
+    m2 = DISC_NO_PAT.search(meta["ord2"])
+    if m2 is not None:
+        meta["ord2"] = m2[1]
+
+    return meta
+
+
+# pylint: disable-msg=R0912
+def read_tags_mutagen(path: str) -> Optional[dict[str, str]]:
+    """Extract metadata from an audio file using mutagen.
+
+    Like tagreader.read_tags, return only the tags that were found.
+    """
     try:
         meta = mutagen.File(path)
     except mutagen.MutagenError:
-        return {}
+        return None
 
-    tags: dict[str, str] = {
-        "artist": "",
-        "album": "",
-        "title": "",
-        "ord1": "0",
-        "ord2": "0",
-    }
+    if meta is None:
+        return None
+
+    tags: dict[str, str] = {}
 
     if "artist" in meta:
         tags["artist"] = meta["artist"][0]
@@ -143,8 +918,6 @@ def read_tags(path: str) -> dict[str, str]:
         tags["album"] = meta["album"][0]
     elif "TALB" in meta:
         tags["album"] = meta["TALB"].text[0]
-    else:
-        tags["album"] = os.path.basename(os.path.dirname(path))
 
     if "title" in meta:
         tags["title"] = meta["title"][0]
@@ -161,24 +934,16 @@ def read_tags(path: str) -> dict[str, str]:
     elif "TPOS" in meta:
         tags["ord1"] = meta["TPOS"].text[0]
 
-    m1 = DISC_NO_PAT.search(tags["ord1"])
-    if m1 is not None:
-        tags["ord1"] = m1[1]
-
-    m2 = DISC_NO_PAT.search(tags["ord2"])
-    if m2 is not None:
-        tags["ord2"] = m2[1]
-
     return tags
 
 
-def scan(folder: str) -> None:
+def scan(folder: str, workers: int = 0) -> None:
     """Instantiate a Scanner to scan a single directory tree.
 
     I'll use this for testing and debugging mainly.
     """
-    s: Scanner = Scanner()
-    s.scan(folder)
+    s: Scanner = Scanner(workers)
+    s.scan(folder, progress=lambda p: s.log.info("%s", p))
 
 
 # Local Variables: #
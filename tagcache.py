@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 16:31:05 krylon>
+#
+# /data/code/python/vox/tagcache.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.tagcache
+
+(c) 2026 Benjamin Walkenhorst
+
+A cache of the tags we have read from audio files, kept in a database of its
+own, outside the application directory. Entries are keyed by device, inode,
+size and mtime, so they stay valid no matter which database the files are
+added to, and a file that has been modified simply is not found any more.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Final, Optional
+
+from vox import common
+from vox.data import Fingerprint
+
+# Bump this whenever the layout or the meaning of the cached data changes,
+# the cache is then thrown away and rebuilt.
+CACHE_VERSION: Final[int] = 1
+# How many entries we keep before evicting the least recently used ones.
+# This should be well above the number of files in the library, or a full
+# rescan evicts entries before they are used again.
+MAX_ENTRIES: Final[int] = 1_000_000
+# How many new entries we collect before committing them
+BATCH_SIZE: Final[int] = 500
+
+INIT_QUERIES: Final[list[str]] = [
+    """
+CREATE TABLE tag (
+    dev                  INTEGER NOT NULL,
+    inode                INTEGER NOT NULL,
+    size                 INTEGER NOT NULL,
+    mtime                INTEGER NOT NULL,
+    tags                 TEXT,
+    digest               TEXT NOT NULL,
+    atime                INTEGER NOT NULL,
+    PRIMARY KEY (dev, inode, size, mtime)
+) STRICT
+    """,
+    "CREATE INDEX tag_atime_idx ON tag (atime)",
+    f"PRAGMA user_version = {CACHE_VERSION}",
+]
+
+GET_QUERY: Final[str] = """
+SELECT tags, digest FROM tag
+WHERE dev = ? AND inode = ? AND size = ? AND mtime = ?
+"""
+PUT_QUERY: Final[str] = """
+INSERT OR REPLACE INTO tag (dev, inode, size, mtime, tags, digest, atime)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+TOUCH_QUERY: Final[str] = """
+UPDATE tag SET atime = ?
+WHERE dev = ? AND inode = ? AND size = ? AND mtime = ?
+"""
+EVICT_QUERY: Final[str] = """
+DELETE FROM tag
+WHERE rowid IN (SELECT rowid FROM tag ORDER BY atime LIMIT ?)
+"""
+
+CacheKey = tuple[int, int, int, int]
+
+
+class TagCache:
+    """TagCache remembers the raw tags and content digest of audio files.
+
+    A TagCache may be shared by several threads, and several processes may
+    use the same cache file. New entries and lookups are written in batches;
+    call flush() when done to make sure everything has been saved.
+    """
+
+    __slots__ = [
+        "db",
+        "log",
+        "path",
+        "lock",
+        "max_entries",
+        "count",
+        "added",
+        "touched",
+        "devices",
+    ]
+
+    db: sqlite3.Connection
+    log: logging.Logger
+    path: Final[str]
+    lock: Lock
+    max_entries: int
+    count: int
+    added: int
+    # The entries that have been looked up since the last flush
+    touched: set[CacheKey]
+    # The device number of each directory we have looked at
+    devices: dict[str, int]
+
+    def __init__(self, path: str = "", max_entries: int = MAX_ENTRIES) -> None:
+        self.path = path or common.path.cache()
+        self.log = common.get_logger("tagcache")
+        self.lock = Lock()
+        self.max_entries = max_entries
+        self.added = 0
+        self.touched = set()
+        self.devices = {}
+
+        folder: Final[str] = os.path.dirname(self.path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self.db = sqlite3.connect(self.path, timeout=10.0,
+                                  check_same_thread=False)
+        self.db.isolation_level = None
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute("PRAGMA journal_mode = WAL")
+        cur.execute("PRAGMA synchronous = NORMAL")
+        cur.execute("PRAGMA user_version")
+        version: Final[int] = cur.fetchone()[0]
+        if version != CACHE_VERSION:
+            self.log.info("Create tag cache at %s", self.path)
+            with self.db:
+                cur.execute("DROP TABLE IF EXISTS tag")
+                for query in INIT_QUERIES:
+                    cur.execute(query)
+
+        cur.execute("SELECT COUNT(*) FROM tag")
+        self.count = cur.fetchone()[0]
+
+    def close(self) -> None:
+        """Save pending changes and close the cache."""
+        self.flush()
+        self.db.close()
+
+    def __key(self, path: str, fp: Fingerprint) -> CacheKey:
+        """Return the key a file is stored under."""
+        # All files in a directory live on the same device, so we only need
+        # to stat the directory.
+        folder: Final[str] = os.path.dirname(path)
+        dev = self.devices.get(folder)
+        if dev is None:
+            dev = os.stat(folder).st_dev
+            self.devices[folder] = dev
+        return (dev, fp.inode, fp.size, fp.mtime)
+
+    def get(self, path: str, fp: Fingerprint) -> Optional[tuple[Optional[dict[str, str]], str]]:  # noqa: E501 # pylint: disable-msg=C0301
+        """Look up the tags and digest of a file.
+
+        Return None if the file is not in the cache. Files none of our
+        readers could make sense of are cached, too, their tags are None.
+        """
+        with self.lock:
+            try:
+                key = self.__key(path, fp)
+                cur: sqlite3.Cursor = self.db.cursor()
+                cur.execute(GET_QUERY, key)
+                row = cur.fetchone()
+            except (OSError, sqlite3.Error) as e:
+                self.log.error("Cannot look up %s in tag cache: %s", path, e)
+                return None
+            if row is None:
+                return None
+            self.touched.add(key)
+            return (None if row[0] is None else json.loads(row[0]), row[1])
+
+    def put(self, path: str, fp: Fingerprint, tags: Optional[dict[str, str]], digest: str) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        """Add the tags and digest of a file to the cache."""
+        with self.lock:
+            try:
+                key = self.__key(path, fp)
+                if self.added == 0:
+                    self.db.execute("BEGIN")
+                self.db.execute(PUT_QUERY,
+                                (*key,
+                                 None if tags is None else json.dumps(tags),
+                                 digest,
+                                 int(time.time())))
+            except (OSError, sqlite3.Error) as e:
+                self.log.error("Cannot add %s to tag cache: %s", path, e)
+                # Do not leave a transaction open with nothing in it, the
+                # next put would fail to begin one.
+                if self.added == 0 and self.db.in_transaction:
+                    self.db.execute("ROLLBACK")
+                return
+            self.added += 1
+            self.count += 1
+            if self.added >= BATCH_SIZE:
+                self.__commit()
+
+    def flush(self) -> None:
+        """Save the entries added and looked up so far."""
+        with self.lock:
+            self.__commit()
+            self.devices.clear()
+
+    def __commit(self) -> None:
+        """Commit pending entries and evict old ones if needed.
+
+        The caller must hold the lock.
+        """
+        try:
+            if self.added == 0:
+                self.db.execute("BEGIN")
+            now: Final[int] = int(time.time())
+            self.db.executemany(TOUCH_QUERY,
+                                [(now, *key) for key in self.touched])
+            if self.count > self.max_entries:
+                # Since we count replaced entries as new, count may be too
+                # high, so we make sure before we throw anything away.
+                cur: sqlite3.Cursor = self.db.cursor()
+                cur.execute("SELECT COUNT(*) FROM tag")
+                self.count = cur.fetchone()[0]
+                excess: Final[int] = self.count - self.max_entries
+                if excess > 0:
+                    self.log.debug("Evict %d entries from tag cache", excess)
+                    cur.execute(EVICT_QUERY, (excess,))
+                    self.count -= excess
+            self.db.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.log.error("Cannot save tag cache: %s", e)
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+        self.added = 0
+        self.touched.clear()
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 15:20:47 krylon>
+#
+# /data/code/python/vox/tagreader.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.tagreader
+
+(c) 2026 Benjamin Walkenhorst
+
+A minimal reader for the handful of tags we care about. Unlike mutagen, it
+only looks at the tag headers (ID3v2, Vorbis comments in FLAC and Ogg, the
+ilst atom in MP4 files), skips everything else by seeking past it, and gives
+up once it has read more than a fixed number of bytes.
+"""
+
+import os
+import struct
+from typing import BinaryIO, Callable, Final, Optional
+
+# The most bytes we read from a single file before giving up
+READ_BUDGET: Final[int] = 256 * 1024
+
+FIELDS: Final[tuple[str, ...]] = ("artist", "album", "title", "ord1", "ord2")
+
+ID3_FRAMES: Final[dict[bytes, str]] = {
+    b"TPE1": "artist",
+    b"TALB": "album",
+    b"TIT2": "title",
+    b"TPOS": "ord1",
+    b"TRCK": "ord2",
+    # ID3v2.2 uses three-letter frame IDs
+    b"TP1": "artist",
+    b"TAL": "album",
+    b"TT2": "title",
+    b"TPA": "ord1",
+    b"TRK": "ord2",
+}
+
+VORBIS_FIELDS: Final[dict[str, str]] = {
+    "artist": "artist",
+    "album": "album",
+    "title": "title",
+    "discnumber": "ord1",
+    "tracknumber": "ord2",
+}
+
+MP4_ITEMS: Final[dict[bytes, str]] = {
+    b"\xa9ART": "artist",
+    b"\xa9alb": "album",
+    b"\xa9nam": "title",
+    b"disk": "ord1",
+    b"trkn": "ord2",
+}
+
+ID3_ENCODINGS: Final[list[str]] = ["latin-1", "utf-16", "utf-16-be", "utf-8"]
+
+
+class TagError(Exception):
+    """Raised when a file cannot be parsed within our limits."""
+
+
+class BudgetReader:
+    """Wraps a file, counting the bytes read from it against a budget."""
+
+    __slots__ = [
+        "fh",
+        "budget",
+        "size",
+    ]
+
+    fh: BinaryIO
+    budget: int
+    size: int
+
+    def __init__(self, fh: BinaryIO, budget: int) -> None:
+        self.fh = fh
+        self.budget = budget
+        self.size = os.fstat(fh.fileno()).st_size
+
+    def read(self, n: int) -> bytes:
+        """Read exactly n bytes."""
+        if n > self.budget:
+            raise TagError("Read budget exhausted")
+        data = self.fh.read(n)
+        self.budget -= len(data)
+        if len(data) < n:
+            raise TagError("Unexpected end of file")
+        return data
+
+    def seek(self, offset: int) -> None:
+        """Go to the absolute position offset."""
+        self.fh.seek(offset)
+
+    def skip(self, n: int) -> None:
+        """Move forward n bytes without reading them."""
+        self.fh.seek(n, os.SEEK_CUR)
+
+    def tell(self) -> int:
+        """Return the current position."""
+        return self.fh.tell()
+
+
+def read_tags(path: str, budget: int = READ_BUDGET) -> Optional[dict[str, str]]:  # noqa: E501 # pylint: disable-msg=C0301
+    """Read artist, album, title and disc and track number from a file.
+
+    The result only contains the tags that were found, track and disc number
+    (as ord2 and ord1) are returned verbatim, e.g. "3/12". If the format is
+    not supported or the file cannot be parsed within budget bytes, return
+    None, so the caller can fall back to a full parser.
+    """
+    try:
+        with open(path, "rb") as fh:
+            rd = BudgetReader(fh, budget)
+            magic: Final[bytes] = rd.read(4)
+            rd.seek(0)
+            parser: Optional[Callable[[BudgetReader], Optional[dict[str, str]]]] = None  # noqa: E501 # pylint: disable-msg=C0301
+            if magic[:3] == b"ID3":
+                parser = parse_id3
+            elif magic == b"fLaC":
+                parser = parse_flac
+            elif magic == b"OggS":
+                parser = parse_ogg
+            else:
+                rd.seek(4)
+                if rd.read(4) == b"ftyp":
+                    rd.seek(0)
+                    parser = parse_mp4
+            if parser is None:
+                return None
+            return parser(rd)
+    except (TagError, OSError, struct.error, UnicodeDecodeError, LookupError):  # noqa: E501 # pylint: disable-msg=C0301
+        return None
+
+
+def synchsafe(data: bytes) -> int:
+    """Decode a synchsafe integer, which uses only 7 bits per byte."""
+    val: int = 0
+    for b in data:
+        val = (val << 7) | (b & 0x7f)
+    return val
+
+
+def decode_id3_text(data: bytes) -> str:
+    """Decode the payload of an ID3 text frame, return the first value."""
+    if len(data) == 0:
+        return ""
+    enc: Final[int] = data[0]
+    if enc >= len(ID3_ENCODINGS):
+        raise TagError(f"Unknown text encoding {enc}")
+    text = data[1:].decode(ID3_ENCODINGS[enc])
+    return text.split("\0")[0]
+
+
+# pylint: disable-msg=R0912
+def parse_id3(rd: BudgetReader) -> Optional[dict[str, str]]:
+    """Parse an ID3v2 tag at the beginning of a file.
+
+    If the tag is followed by a FLAC stream, return the Vorbis comments of
+    that instead.
+    """
+    header: Final[bytes] = rd.read(10)
+    major: Final[int] = header[3]
+    flags: Final[int] = header[5]
+    end: Final[int] = 10 + synchsafe(header[6:10])
+
+    if major not in (2, 3, 4):
+        return None
+    if flags & 0x80:
+        # Unsynchronisation is rare enough to leave it to mutagen
+        return None
+    if flags & 0x40 and major >= 3:
+        ext = rd.read(4)
+        if major == 3:
+            rd.skip(struct.unpack(">I", ext)[0])
+        else:
+            rd.skip(synchsafe(ext) - 4)
+
+    hdr_size: Final[int] = 6 if major == 2 else 10
+    tags: dict[str, str] = {}
+    while rd.tell() + hdr_size <= end:
+        fhdr = rd.read(hdr_size)
+        if fhdr[0] == 0:
+            # We have reached the padding
+            break
+        if major == 2:
+            fid = fhdr[:3]
+            size = int.from_bytes(fhdr[3:6], "big")
+            fflags = 0
+        else:
+            fid = fhdr[:4]
+            size = synchsafe(fhdr[4:8]) if major == 4 \
+                else struct.unpack(">I", fhdr[4:8])[0]
+            fflags = fhdr[9]
+
+        field = ID3_FRAMES.get(fid)
+        if field is None or field in tags:
+            rd.skip(size)
+            continue
+        # Compressed, encrypted or unsynchronised frames, leave them to
+        # mutagen.
+        if (major == 3 and fflags & 0xc0) or (major == 4 and fflags & 0x0e):
+            return None
+        if major == 4 and fflags & 0x01:
+            # Data length indicator
+            rd.skip(4)
+            size -= 4
+        tags[field] = decode_id3_text(rd.read(size))
+        if len(tags) == len(FIELDS):
+            break
+
+    rd.seek(end)
+    try:
+        if rd.read(4) == b"fLaC":
+            rd.seek(end)
+            return parse_flac(rd)
+    except TagError:
+        pass
+    return tags
+
+
+def parse_vorbis_comment(data: bytes) -> dict[str, str]:
+    """Parse a Vorbis comment block, as used by FLAC, Vorbis and Opus."""
+    tags: dict[str, str] = {}
+    offset: int = 0
+    vendor_len: Final[int] = struct.unpack_from("<I", data, offset)[0]
+    offset += 4 + vendor_len
+    count: Final[int] = struct.unpack_from("<I", data, offset)[0]
+    offset += 4
+    for _ in range(count):
+        length = struct.unpack_from("<I", data, offset)[0]
+        offset += 4
+        comment = data[offset:offset+length].decode("utf-8")
+        offset += length
+        key, sep, value = comment.partition("=")
+        if sep == "":
+            continue
+        field = VORBIS_FIELDS.get(key.lower())
+        if field is not None and field not in tags:
+            tags[field] = value
+    return tags
+
+
+def parse_flac(rd: BudgetReader) -> Optional[dict[str, str]]:
+    """Find the Vorbis comment among the metadata blocks of a FLAC file."""
+    if rd.read(4) != b"fLaC":
+        return None
+    while True:
+        header = rd.read(4)
+        last = header[0] & 0x80
+        btype = header[0] & 0x7f
+        length = int.from_bytes(header[1:4], "big")
+        if btype == 4:
+            return parse_vorbis_comment(rd.read(length))
+        # Most importantly, this skips embedded pictures.
+        rd.skip(length)
+        if last:
+            return {}
+
+
+def parse_ogg(rd: BudgetReader) -> Optional[dict[str, str]]:
+    """Parse the comment header of an Ogg Vorbis or Opus stream.
+
+    The comment header is the second packet of the first logical stream.
+    """
+    packets: list[bytes] = []
+    partial: bytes = b""
+    serial: Optional[bytes] = None
+    while len(packets) < 2:
+        header = rd.read(27)
+        if header[:4] != b"OggS":
+            raise TagError("Lost sync in Ogg stream")
+        segments = rd.read(header[26])
+        body_len = sum(segments)
+        if serial is None:
+            serial = header[14:18]
+        elif header[14:18] != serial:
+            rd.skip(body_len)
+            continue
+        body = rd.read(body_len)
+        offset: int = 0
+        for lacing in segments:
+            partial += body[offset:offset+lacing]
+            offset += lacing
+            if lacing < 255:
+                packets.append(partial)
+                partial = b""
+
+    comment: Final[bytes] = packets[1]
+    if comment[:7] == b"\x03vorbis":
+        return parse_vorbis_comment(comment[7:])
+    if comment[:8] == b"OpusTags":
+        return parse_vorbis_comment(comment[8:])
+    return None
+
+
+def mp4_atoms(rd: BudgetReader, start: int, end: int) -> list[tuple[bytes, int, int]]:  # noqa: E501 # pylint: disable-msg=C0301
+    """Return the type, payload offset and end of all atoms in a range."""
+    atoms: list[tuple[bytes, int, int]] = []
+    pos: int = start
+    while pos + 8 <= end:
+        rd.seek(pos)
+        header = rd.read(8)
+        size: int = struct.unpack(">I", header[:4])[0]
+        header_len: int = 8
+        if size == 1:
+            size = struct.unpack(">Q", rd.read(8))[0]
+            header_len = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_len:
+            raise TagError("Invalid atom size")
+        atoms.append((header[4:8], pos + header_len, pos + size))
+        pos += size
+    return atoms
+
+
+def mp4_find(rd: BudgetReader, start: int, end: int, name: bytes) -> Optional[tuple[int, int]]:  # noqa: E501 # pylint: disable-msg=C0301
+    """Return the payload offset and end of the first atom called name."""
+    for atype, payload, atom_end in mp4_atoms(rd, start, end):
+        if atype == name:
+            return (payload, atom_end)
+    return None
+
+
+def parse_mp4(rd: BudgetReader) -> Optional[dict[str, str]]:
+    """Parse the iTunes-style metadata in the moov atom of an MP4 file."""
+    moov = mp4_find(rd, 0, rd.size, b"moov")
+    if moov is None:
+        return None
+    meta = None
+    udta = mp4_find(rd, moov[0], moov[1], b"udta")
+    if udta is not None:
+        meta = mp4_find(rd, udta[0], udta[1], b"meta")
+    if meta is None:
+        meta = mp4_find(rd, moov[0], moov[1], b"meta")
+    if meta is None:
+        return {}
+    # meta is a "full box", with four bytes of version and flags
+    ilst = mp4_find(rd, meta[0] + 4, meta[1], b"ilst")
+    if ilst is None:
+        return {}
+
+    tags: dict[str, str] = {}
+    for atype, payload, atom_end in mp4_atoms(rd, ilst[0], ilst[1]):
+        field = MP4_ITEMS.get(atype)
+        if field is None:
+            continue
+        data = mp4_find(rd, payload, atom_end, b"data")
+        if data is None:
+            continue
+        rd.seek(data[0])
+        # Four bytes of type indicator, four bytes of locale
+        value = rd.read(data[1] - data[0])[8:]
+        if atype in (b"trkn", b"disk"):
+            if len(value) >= 4:
+                tags[field] = str(struct.unpack(">H", value[2:4])[0])
+        else:
+            tags[field] = value.decode("utf-8")
+    return tags
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -20,7 +20,7 @@ import unittest
 from datetime import datetime
 from typing import Any, NamedTuple
 
-from vox.data import File
+from vox.data import File, Fingerprint
 
 
 class FileCreateTestData(NamedTuple):
@@ -68,6 +68,22 @@ class FileTest(unittest.TestCase):
                     t = File(**c.args)  # pylint: disable-msg=C0103
                     self.assertIsNone(t)
 
+    def test_from_row(self):
+        """Test creating File objects from database rows"""
+        row = (23, None, 1, "/tmp/a.mp3", "", 95, 1700000000, None,
+               1, 7, 2048, 1700000000000000000, 4711, "abcd")
+        f = File.from_row(row)
+        self.assertEqual(f.file_id, 23)
+        self.assertIsNone(f.program_id)
+        self.assertEqual(f.path, "/tmp/a.mp3")
+        self.assertEqual(f.display_title(), "a.mp3")
+        self.assertEqual(f.last_played, datetime.fromtimestamp(1700000000))
+        self.assertEqual(f.url, "")
+        self.assertEqual((f.ord1, f.ord2), (1, 7))
+        self.assertEqual(f.fingerprint(),
+                         Fingerprint(2048, 1700000000000000000, 4711))
+        self.assertEqual(f.digest, "abcd")
+
 
 # Local Variables: #
 # python-indent: 4 #
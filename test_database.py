@@ -17,14 +17,17 @@ vox.test_database
 """
 
 import os
+import sqlite3
 import unittest
 from datetime import datetime
+from threading import Thread
 from typing import Final
+from unittest.mock import patch
 
 from krylib import isdir
 
 from vox import common, database
-from vox.data import File, Folder
+from vox.data import File, Fingerprint, Folder, Program
 
 TEST_ROOT: str = "/tmp/"
 
@@ -124,6 +127,496 @@ class DatabaseTest(unittest.TestCase):
         self.assertIsInstance(result, list)
         self.assertEqual(len(result), len(files))
 
+    def test_06_file_fingerprint(self) -> None:
+        """Test storing and looking up a File's Fingerprint"""
+        db = self.__class__.db
+        path: Final[str] = os.path.join(TST_FOLDER, "audio01.mp3")
+        known = db.file_get_fingerprint(path)
+        self.assertIsNotNone(known)
+        assert known is not None
+        self.assertEqual(known[1], Fingerprint(0, 0, 0))
+
+        f = db.file_get_by_id(known[0])
+        assert f is not None
+        fp = Fingerprint(1024, 1700000000123456789, 42)
+        with db:
+            db.file_set_fingerprint(f, fp)
+        self.assertEqual(f.fingerprint(), fp)
+        self.assertEqual(db.file_get_fingerprint(path), (f.file_id, fp))
+        self.assertIsNone(db.file_get_fingerprint("/no/such/file.mp3"))
+
+    def test_07_file_get_fingerprints_below(self) -> None:
+        """Test loading the Fingerprints of all Files below a directory"""
+        db = self.__class__.db
+        known = db.file_get_fingerprints_below(TST_FOLDER)
+        self.assertEqual(len(known), 10)
+        for path, info in known.items():
+            self.assertTrue(path.startswith(TST_FOLDER + "/"))
+            self.assertIsInstance(info[1], Fingerprint)
+        self.assertEqual(len(db.file_get_fingerprints_below("/tmp/")), 10)
+        self.assertEqual(len(db.file_get_fingerprints_below("/tmp/aud")), 0)
+
+    def test_08_add_many(self) -> None:
+        """Test adding Programs and Files in bulk"""
+        db = self.__class__.db
+        folder = db.folder_get_by_path(TST_FOLDER)
+        assert folder is not None
+        progs: list[Program] = [Program(title=f"Bulk {i}") for i in range(3)]
+        db.program_add_many(progs)
+        for p in progs:
+            self.assertGreater(p.program_id, 0)
+            stored = db.program_get_by_id(p.program_id)
+            assert stored is not None
+            self.assertEqual(stored.title, p.title)
+
+        # More files than fit into a single statement
+        count: Final[int] = database.BULK_CHUNK * 2 + 7
+        files: list[File] = [
+            File(
+                folder_id=folder.folder_id,
+                program_id=progs[i % len(progs)].program_id,
+                path=os.path.join(TST_FOLDER, "bulk", f"bulk{i:04d}.mp3"),
+                title=f"Bulk file {i}",
+                ord2=i,
+            ) for i in range(count)]
+        db.file_add_many(files)
+        for f in files:
+            stored = db.file_get_by_id(f.file_id)
+            assert stored is not None
+            self.assertEqual(stored.path, f.path)
+            self.assertEqual(stored.title, f.title)
+        total = sum(len(db.file_get_by_program(p.program_id)) for p in progs)
+        self.assertEqual(total, count)
+
+    def test_09_relink_delete_many(self) -> None:
+        """Test moving a File and removing Files in bulk"""
+        db = self.__class__.db
+        old_path: Final[str] = os.path.join(TST_FOLDER, "audio02.mp3")
+        new_path: Final[str] = os.path.join(TST_FOLDER, "moved", "audio02.mp3")
+        f = db.file_get_by_path(old_path)
+        assert f is not None
+        fp = Fingerprint(2048, 1700000000000000000, 4711)
+        with db:
+            db.file_set_position(f, 300)
+            db.file_relink(f.file_id, f.folder_id, new_path, fp)
+        self.assertIsNone(db.file_get_by_path(old_path))
+        moved = db.file_get_by_path(new_path)
+        assert moved is not None
+        self.assertEqual(moved.file_id, f.file_id)
+        self.assertEqual(moved.position, 300)
+        self.assertEqual(db.file_get_fingerprint(new_path), (f.file_id, fp))
+
+        bulk = db.file_get_fingerprints_below(os.path.join(TST_FOLDER, "bulk"))
+        db.file_delete_many([info[0] for info in bulk.values()])
+        self.assertEqual(
+            len(db.file_get_fingerprints_below(os.path.join(TST_FOLDER, "bulk"))),  # noqa: E501 # pylint: disable-msg=C0301
+            0)
+
+    def test_10_pool(self) -> None:
+        """Test sharing Databases through a Pool"""
+        pool = database.Pool(common.path.db(), readers=2)
+        path: Final[str] = os.path.join(TST_FOLDER, "audio01.mp3")
+        with pool.writer() as db:
+            f = db.file_get_by_path(path)
+            assert f is not None
+            with db:
+                db.file_set_title(f, "Pooled")
+            # The writer can be checked out again by the same thread.
+            with pool.writer() as db2:
+                self.assertIs(db2, db)
+
+        r1 = pool.checkout()
+        r2 = pool.checkout()
+        self.assertIsNot(r1, r2)
+        self.assertIsNot(r1, pool.write_db)
+        stored = r1.file_get_by_path(path)
+        assert stored is not None
+        self.assertEqual(stored.title, "Pooled")
+        with self.assertRaises(sqlite3.OperationalError):
+            r2.file_set_title(stored, "Nope")
+        pool.checkin(r1)
+        pool.checkin(r2)
+
+        # Connections can be used by whichever thread checks them out.
+        titles: list[str] = []
+
+        def read_title() -> None:
+            with pool.reader() as db:
+                f = db.file_get_by_path(path)
+                assert f is not None
+                titles.append(f.title)
+
+        threads = [Thread(target=read_title) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(titles, ["Pooled"] * 4)
+        pool.close()
+
+    def test_11_stream_and_page(self) -> None:
+        """Test streaming and paginating Files"""
+        db = self.__class__.db
+        folder = db.folder_get_by_path(TST_FOLDER)
+        assert folder is not None
+        prog = Program(title="Paged")
+        files: list[File] = [
+            File(
+                folder_id=folder.folder_id,
+                path=os.path.join(TST_FOLDER, "paged", f"paged{i:03d}.mp3"),
+                # Plenty of Files that only differ by their path
+                ord1=i % 3,
+                ord2=i % 2,
+            ) for i in range(57)]
+        with db:
+            db.program_add(prog)
+            for f in files:
+                f.program_id = prog.program_id
+            db.file_add_many(files)
+
+        expect = [f.file_id for f in db.file_get_by_program(prog.program_id)]
+        self.assertEqual(len(expect), len(files))
+        streamed = [f.file_id for f in db.file_iter_by_program(prog.program_id, batch=10)]  # noqa: E501 # pylint: disable-msg=C0301
+        self.assertEqual(streamed, expect)
+
+        paged: list[int] = []
+        page: list[File] = db.file_get_by_program_page(prog.program_id, limit=10)  # noqa: E501 # pylint: disable-msg=C0301
+        while len(page) > 0:
+            self.assertLessEqual(len(page), 10)
+            paged.extend(f.file_id for f in page)
+            page = db.file_get_by_program_page(prog.program_id,
+                                               after=page[-1],
+                                               limit=10)
+        self.assertEqual(paged, expect)
+
+        no_prog = [f.file_id for f in db.file_get_no_program()]
+        self.assertEqual([f.file_id for f in db.file_iter_no_program(batch=1)],
+                         no_prog)
+        self.assertEqual([f.file_id for f in db.file_get_no_program_page(limit=1)],  # noqa: E501 # pylint: disable-msg=C0301
+                         no_prog[:1])
+        self.assertEqual([p.program_id for p in db.program_iter_all(batch=2)],
+                         [p.program_id for p in db.program_get_all()])
+        self.assertEqual([f.folder_id for f in db.folder_iter_all()],
+                         [f.folder_id for f in db.folder_get_all()])
+
+    def test_12_get_by_ids(self) -> None:
+        """Test fetching Programs and Files by a list of IDs"""
+        db = self.__class__.db
+        progs = db.program_get_all()
+        pids: list[int] = [p.program_id for p in progs]
+        self.assertEqual(
+            sorted(p.program_id for p in db.program_get_by_ids(pids + [-1])),
+            sorted(pids))
+
+        prog = db.program_get_by_title("Paged")
+        assert prog is not None
+        files = db.file_get_by_program(prog.program_id)
+        fids: list[int] = [f.file_id for f in files]
+        # More IDs than fit into a single query
+        with patch("vox.database.BULK_CHUNK", 10), db:
+            fetched = db.file_get_by_ids(fids + [-1])
+        self.assertEqual(sorted((f.file_id, f.path) for f in fetched),
+                         sorted((f.file_id, f.path) for f in files))
+        self.assertEqual(db.file_get_by_ids([]), [])
+
+    def test_13_search(self) -> None:
+        """Test searching for Programs and Files"""
+        db = self.__class__.db
+        folder = db.folder_get_by_path(TST_FOLDER)
+        assert folder is not None
+        prog = Program(title="Die Scheibenwelt", creator="Terry Pratchett")
+        with db:
+            db.program_add(prog)
+            files: list[File] = [
+                File(folder_id=folder.folder_id,
+                     program_id=prog.program_id,
+                     path=os.path.join(TST_FOLDER, "discworld", name),
+                     title=title)
+                for name, title in (("01.mp3", "Die Farben der Magie"),
+                                    ("02.mp3", "Das Licht der Phantasie"),
+                                    ("03.mp3", "Das Erbe des Zauberers"),
+                                    ("magie.mp3", ""))]
+            db.file_add_many(files)
+
+        progs, found = db.search("prat")
+        self.assertEqual([p.program_id for p in progs], [prog.program_id])
+        self.assertEqual(len(found), 0)
+
+        # A match in the title ranks above one in the path.
+        _, found = db.search("Magie")
+        self.assertEqual([f.path for f in found],
+                         [files[0].path, files[3].path])
+
+        _, found = db.search("das ZAUB")
+        self.assertEqual([f.file_id for f in found], [files[2].file_id])
+
+        with db:
+            db.file_set_title(files[1], "Das Licht der Fantasie")
+            db.file_delete(files[2])
+        self.assertEqual(db.search("phant"), ([], []))
+        self.assertEqual(db.search("Zauberers"), ([], []))
+        _, found = db.search("fantasie")
+        self.assertEqual([f.file_id for f in found], [files[1].file_id])
+
+        # Nothing we could search for, no matter the quotes
+        self.assertEqual(db.search(' "*- '), ([], []))
+        _, found = db.search('"licht')
+        self.assertEqual(len(found), 1)
+        self.assertEqual(len(db.search("der", limit=1)[1]), 1)
+
+    def test_14_snapshot(self) -> None:
+        """Test that readers see a stable snapshot while others write"""
+        pool = database.Pool(common.path.db(), readers=1)
+        folder = self.__class__.db.folder_get_by_path(TST_FOLDER)
+        assert folder is not None
+        path: Final[str] = os.path.join(TST_FOLDER, "snapshot.mp3")
+        with pool.reader() as rdb:
+            before = len(rdb.file_get_by_folder(folder))
+            self.assertIsNone(rdb.file_get_by_path(path))
+            # Writing does not have to wait for the reader to finish.
+            with pool.writer() as wdb, wdb:
+                wdb.file_add(File(folder_id=folder.folder_id, path=path))
+            self.assertEqual(len(rdb.file_get_by_folder(folder)), before)
+            self.assertIsNone(rdb.file_get_by_path(path))
+        with pool.reader() as rdb:
+            self.assertEqual(len(rdb.file_get_by_folder(folder)), before + 1)
+            self.assertIsNotNone(rdb.file_get_by_path(path))
+        pool.close()
+
+    def test_15_changes(self) -> None:
+        """Test that committed changes are published"""
+        db = self.__class__.db
+        folder = db.folder_get_by_path(TST_FOLDER)
+        assert folder is not None
+        seen: list[list[database.Change]] = []
+        database.subscribe(db.path, seen.append)
+        try:
+            prog = Program(title="Changes")
+            f = File(folder_id=folder.folder_id,
+                     path=os.path.join(TST_FOLDER, "changes.mp3"))
+            with db:
+                db.program_add(prog)
+                db.file_add(f)
+                db.file_set_program(f, prog.program_id)
+                self.assertEqual(seen, [])
+            self.assertEqual(seen, [[
+                database.Change(database.ChangeKind.ProgramAdd, prog.program_id),  # noqa: E501 # pylint: disable-msg=C0301
+                database.Change(database.ChangeKind.FileAdd, f.file_id),
+                database.Change(database.ChangeKind.FileUpdate, f.file_id),
+            ]])
+
+            # Nothing that is rolled back is published.
+            seen.clear()
+            with self.assertRaises(ValueError):
+                with db:
+                    db.file_set_title(f, "Never mind")
+                    raise ValueError("Roll back")
+            self.assertEqual(seen, [])
+
+            # Outside of a transaction, changes are published right away.
+            db.file_delete(f)
+            self.assertEqual(seen, [[database.Change(database.ChangeKind.FileDel, f.file_id)]])  # noqa: E501 # pylint: disable-msg=C0301
+        finally:
+            database.unsubscribe(db.path, seen.append)
+
+
+# The index each query is expected to use, an empty string for queries that
+# read a whole table or just insert. No query may sort its results in a
+# temporary B-tree or scan the file table.
+QUERY_PLANS: Final[dict[database.QueryID, str]] = {
+    database.QueryID.ProgramAdd: "",
+    database.QueryID.ProgramAddMany: "",
+    database.QueryID.ProgramDel: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramGetAll: "",
+    database.QueryID.ProgramGetByID: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramGetByIDs: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramGetByTitle: "sqlite_autoindex_program_1",
+    database.QueryID.ProgramSetTitle: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramSetURL: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramSetCreator: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramSetCurFile: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramSetCover: "INTEGER PRIMARY KEY",
+    database.QueryID.FileAdd: "",
+    database.QueryID.FileAddMany: "",
+    database.QueryID.FileDel: "INTEGER PRIMARY KEY",
+    database.QueryID.FileRelink: "INTEGER PRIMARY KEY",
+    database.QueryID.FileGetByID: "INTEGER PRIMARY KEY",
+    database.QueryID.FileGetByIDs: "INTEGER PRIMARY KEY",
+    database.QueryID.FileGetByPath: "sqlite_autoindex_file_1",
+    database.QueryID.FileGetByFolder: "file_folder_ord_idx",
+    database.QueryID.FileGetByProgram: "file_prog_ord_idx",
+    database.QueryID.FileGetNoProgram: "file_prog_ord_idx",
+    database.QueryID.FileGetByProgramPage: "file_prog_ord_idx (program_id=? AND (ord1,ord2,title,path)>(?,?,?,?))",  # noqa: E501 # pylint: disable-msg=C0301
+    database.QueryID.FileGetNoProgramPage: "file_prog_ord_idx (program_id=? AND (ord1,ord2,title,path)>(?,?,?,?))",  # noqa: E501 # pylint: disable-msg=C0301
+    database.QueryID.FileGetFingerprint: "sqlite_autoindex_file_1",
+    database.QueryID.FileGetFingerprintsBelow: "sqlite_autoindex_file_1 (path>? AND path<?)",  # noqa: E501 # pylint: disable-msg=C0301
+    database.QueryID.FileSetTitle: "INTEGER PRIMARY KEY",
+    database.QueryID.FileSetPosition: "INTEGER PRIMARY KEY",
+    database.QueryID.FileSetProgram: "INTEGER PRIMARY KEY",
+    database.QueryID.FileSetOrd: "INTEGER PRIMARY KEY",
+    database.QueryID.FileSetFingerprint: "INTEGER PRIMARY KEY",
+    database.QueryID.ProgramSearch: "program_fts VIRTUAL TABLE",
+    database.QueryID.FileSearch: "file_fts VIRTUAL TABLE",
+    database.QueryID.FolderAdd: "",
+    database.QueryID.FolderGetAll: "",
+    database.QueryID.FolderGetByPath: "sqlite_autoindex_folder_1",
+    database.QueryID.FolderGetByID: "INTEGER PRIMARY KEY",
+    database.QueryID.FolderUpdateScan: "INTEGER PRIMARY KEY",
+}
+
+
+class QueryPlanTest(unittest.TestCase):
+    """Test that our queries use the indexes they are supposed to"""
+
+    folder: str
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Prepare the test environment."""
+        stamp = datetime.now()
+        folder_name = stamp.strftime("vox_test_query_plan_%Y%m%d_%H%M%S")
+        cls.folder = os.path.join(TEST_ROOT, folder_name)
+        common.set_basedir(cls.folder)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Clean up after testing."""
+        os.system(f"/bin/rm -rf {cls.folder}")
+
+    def check_plans(self, db: sqlite3.Connection) -> None:
+        """Check the plan of every query against QUERY_PLANS"""
+        self.assertEqual(set(QUERY_PLANS), set(database.QueryID))
+        for qid, expect in QUERY_PLANS.items():
+            # Programs are inserted with three values per row, Files with ten.
+            width: int = 3 if qid == database.QueryID.ProgramAddMany else 10
+            query: str = database.db_queries[qid].format(
+                values="(" + ", ".join("?" * width) + ")",
+                ids="?, ?",
+                after=database.FILE_PAGE_KEY)
+            cur: sqlite3.Cursor = db.execute("EXPLAIN QUERY PLAN " + query,
+                                             (None, ) * query.count("?"))
+            plan: list[str] = [row[3] for row in cur.fetchall()]
+            with self.subTest(query=qid.name, plan=plan):
+                self.assertIn(expect, "\n".join(plan))
+                for step in plan:
+                    self.assertNotIn("TEMP B-TREE", step)
+                    self.assertNotRegex(step, r"^SCAN (file|f)\b")
+
+    def test_01_plans(self) -> None:
+        """Test the query plans of a new database"""
+        db = database.Database(common.path.db())
+        self.check_plans(db.db)
+        db.db.close()
+
+    def test_02_upgrade(self) -> None:
+        """Test the query plans of a database created by an older version"""
+        path: Final[str] = os.path.join(self.__class__.folder, "old.db")
+        make_legacy_db(path)
+        db = database.Database(path)
+        self.assertEqual(db.schema_version(), database.SCHEMA_VERSION)
+        cur: sqlite3.Cursor = db.db.execute("PRAGMA table_info(file)")
+        columns: set[str] = {row[1] for row in cur.fetchall()}
+        self.assertTrue({"size", "mtime", "inode", "digest"} <= columns)
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        indexes: set[str] = {row[0] for row in cur.fetchall()}
+        self.assertIn("file_prog_ord_idx", indexes)
+        self.assertNotIn("file_prog_idx", indexes)
+        self.assertNotIn("file_path_idx", indexes)
+        self.check_plans(db.db)
+        # The Files are only found once the full-text index is filled in.
+        self.assertEqual(db.search("audio 07"), ([], []))
+        self.assertTrue(db.backfill())
+        _, files = db.search("audio 07")
+        self.assertEqual([f.path for f in files], ["/tmp/audio/07.mp3"])
+        db.db.close()
+
+
+def make_legacy_db(path: str) -> None:
+    """Create a database the way the first release of vox did"""
+    con = sqlite3.connect(path, isolation_level=None)
+    for query in database.INIT_QUERIES:
+        con.execute(query)
+    con.execute("DROP TABLE backfill")
+    for table in ("program", "file"):
+        for event in ("add", "del", "upd"):
+            con.execute(f"DROP TRIGGER {table}_fts_{event}")
+        con.execute(f"DROP TABLE {table}_fts")
+    con.execute("DROP INDEX file_prog_ord_idx")
+    con.execute("DROP INDEX file_folder_ord_idx")
+    for column in ("size", "mtime", "inode", "digest"):
+        con.execute(f"ALTER TABLE file DROP COLUMN {column}")
+    con.execute("CREATE UNIQUE INDEX prog_title_idx ON program (title)")
+    con.execute("CREATE INDEX file_prog_idx ON file (program_id)")
+    con.execute("CREATE INDEX file_path_idx ON file (path)")
+    con.execute("CREATE INDEX file_ord_index ON file (ord1, ord2)")
+    con.execute("CREATE INDEX pe_pl_idx ON playlist_entry (playlist_id)")
+    con.execute("INSERT INTO folder (path) VALUES ('/tmp/audio')")
+    con.executemany("INSERT INTO file (folder_id, path) VALUES (1, ?)",
+                    [(f"/tmp/audio/{i:02d}.mp3", ) for i in range(35)])
+    con.close()
+
+
+class MigrationTest(unittest.TestCase):
+    """Test upgrading the database schema"""
+
+    folder: str
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Prepare the test environment."""
+        stamp = datetime.now()
+        folder_name = stamp.strftime("vox_test_migration_%Y%m%d_%H%M%S")
+        cls.folder = os.path.join(TEST_ROOT, folder_name)
+        common.set_basedir(cls.folder)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Clean up after testing."""
+        os.system(f"/bin/rm -rf {cls.folder}")
+
+    def test_01_backfill(self) -> None:
+        """Test filling in a new column in chunks"""
+        path: Final[str] = os.path.join(self.__class__.folder, "vox.db")
+        db = database.Database(path)
+        folder = Folder(0, TST_FOLDER)
+        db.folder_add(folder)
+        db.file_add_many([File(folder_id=folder.folder_id,
+                               path=os.path.join(TST_FOLDER, f"{i:02d}.mp3"))
+                          for i in range(35)])
+        db.db.close()
+
+        step = database.Migration(
+            "Test backfill",
+            columns=(("file", "test", "INTEGER NOT NULL DEFAULT 0"), ),
+            backfill=database.Backfill(
+                "file",
+                "UPDATE file SET test = id WHERE id > ? AND id <= ?"))
+        migrations: list[database.Migration] = [*database.MIGRATIONS, step]
+        with patch.object(database, "MIGRATIONS", migrations), \
+                patch.object(database, "SCHEMA_VERSION", len(migrations)), \
+                patch.object(database, "BACKFILL_CHUNK", 10):
+            db = database.Database(path)
+            self.assertEqual(db.schema_version(), database.SCHEMA_VERSION)
+
+            def filled() -> int:
+                cur = db.db.execute("SELECT COUNT(*) FROM file WHERE test = id")  # noqa: E501 # pylint: disable-msg=C0301
+                return cur.fetchone()[0]
+
+            self.assertEqual(filled(), 0)
+            # A single chunk at least, no matter the budget
+            self.assertFalse(db.backfill(0))
+            self.assertEqual(filled(), 10)
+            db.db.close()
+
+            # Reopening the database resumes the backfill.
+            db = database.Database(path)
+            self.assertTrue(db.backfill(60))
+            self.assertEqual(filled(), 35)
+            cur = db.db.execute("SELECT COUNT(*) FROM backfill")
+            self.assertEqual(cur.fetchone()[0], 0)
+            self.assertTrue(db.backfill())
+            db.db.close()
+
 
 # Local Variables: #
 # python-indent: 4 #
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 17:41:53 krylon>
+#
+# /data/code/python/vox/test_position.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.test_position
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import unittest
+from datetime import datetime
+
+from vox import common, database
+from vox.data import File, Folder
+from vox.position import PositionBuffer
+
+TEST_ROOT: str = "/tmp/"
+
+if os.path.isdir("/data/ram"):
+    TEST_ROOT = "/data/ram"
+
+
+class PositionBufferTest(unittest.TestCase):
+    """Test buffering playback positions"""
+
+    folder: str
+    db: database.Database
+    files: list[File]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Prepare the test environment."""
+        stamp = datetime.now()
+        folder_name = stamp.strftime("vox_test_position_%Y%m%d_%H%M%S")
+        cls.folder = os.path.join(TEST_ROOT, folder_name)
+        common.set_basedir(cls.folder)
+        cls.db = database.Database(common.path.db())
+        folder = Folder(0, "/tmp/audio")
+        cls.files = [File(folder_id=0,
+                          path=f"/tmp/audio/pos{i:02d}.mp3")
+                     for i in range(3)]
+        with cls.db:
+            cls.db.folder_add(folder)
+            for f in cls.files:
+                f.folder_id = folder.folder_id
+            cls.db.file_add_many(cls.files)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Clean up after testing."""
+        os.system(f"/bin/rm -rf {cls.folder}")
+
+    def stored_position(self, f: File) -> int:
+        """Return the position of a File as it is stored in the database"""
+        stored = self.__class__.db.file_get_by_id(f.file_id)
+        assert stored is not None
+        return stored.position
+
+    def test_01_coalesce(self) -> None:
+        """Test that positions are only written when flushing"""
+        db = self.__class__.db
+        f0, f1, _ = self.__class__.files
+        buf = PositionBuffer(interval=3600)
+        for pos in range(1, 61):
+            buf.update(f0, pos)
+            buf.maybe_flush(db)
+        buf.update(f1, 42)
+        self.assertEqual(f0.position, 60)
+        self.assertEqual(self.stored_position(f0), 0)
+        buf.flush(db)
+        self.assertEqual(self.stored_position(f0), 60)
+        self.assertEqual(self.stored_position(f1), 42)
+        self.assertEqual(len(buf.pending), 0)
+
+    def test_02_interval(self) -> None:
+        """Test that positions are written once the interval has passed"""
+        db = self.__class__.db
+        f2 = self.__class__.files[2]
+        self.assertFalse(PositionBuffer(interval=3600).due())
+        buf = PositionBuffer(interval=0)
+        buf.update(f2, 1234)
+        self.assertTrue(buf.due())
+        buf.maybe_flush(db)
+        self.assertEqual(self.stored_position(f2), 1234)
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 18:02:11 krylon>
+#
+# /data/code/python/vox/test_scanner.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.test_scanner
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import sqlite3
+import struct
+import threading
+import unittest
+from datetime import datetime
+from typing import Final
+from unittest.mock import patch
+
+from vox import common, database, scanner
+from vox.data import File, Folder, Program
+
+TEST_ROOT: str = "/tmp/"
+
+if os.path.isdir("/data/ram"):
+    TEST_ROOT = "/data/ram"
+
+# Way back, so directories look like they have not changed since
+OLD_STAMP: Final[int] = 1_000_000_000
+
+
+def write_mp3(path: str, album: str, title: str, track: str, noise: int = 1000, in_place: bool = False) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+    """Write a file with an ID3v2.3 tag holding album, title and track
+    number, followed by noise bytes of fake audio data.
+
+    Unless in_place is True, an existing file is replaced through a rename,
+    the way applications that save atomically do, which modifies the
+    directory.
+    """
+    frames: bytes = b""
+    for fid, text in ((b"TALB", album), (b"TIT2", title), (b"TRCK", track)):
+        payload = b"\0" + text.encode("latin-1")
+        frames += fid + struct.pack(">I", len(payload)) + b"\0\0" + payload
+    size: Final[int] = len(frames)
+    header = b"ID3\x03\0\0" + bytes((size >> s) & 0x7f for s in (21, 14, 7, 0))  # noqa: E501 # pylint: disable-msg=C0301
+    tmp: Final[str] = path if in_place else path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(header + frames + b"\xff\xfb" * noise)
+    if not in_place:
+        os.rename(tmp, path)
+
+
+class ScannerTest(unittest.TestCase):
+    """Test scanning directory trees"""
+
+    folder: str
+    audio: str
+    sc: scanner.Scanner
+    ids: dict[str, int]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Prepare the test environment."""
+        stamp = datetime.now()
+        folder_name = stamp.strftime("vox_test_scanner_%Y%m%d_%H%M%S")
+        cls.folder = os.path.join(TEST_ROOT, folder_name)
+        common.set_basedir(cls.folder)
+        cls.audio = os.path.join(cls.folder, "audio")
+        cls.ids = {}
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Clean up after testing."""
+        os.system(f"/bin/rm -rf {cls.folder}")
+
+    def path(self, *parts: str) -> str:
+        """Return the full path of a file below the scanned folder."""
+        return os.path.join(self.__class__.audio, *parts)
+
+    def test_01_scan(self) -> None:
+        """Test scanning a folder for the first time"""
+        for d in ("book", "other"):
+            os.makedirs(self.path(d))
+        write_mp3(self.path("book", "01.mp3"), "Mort", "Chapter 1", "1/3")
+        write_mp3(self.path("book", "02.mp3"), "Mort", "Chapter 2", "2/3", 1100)  # noqa: E501 # pylint: disable-msg=C0301
+        write_mp3(self.path("other", "01.mp3"), "Eric", "Part 1", "1", 1200)
+        os.utime(self.path("other"), (OLD_STAMP, OLD_STAMP))
+
+        sc = scanner.Scanner(cache=False)
+        self.__class__.sc = sc
+        folder: Folder = sc.scan(self.__class__.audio)
+        self.assertGreater(folder.folder_id, 0)
+
+        files = sc.db.file_get_by_folder(folder)
+        self.assertEqual(len(files), 3)
+        for f in files:
+            self.__class__.ids[f.path] = f.file_id
+        f2 = sc.db.file_get_by_path(self.path("book", "02.mp3"))
+        self.assertIsNotNone(f2)
+        assert f2 is not None
+        self.assertEqual(f2.title, "Chapter 2")
+        self.assertEqual(f2.ord2, 2)
+
+    def test_02_rescan_changed(self) -> None:
+        """Test that a rescan only reads the files that have changed"""
+        sc = self.__class__.sc
+        changed: Final[str] = self.path("book", "02.mp3")
+        write_mp3(changed, "Mort", "Chapter Two", "5/3", 1050)
+
+        with patch("vox.scanner.inspect_file",
+                   wraps=scanner.inspect_file) as inspect:
+            sc.scan(self.__class__.audio)
+            self.assertEqual([c.args[0] for c in inspect.call_args_list],
+                             [changed])
+
+        f2 = sc.db.file_get_by_path(changed)
+        self.assertIsNotNone(f2)
+        assert f2 is not None
+        # The existing File has been updated, not replaced.
+        self.assertEqual(f2.file_id, self.__class__.ids[changed])
+        self.assertEqual(f2.title, "Chapter Two")
+        self.assertEqual(f2.ord2, 5)
+        fp = sc.db.file_get_fingerprint(changed)
+        self.assertIsNotNone(fp)
+        assert fp is not None
+        self.assertEqual(fp[1].size, os.stat(changed).st_size)
+
+        # Nothing has changed since.
+        with patch("vox.scanner.inspect_file",
+                   wraps=scanner.inspect_file) as inspect:
+            sc.scan(self.__class__.audio)
+            inspect.assert_not_called()
+
+    def test_03_move(self) -> None:
+        """Test that a moved file keeps its File"""
+        sc = self.__class__.sc
+        old: Final[str] = self.path("book", "01.mp3")
+        new: Final[str] = self.path("moved", "01.mp3")
+        os.makedirs(self.path("moved"))
+        os.rename(old, new)
+        sc.scan(self.__class__.audio)
+
+        self.assertIsNone(sc.db.file_get_by_path(old))
+        f = sc.db.file_get_by_path(new)
+        self.assertIsNotNone(f)
+        assert f is not None
+        self.assertEqual(f.file_id, self.__class__.ids[old])
+
+    def test_04_copy(self) -> None:
+        """Test that a copied file is added as a new File"""
+        sc = self.__class__.sc
+        orig: Final[str] = self.path("book", "02.mp3")
+        copy: Final[str] = self.path("moved", "02.mp3")
+        with open(orig, "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        sc.scan(self.__class__.audio)
+
+        f1 = sc.db.file_get_by_path(orig)
+        f2 = sc.db.file_get_by_path(copy)
+        self.assertIsNotNone(f1)
+        self.assertIsNotNone(f2)
+        assert f1 is not None and f2 is not None
+        self.assertEqual(f1.file_id, self.__class__.ids[orig])
+        self.assertNotEqual(f2.file_id, f1.file_id)
+        self.assertEqual(f2.title, f1.title)
+
+    def test_05_copy_bad_track(self) -> None:
+        """Test that a copy with a track number we cannot parse does not
+        spoil the rest of the scan
+        """
+        sc = self.__class__.sc
+        orig: Final[str] = self.path("book", "03.mp3")
+        copy: Final[str] = self.path("moved", "03.mp3")
+        moved: Final[str] = self.path("book", "04.mp3")
+        gone: Final[str] = self.path("other", "01.mp3")
+        write_mp3(orig, "Mort", "Chapter 3", "side A", 1300)
+        with open(orig, "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        # A File added before the track number got messed up
+        folder = sc.db.folder_get_by_path(self.__class__.audio)
+        assert folder is not None
+        with sc.db:
+            sc.db.file_add(File(
+                folder_id=folder.folder_id,
+                path=orig,
+                fingerprint=scanner.Fingerprint.from_stat(os.stat(orig)),
+                digest=scanner.content_digest(orig),
+                ord1=0,
+                ord2=3,
+                title="Chapter 3",
+            ))
+        # Other changes found by the same scan
+        os.rename(self.path("moved", "01.mp3"), moved)
+        os.remove(gone)
+
+        with self.assertLogs(sc.log, "ERROR"):
+            sc.scan(self.__class__.audio)
+
+        self.assertIsNone(sc.db.file_get_by_path(copy))
+        self.assertIsNotNone(sc.db.file_get_by_path(orig))
+        f = sc.db.file_get_by_path(moved)
+        self.assertIsNotNone(f)
+        assert f is not None
+        self.assertEqual(f.file_id, self.__class__.ids[self.path("book", "01.mp3")])  # noqa: E501 # pylint: disable-msg=C0301
+        self.assertIsNone(sc.db.file_get_by_path(gone))
+
+    def test_06_delete(self) -> None:
+        """Test that vanished files are removed"""
+        sc = self.__class__.sc
+        path: Final[str] = self.path("moved", "03.mp3")
+        os.remove(path)
+        os.remove(self.path("moved", "02.mp3"))
+        sc.scan(self.__class__.audio)
+        self.assertIsNone(sc.db.file_get_by_path(self.path("moved", "02.mp3")))  # noqa: E501 # pylint: disable-msg=C0301
+        self.assertIsNotNone(sc.db.file_get_by_path(self.path("book", "02.mp3")))  # noqa: E501 # pylint: disable-msg=C0301
+
+    def test_07_unmounted(self) -> None:
+        """Test that the Files of a Folder that has gone missing as a whole
+        are kept
+        """
+        sc = self.__class__.sc
+        audio: Final[str] = self.__class__.audio
+        folder = sc.db.folder_get_by_path(audio)
+        assert folder is not None
+        count: Final[int] = len(sc.db.file_get_by_folder(folder))
+        self.assertGreater(count, 0)
+
+        os.rename(audio, audio + ".away")
+        try:
+            sc.scan(audio)
+            self.assertEqual(len(sc.db.file_get_by_folder(folder)), count)
+            # An empty directory, like a mount point with nothing mounted
+            os.mkdir(audio)
+            sc.scan(audio, full=True)
+            self.assertEqual(len(sc.db.file_get_by_folder(folder)), count)
+        finally:
+            os.system(f"/bin/rm -rf {audio}")
+            os.rename(audio + ".away", audio)
+
+    def test_08_parallel_failure(self) -> None:
+        """Test that a parallel scan that fails does not leave its threads
+        behind
+        """
+        root: Final[str] = os.path.join(self.__class__.folder, "parallel")
+        os.makedirs(root)
+        for i in range(20):
+            write_mp3(os.path.join(root, f"{i:02d}.mp3"), "Pyramids", f"Part {i}", str(i), 1000 + i)  # noqa: E501 # pylint: disable-msg=C0301
+
+        sc = scanner.Scanner(workers=2, cache=False)
+        err: Final[sqlite3.Error] = sqlite3.OperationalError("database is locked")  # noqa: E501 # pylint: disable-msg=C0301
+        # Small queues, so the walker and the parser get stuck if we stop
+        # taking their results.
+        with patch("vox.scanner.QUEUE_SIZE", 1), \
+                patch("vox.scanner.POOL_DEPTH", 1), \
+                patch.object(scanner.Scanner, "_Scanner__queue",
+                             side_effect=err), \
+                self.assertRaises(sqlite3.OperationalError):
+            sc.scan(root)
+
+        stages = [t.name for t in threading.enumerate()
+                  if t.name in ("scan-walk", "scan-parse")]
+        self.assertEqual(stages, [])
+
+    def test_09_rewrite_in_place(self) -> None:
+        """Test that a full rescan picks up a file that has been rewritten
+        in place
+        """
+        sc = self.__class__.sc
+        path: Final[str] = self.path("book", "02.mp3")
+        inode: Final[int] = os.stat(path).st_ino
+        write_mp3(path, "Mort", "Chapter II", "2/3", 1075, in_place=True)
+        self.assertEqual(os.stat(path).st_ino, inode)
+        os.utime(self.path("book"), (OLD_STAMP, OLD_STAMP))
+
+        sc.scan(self.__class__.audio, full=True)
+        f = sc.db.file_get_by_path(path)
+        self.assertIsNotNone(f)
+        assert f is not None
+        self.assertEqual(f.file_id, self.__class__.ids[path])
+        self.assertEqual(f.title, "Chapter II")
+
+    def test_10_program_clash(self) -> None:
+        """Test that a scan copes with someone else adding a Program with
+        the same title while it is running
+        """
+        root: Final[str] = os.path.join(self.__class__.folder, "clash")
+        os.makedirs(root)
+        for i in range(3):
+            write_mp3(os.path.join(root, f"{i:02d}.mp3"), "Small Gods", f"Part {i}", str(i), 1000 + i)  # noqa: E501 # pylint: disable-msg=C0301
+        other: Final[database.Database] = database.Database(common.path.db())
+        prog: Final[Program] = Program(title="Small Gods", creator="", url="")
+        real_inspect: Final = scanner.inspect_file
+
+        def inspect(path: str) -> tuple:
+            if prog.program_id == 0:
+                with other:
+                    other.program_add(prog)
+            return real_inspect(path)
+
+        sc = scanner.Scanner(cache=False)
+        with patch("vox.scanner.inspect_file", side_effect=inspect), \
+                self.assertNoLogs(sc.log, "ERROR"):
+            folder = sc.scan(root)
+
+        files = sc.db.file_get_by_folder(folder)
+        self.assertEqual(len(files), 3)
+        self.assertGreater(prog.program_id, 0)
+        for f in files:
+            self.assertEqual(f.program_id, prog.program_id)
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 16:52:40 krylon>
+#
+# /data/code/python/vox/test_tagcache.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.test_tagcache
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import unittest
+from datetime import datetime
+from typing import Final
+
+from vox import common
+from vox.data import Fingerprint
+from vox.tagcache import TagCache
+
+TEST_ROOT: str = "/tmp/"
+
+if os.path.isdir("/data/ram"):
+    TEST_ROOT = "/data/ram"
+
+TAGS: Final[dict[str, str]] = {
+    "artist": "Terry Pratchett",
+    "album": "Guards! Guards!",
+    "ord2": "7/20",
+}
+
+
+class TagCacheTest(unittest.TestCase):
+    """Test the tag cache"""
+
+    folder: str
+    cache: TagCache
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Prepare the test environment."""
+        stamp = datetime.now()
+        folder_name = \
+            stamp.strftime("vox_test_tagcache_%Y%m%d_%H%M%S")
+        cls.folder = os.path.join(TEST_ROOT, folder_name)
+        common.set_basedir(cls.folder)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Clean up after testing."""
+        os.system(f"/bin/rm -rf {cls.folder}")
+
+    def test_01_open(self) -> None:
+        """Test creating the cache"""
+        path = os.path.join(self.__class__.folder, "cache", "tags.db")
+        c = TagCache(path, max_entries=10)
+        self.assertIsNotNone(c)
+        self.__class__.cache = c
+        self.assertTrue(os.path.isfile(path))
+
+    def test_02_put_get(self) -> None:
+        """Test adding and looking up entries"""
+        c = self.__class__.cache
+        path = os.path.join(self.__class__.folder, "a.mp3")
+        fp = Fingerprint(1024, 1_000_000, 42)
+        self.assertIsNone(c.get(path, fp))
+        c.put(path, fp, TAGS, "abcd")
+        c.put(path + "x", Fingerprint(0, 0, 43), None, "")
+        c.flush()
+        self.assertEqual(c.get(path, fp), (TAGS, "abcd"))
+        # Files that could not be read are cached, too.
+        self.assertEqual(c.get(path + "x", Fingerprint(0, 0, 43)), (None, ""))
+        # A modified file is not found.
+        self.assertIsNone(c.get(path, fp._replace(mtime=2_000_000)))
+        self.assertIsNone(c.get(path, fp._replace(size=2048)))
+
+    def test_03_evict(self) -> None:
+        """Test that the least recently used entries are evicted"""
+        c = self.__class__.cache
+        path = os.path.join(self.__class__.folder, "b.mp3")
+        for i in range(20):
+            c.put(path, Fingerprint(i, i, 1000 + i), TAGS, str(i))
+        c.flush()
+        self.assertEqual(c.count, 10)
+        self.assertIsNone(c.get(path, Fingerprint(0, 0, 1000)))
+        self.assertIsNotNone(c.get(path, Fingerprint(19, 19, 1019)))
+
+    def test_04_reopen(self) -> None:
+        """Test that entries survive reopening the cache"""
+        c = self.__class__.cache
+        c.close()
+        c = TagCache(c.path, max_entries=10)
+        path = os.path.join(self.__class__.folder, "b.mp3")
+        self.assertEqual(c.count, 10)
+        self.assertEqual(c.get(path, Fingerprint(19, 19, 1019)), (TAGS, "19"))
+        c.close()
+
+    def test_05_failed_put(self) -> None:
+        """Test that a put that fails does not spoil the ones after it"""
+        c = TagCache(self.__class__.cache.path, max_entries=10)
+        path = os.path.join(self.__class__.folder, "c.mp3")
+        fp = Fingerprint(4096, 3_000_000, 44)
+        with self.assertLogs(c.log, "ERROR"):
+            # The digest must not be NULL.
+            c.put(path, fp, TAGS, None)  # type: ignore
+        c.put(path, fp, TAGS, "efgh")
+        c.close()
+        c = TagCache(c.path, max_entries=10)
+        self.assertEqual(c.get(path, fp), (TAGS, "efgh"))
+        c.close()
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 15:48:12 krylon>
+#
+# /data/code/python/vox/test_tagreader.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.test_tagreader
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+from typing import Final, NamedTuple, Optional
+
+from vox import tagreader
+
+# A cover image, or some other blob our reader is supposed to skip
+BLOB: Final[bytes] = b"\xff" * (2 * tagreader.READ_BUDGET)
+
+EXPECT: Final[dict[str, str]] = {
+    "artist": "Douglas Adams",
+    "album": "Per Anhalter durch die Galaxis",
+    "title": "Kapitel 3",
+    "ord1": "1/2",
+    "ord2": "3/12",
+}
+
+
+def id3_frame(fid: bytes, payload: bytes, major: int) -> bytes:
+    """Build an ID3v2.3 or ID3v2.4 frame"""
+    size: int = len(payload)
+    if major == 4:
+        size_bytes = bytes((size >> s) & 0x7f for s in (21, 14, 7, 0))
+    else:
+        size_bytes = struct.pack(">I", size)
+    return fid + size_bytes + b"\0\0" + payload
+
+
+def id3_tag(major: int) -> bytes:
+    """Build an ID3v2 tag with a large picture in front of the text frames"""
+    enc: Final[bytes] = b"\x03" if major == 4 else b"\x01"
+    codec: Final[str] = "utf-8" if major == 4 else "utf-16"
+    frames = id3_frame(b"APIC", BLOB, major)
+    for fid, field in ((b"TPE1", "artist"),
+                       (b"TALB", "album"),
+                       (b"TIT2", "title"),
+                       (b"TPOS", "ord1"),
+                       (b"TRCK", "ord2")):
+        frames += id3_frame(fid, enc + EXPECT[field].encode(codec), major)
+    frames += b"\0" * 64  # padding
+    size: Final[int] = len(frames)
+    header = b"ID3" + bytes([major, 0, 0]) + \
+        bytes((size >> s) & 0x7f for s in (21, 14, 7, 0))
+    return header + frames
+
+
+def vorbis_comment() -> bytes:
+    """Build a Vorbis comment block"""
+    comments: list[bytes] = [
+        f"ARTIST={EXPECT['artist']}".encode(),
+        f"Album={EXPECT['album']}".encode(),
+        f"title={EXPECT['title']}".encode(),
+        f"DISCNUMBER={EXPECT['ord1']}".encode(),
+        f"TRACKNUMBER={EXPECT['ord2']}".encode(),
+        b"COMMENT=ignore me",
+    ]
+    vendor: Final[bytes] = b"vox test"
+    data = struct.pack("<I", len(vendor)) + vendor + \
+        struct.pack("<I", len(comments))
+    for c in comments:
+        data += struct.pack("<I", len(c)) + c
+    return data
+
+
+def flac_block(btype: int, payload: bytes, last: bool) -> bytes:
+    """Build a FLAC metadata block"""
+    return bytes([btype | (0x80 if last else 0)]) + \
+        len(payload).to_bytes(3, "big") + payload
+
+
+def flac_file() -> bytes:
+    """Build a FLAC header with a picture in front of the comment"""
+    return b"fLaC" + \
+        flac_block(0, b"\0" * 34, False) + \
+        flac_block(6, BLOB[:0xffffff], False) + \
+        flac_block(4, vorbis_comment(), True) + \
+        b"\xff\xf8" * 100
+
+
+def ogg_pages(packets: list[bytes]) -> bytes:
+    """Put each packet on its own Ogg page(s)"""
+    data: bytes = b""
+    seq: int = 0
+    for packet in packets:
+        lacing = [255] * (len(packet) // 255) + [len(packet) % 255]
+        while len(lacing) > 0:
+            page, lacing = lacing[:255], lacing[255:]
+            body, packet = packet[:sum(page)], packet[sum(page):]
+            data += b"OggS\0" + bytes([2 if seq == 0 else 0]) + \
+                b"\0" * 8 + b"\x01\0\0\0" + struct.pack("<I", seq) + \
+                b"\0" * 4 + bytes([len(page)]) + bytes(page) + body
+            seq += 1
+    return data
+
+
+def mp4_atom(atype: bytes, payload: bytes) -> bytes:
+    """Build an MP4 atom"""
+    return struct.pack(">I", len(payload) + 8) + atype + payload
+
+
+def mp4_file() -> bytes:
+    """Build an MP4 file with the media data in front of the metadata"""
+    def text(atype: bytes, val: str) -> bytes:
+        return mp4_atom(atype, mp4_atom(b"data", b"\0\0\0\x01\0\0\0\0" + val.encode()))  # noqa: E501 # pylint: disable-msg=C0301
+
+    trkn: Final[bytes] = b"\0" * 8 + struct.pack(">HHHH", 0, 3, 12, 0)
+    disk: Final[bytes] = b"\0" * 8 + struct.pack(">HHH", 0, 1, 2)
+    ilst = text(b"\xa9ART", EXPECT["artist"]) + \
+        text(b"\xa9alb", EXPECT["album"]) + \
+        text(b"\xa9nam", EXPECT["title"]) + \
+        mp4_atom(b"trkn", mp4_atom(b"data", trkn)) + \
+        mp4_atom(b"disk", mp4_atom(b"data", disk))
+    meta = mp4_atom(b"meta",
+                    b"\0\0\0\0" + mp4_atom(b"hdlr", b"\0" * 25) + mp4_atom(b"ilst", ilst))  # noqa: E501 # pylint: disable-msg=C0301
+    moov = mp4_atom(b"moov",
+                    mp4_atom(b"mvhd", b"\0" * 100) + mp4_atom(b"udta", meta))
+    return mp4_atom(b"ftyp", b"M4B \0\0\0\0") + mp4_atom(b"mdat", BLOB) + moov
+
+
+class TagTestData(NamedTuple):
+    """Data for a single test of reading tags"""
+
+    name: str
+    content: bytes
+    expect: Optional[dict[str, str]]
+
+
+test_cases: list[TagTestData] = [
+    TagTestData("v23.mp3", id3_tag(3) + b"\xff\xfb" * 100, EXPECT),
+    TagTestData("v24.mp3", id3_tag(4) + b"\xff\xfb" * 100, EXPECT),
+    TagTestData("test.flac", flac_file(), EXPECT),
+    TagTestData("id3.flac", id3_tag(3) + flac_file(), EXPECT),
+    TagTestData("test.ogg",
+                ogg_pages([b"\x01vorbis" + b"\0" * 23,
+                           b"\x03vorbis" + vorbis_comment() + b"\x01",
+                           b"\0" * 100]),
+                EXPECT),
+    TagTestData("test.opus",
+                ogg_pages([b"OpusHead" + b"\0" * 11,
+                           b"OpusTags" + vorbis_comment()]),
+                EXPECT),
+    TagTestData("test.m4b",
+                mp4_file(),
+                dict(EXPECT, ord1="1", ord2="3")),
+    TagTestData("noise.mp3", b"\xff\xfb" * 1000, None),
+    TagTestData("huge.opus",
+                ogg_pages([b"OpusHead" + b"\0" * 11,
+                           b"OpusTags" + vorbis_comment() + BLOB]),
+                None),
+]
+
+
+class TagReaderTest(unittest.TestCase):
+    """Test reading tags from file headers"""
+
+    folder: str
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Prepare the test environment."""
+        cls.folder = tempfile.mkdtemp(prefix="vox_test_tagreader_")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Clean up after testing."""
+        os.system(f"/bin/rm -rf {cls.folder}")
+
+    def test_read_tags(self) -> None:
+        """Test reading tags from various formats"""
+        for c in test_cases:
+            path = os.path.join(self.__class__.folder, c.name)
+            with open(path, "wb") as fh:
+                fh.write(c.content)
+            with self.subTest(name=c.name):
+                self.assertEqual(tagreader.read_tags(path), c.expect)
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
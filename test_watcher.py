@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 18:31:40 krylon>
+#
+# /data/code/python/vox/test_watcher.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.test_watcher
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import math
+import os
+import sqlite3
+import unittest
+from datetime import datetime
+from typing import Final, Optional
+from unittest.mock import Mock, patch
+
+from vox import common, scanner, watcher
+from vox.data import Folder
+from vox.test_scanner import write_mp3
+from vox.watcher import (IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_ISDIR,
+                         IN_MOVED_FROM, IN_MOVED_TO, IN_Q_OVERFLOW)
+
+TEST_ROOT: str = "/tmp/"
+
+if os.path.isdir("/data/ram"):
+    TEST_ROOT = "/data/ram"
+
+ROOT: Final[str] = "/srv/audio"
+
+
+class FakeInotify:
+    """Stands in for Inotify, hands out a scripted list of events.
+
+    Each step of the script is the time at which a call to read returns, and
+    the events it returns. Once the script is used up, the Watcher is told to
+    stop.
+    """
+
+    def __init__(self, w: watcher.Watcher, script: list[tuple[float, list[tuple[int, str]]]]) -> None:  # noqa: E501 # pylint: disable-msg=C0301
+        self.watcher = w
+        self.script = script
+        self.now: float = 0.0
+        self.added: list[str] = []
+        self.removed: list[str] = []
+
+    def clock(self) -> float:
+        """Return the fake time, some time after the system has booted."""
+        return 1000.0 + self.now
+
+    def read(self, _timeout: float) -> list[tuple[int, str]]:
+        """Return the next batch of events."""
+        if len(self.script) == 0:
+            self.watcher.quit.set()
+            return []
+        self.now, events = self.script.pop(0)
+        return events
+
+    def add_tree(self, root: str) -> None:
+        """Record a directory to watch."""
+        self.added.append(root)
+
+    def remove_tree(self, root: str) -> None:
+        """Record a directory to stop watching."""
+        self.removed.append(root)
+
+
+def run_watch(script: list[tuple[float, list[tuple[int, str]]]], sc: Optional[Mock] = None) -> tuple[Mock, FakeInotify]:  # noqa: E501 # pylint: disable-msg=C0301
+    """Feed the events in script to a Watcher, return the Scanner stand-in
+    it used.
+    """
+    w = watcher.Watcher()
+    w.folders = [Folder(1, ROOT)]
+    if sc is None:
+        sc = Mock()
+    ino = FakeInotify(w, script)
+    with patch("vox.watcher.time") as clock:
+        clock.monotonic.side_effect = ino.clock
+        w._Watcher__watch(sc, ino)  # pylint: disable-msg=W0212
+    return sc, ino
+
+
+class WatcherTest(unittest.TestCase):
+    """Test the Watcher and the Scanner's handling of individual changes"""
+
+    folder: str
+    audio: str
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Prepare the test environment."""
+        stamp = datetime.now()
+        folder_name = stamp.strftime("vox_test_watcher_%Y%m%d_%H%M%S")
+        cls.folder = os.path.join(TEST_ROOT, folder_name)
+        common.set_basedir(cls.folder)
+        cls.audio = os.path.join(cls.folder, "audio")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Clean up after testing."""
+        os.system(f"/bin/rm -rf {cls.folder}")
+
+    def test_01_update(self) -> None:
+        """Test applying changes to individual paths"""
+        audio: Final[str] = self.__class__.audio
+        book: Final[str] = os.path.join(audio, "book")
+        os.makedirs(book)
+        write_mp3(os.path.join(book, "01.mp3"), "Sourcery", "One", "1")
+        write_mp3(os.path.join(book, "02.mp3"), "Sourcery", "Two", "2", 1100)
+        sc = scanner.Scanner(cache=False)
+        folder = sc.scan(audio)
+        self.assertEqual(len(sc.db.file_get_by_folder(folder)), 2)
+
+        # A new file, a changed file, a new directory and a deleted file
+        write_mp3(os.path.join(book, "03.mp3"), "Sourcery", "Three", "3", 1200)  # noqa: E501 # pylint: disable-msg=C0301
+        write_mp3(os.path.join(book, "02.mp3"), "Sourcery", "Deux", "2", 1150)  # noqa: E501 # pylint: disable-msg=C0301
+        sequel: Final[str] = os.path.join(audio, "sequel")
+        os.makedirs(sequel)
+        write_mp3(os.path.join(sequel, "01.mp3"), "Eric", "Eins", "1", 1300)
+        os.remove(os.path.join(book, "01.mp3"))
+
+        with patch("vox.scanner.inspect_file",
+                   wraps=scanner.inspect_file) as inspect:
+            sc.update(folder,
+                      [os.path.join(book, "03.mp3"),
+                       os.path.join(book, "02.mp3"),
+                       sequel],
+                      [os.path.join(book, "01.mp3")])
+            self.assertEqual(inspect.call_count, 3)
+
+        paths = sorted(f.path for f in sc.db.file_get_by_folder(folder))
+        self.assertEqual(paths,
+                         [os.path.join(book, "02.mp3"),
+                          os.path.join(book, "03.mp3"),
+                          os.path.join(sequel, "01.mp3")])
+        f2 = sc.db.file_get_by_path(os.path.join(book, "02.mp3"))
+        assert f2 is not None
+        self.assertEqual(f2.title, "Deux")
+
+    def test_02_coalesce(self) -> None:
+        """Test that changes are collected until things get quiet"""
+        a: Final[str] = os.path.join(ROOT, "a.mp3")
+        b: Final[str] = os.path.join(ROOT, "b.mp3")
+        c: Final[str] = os.path.join(ROOT, "c.mp3")
+        new: Final[str] = os.path.join(ROOT, "new")
+        sc, ino = run_watch([
+            (0.0, [(IN_CLOSE_WRITE, a),
+                   # Only picked up once it has been written
+                   (IN_CREATE, b),
+                   (IN_CLOSE_WRITE, os.path.join(ROOT, "notes.txt")),
+                   (IN_CLOSE_WRITE, "/elsewhere/x.mp3")]),
+            (0.2, [(IN_CLOSE_WRITE, b),
+                   (IN_DELETE, a),
+                   (IN_CREATE | IN_ISDIR, new)]),
+            (0.4, [(IN_MOVED_FROM, c)]),
+            (0.6, [(IN_MOVED_TO, c)]),
+            # Not quiet for long enough yet
+            (0.8, []),
+            (1.2, []),
+        ])
+        self.assertEqual(ino.added, [new])
+        sc.update.assert_called_once()
+        folder, changed, removed = sc.update.call_args.args
+        self.assertEqual(folder.path, ROOT)
+        self.assertEqual(sorted(changed), [b, c, new])
+        self.assertEqual(removed, [a])
+        sc.refresh.assert_not_called()
+
+    def test_03_max_delay(self) -> None:
+        """Test that changes are applied after MAX_DELAY seconds even if
+        things never get quiet
+        """
+        count: Final[int] = 20
+        script = [(i * 0.4, [(IN_CLOSE_WRITE, os.path.join(ROOT, f"{i}.mp3"))])  # noqa: E501 # pylint: disable-msg=C0301
+                  for i in range(count)]
+        script.append((count * 0.4 + 1.0, []))
+        sc, _ = run_watch(script)
+        self.assertEqual(sc.update.call_count, 2)
+        # The first event is at 0.0, so the first batch ends with the first
+        # one at MAX_DELAY or later.
+        first: Final[int] = math.ceil(watcher.MAX_DELAY / 0.4) + 1
+        self.assertEqual(len(sc.update.call_args_list[0].args[1]), first)
+        self.assertEqual(len(sc.update.call_args_list[1].args[1]),
+                         count - first)
+
+    def test_04_overflow(self) -> None:
+        """Test rescanning after the event queue has overflowed"""
+        a: Final[str] = os.path.join(ROOT, "a.mp3")
+        b: Final[str] = os.path.join(ROOT, "b.mp3")
+        script: Final[list[tuple[float, list[tuple[int, str]]]]] = [
+            (0.0, [(IN_CLOSE_WRITE, a), (IN_Q_OVERFLOW, "")]),
+            (1.0, [(IN_CLOSE_WRITE, b)]),
+            (2.0, []),
+        ]
+        sc, _ = run_watch(list(script))
+        sc.refresh.assert_called_once()
+        # The rescan has picked up a already.
+        self.assertEqual([c.args[1] for c in sc.update.call_args_list], [[b]])
+
+        # A rescan that fails does not stop the Watcher, and the changes we
+        # know about are applied anyway.
+        sc = Mock()
+        sc.refresh.side_effect = sqlite3.OperationalError("database is locked")  # noqa: E501 # pylint: disable-msg=C0301
+        with self.assertLogs(common.get_logger("watcher"), "ERROR"):
+            run_watch(list(script), sc)
+        sc.refresh.assert_called_once()
+        changed = [p for c in sc.update.call_args_list for p in c.args[1]]
+        self.assertEqual(sorted(changed), [a, b])
+
+    def test_05_start_stop(self) -> None:
+        """Test running the Watcher in the background and stopping it"""
+        w = watcher.Watcher()
+        w.start()
+        thr = w.thread
+        assert thr is not None
+        self.assertTrue(thr.is_alive())
+        w.stop()
+        self.assertFalse(thr.is_alive())
+        self.assertIsNone(w.thread)
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 14:02:11 krylon>
+#
+# /data/code/python/vox/watcher.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Vox audiobook reader. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+vox.watcher
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from threading import Event, Thread
+from typing import Final, Optional
+
+from vox import common, scanner
+from vox.data import Folder
+
+# Constants from <sys/inotify.h>
+IN_CLOSE_WRITE: Final[int] = 0x00000008
+IN_MOVED_FROM: Final[int] = 0x00000040
+IN_MOVED_TO: Final[int] = 0x00000080
+IN_CREATE: Final[int] = 0x00000100
+IN_DELETE: Final[int] = 0x00000200
+IN_Q_OVERFLOW: Final[int] = 0x00004000
+IN_IGNORED: Final[int] = 0x00008000
+IN_ONLYDIR: Final[int] = 0x01000000
+IN_ISDIR: Final[int] = 0x40000000
+
+WATCH_MASK: Final[int] = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER: Final[struct.Struct] = struct.Struct("iIII")
+READ_SIZE: Final[int] = 64 * 1024
+
+# How long things have to be quiet before we apply the changes we have seen
+DEBOUNCE: Final[float] = 0.5
+# How long we let changes pile up at most, if things never get quiet
+MAX_DELAY: Final[float] = 5.0
+# How often to check for Folders that have been added in the meantime
+FOLDER_CHECK: Final[float] = 30.0
+# How often to rescan all Folders if we cannot use inotify
+POLL_INTERVAL: Final[float] = 10.0
+
+
+class Inotify:
+    """A thin wrapper around the Linux inotify API, using ctypes."""
+
+    __slots__ = [
+        "libc",
+        "fd",
+        "paths",
+        "wds",
+    ]
+
+    libc: ctypes.CDLL
+    fd: int
+    paths: dict[int, str]
+    wds: dict[str, int]
+
+    def __init__(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available on this system")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths = {}
+        self.wds = {}
+
+    def close(self) -> None:
+        """Release the inotify instance and all its watches."""
+        os.close(self.fd)
+
+    def add(self, path: str) -> None:
+        """Watch a single directory."""
+        wd = self.libc.inotify_add_watch(self.fd,
+                                         os.fsencode(path),
+                                         WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def add_tree(self, root: str) -> None:
+        """Watch a directory and all directories below it."""
+        for dirpath, _, _ in os.walk(root):
+            self.add(dirpath)
+
+    def remove_tree(self, root: str) -> None:
+        """Stop watching a directory and all directories below it."""
+        prefix: Final[str] = root.rstrip("/") + "/"
+        for path in [p for p in self.wds if p == root or p.startswith(prefix)]:
+            wd = self.wds.pop(path)
+            del self.paths[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> list[tuple[int, str]]:
+        """Wait up to timeout seconds for events and return them.
+
+        Each event is returned as the event mask and the full path of the
+        file or directory it refers to.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if len(ready) == 0:
+            return []
+        try:
+            buf = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events: list[tuple[int, str]] = []
+        offset: int = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset:offset+length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append((mask, ""))
+                continue
+            if mask & IN_IGNORED:
+                # The directory is gone, and so is the watch.
+                path = self.paths.pop(wd, None)
+                if path is not None:
+                    self.wds.pop(path, None)
+                continue
+            folder = self.paths.get(wd)
+            if folder is None:
+                continue
+            events.append((mask, os.path.join(folder, os.fsdecode(name))))
+        return events
+
+
+class Watcher:
+    """Watcher keeps an eye on all Folders and feeds the changes it sees to a
+    Scanner, file by file, so new files show up without rescanning the
+    whole library.
+
+    Events are coalesced: Changes are applied once nothing has happened for
+    DEBOUNCE seconds, or at the latest after MAX_DELAY seconds, each Folder's
+    changes in a single transaction. If inotify cannot be used, the Watcher
+    falls back to rescanning all Folders every POLL_INTERVAL seconds.
+    """
+
+    __slots__ = [
+        "log",
+        "workers",
+        "folders",
+        "quit",
+        "thread",
+        "scanner",
+    ]
+
+    log: logging.Logger
+    workers: int
+    folders: list[Folder]
+    quit: Event
+    thread: Optional[Thread]
+    scanner: Optional[scanner.Scanner]
+
+    def __init__(self, workers: int = 0) -> None:
+        self.log = common.get_logger("watcher")
+        self.workers = workers
+        self.folders = []
+        self.quit = Event()
+        self.thread = None
+        self.scanner = None
+
+    def start(self) -> None:
+        """Run the Watcher in a background thread."""
+        self.quit.clear()
+        self.thread = Thread(target=self.run, name="watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Tell the Watcher to stop and wait for it to finish.
+
+        A rescan that is in progress is cancelled.
+        """
+        self.quit.set()
+        sc = self.scanner
+        if sc is not None:
+            sc.cancel()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self) -> None:
+        """Watch all Folders until stop() is called."""
+        # The Scanner's database connection must be created in the thread
+        # that uses it.
+        sc = scanner.Scanner(self.workers)
+        self.scanner = sc
+        self.folders = sc.db.folder_get_all()
+
+        try:
+            ino = Inotify()
+        except OSError as e:
+            self.log.warning("Cannot use inotify (%s), polling instead", e)
+            self.__poll(sc)
+            return
+
+        try:
+            for f in self.folders:
+                ino.add_tree(f.path)
+        except OSError as e:
+            ino.close()
+            self.log.warning("Cannot watch all folders (%s), polling instead",
+                             e)
+            self.__poll(sc)
+            return
+
+        try:
+            self.__watch(sc, ino)
+        finally:
+            ino.close()
+
+    def __watch(self, sc: scanner.Scanner, ino: Inotify) -> None:
+        """Collect inotify events and apply them in batches."""
+        # For each path, whether it exists after the last event we saw
+        pending: dict[str, bool] = {}
+        first: float = 0.0
+        last: float = 0.0
+        checked: float = time.monotonic()
+        rescan: bool = False
+
+        while not self.quit.is_set():
+            events = ino.read(DEBOUNCE)
+            now = time.monotonic()
+            for mask, path in events:
+                if mask & IN_Q_OVERFLOW:
+                    self.log.warning("inotify queue overflowed, will rescan")
+                    rescan = True
+                    continue
+                isdir: bool = (mask & IN_ISDIR) != 0
+                if not isdir and scanner.AUDIO_PAT.search(path) is None:
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    if isdir:
+                        try:
+                            ino.add_tree(path)
+                        except OSError as e:
+                            self.log.error("Cannot watch %s: %s", path, e)
+                        pending[path] = True
+                    elif mask & IN_MOVED_TO:
+                        pending[path] = True
+                    # Files that are created are picked up once they have
+                    # been written and closed.
+                elif mask & IN_CLOSE_WRITE:
+                    pending[path] = True
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    if isdir:
+                        ino.remove_tree(path)
+                    pending[path] = False
+
+            if len(events) > 0:
+                last = now
+                if first == 0.0:
+                    first = now
+
+            if rescan:
+                rescan = False
+                try:
+                    sc.refresh()
+                    pending = {}
+                    first = 0.0
+                except Exception as e:  # pylint: disable-msg=W0718
+                    # We still apply the changes we know about.
+                    self.log.error("Caught exception while rescanning: %s", e)
+            if len(pending) > 0 and \
+                    (now - last >= DEBOUNCE or now - first >= MAX_DELAY):
+                self.__apply(sc, pending)
+                pending = {}
+                first = 0.0
+
+            if now - checked >= FOLDER_CHECK:
+                checked = now
+                self.__check_folders(sc, ino)
+
+    def __apply(self, sc: scanner.Scanner, pending: dict[str, bool]) -> None:
+        """Hand the changes we have collected to the Scanner."""
+        changes: dict[int, tuple[Folder, list[str], list[str]]] = {}
+        for path, exists in pending.items():
+            folder = self.__folder_of(path)
+            if folder is None:
+                continue
+            if folder.folder_id not in changes:
+                changes[folder.folder_id] = (folder, [], [])
+            changes[folder.folder_id][1 if exists else 2].append(path)
+
+        for folder, changed, removed in changes.values():
+            self.log.debug("Apply %d changes and %d removals below %s",
+                           len(changed),
+                           len(removed),
+                           folder.path)
+            try:
+                sc.update(folder, changed, removed)
+            except Exception as e:  # pylint: disable-msg=W0718
+                self.log.error("Caught exception while updating %s: %s",
+                               folder.path,
+                               e)
+
+    def __folder_of(self, path: str) -> Optional[Folder]:
+        """Return the innermost Folder path lives in."""
+        match: Optional[Folder] = None
+        for f in self.folders:
+            if path.startswith(f.path.rstrip("/") + "/") and \
+                    (match is None or len(f.path) > len(match.path)):
+                match = f
+        return match
+
+    def __check_folders(self, sc: scanner.Scanner, ino: Inotify) -> None:
+        """Start watching Folders that have been added since we started."""
+        known: Final[set[int]] = {f.folder_id for f in self.folders}
+        for f in sc.db.folder_get_all():
+            if f.folder_id in known:
+                continue
+            self.log.info("Start watching %s", f.path)
+            self.folders.append(f)
+            try:
+                ino.add_tree(f.path)
+            except OSError as e:
+                self.log.error("Cannot watch %s: %s", f.path, e)
+
+    def __poll(self, sc: scanner.Scanner) -> None:
+        """Rescan all Folders periodically.
+
+        Since rescans skip directories that have not changed, this is mostly
+        a matter of stat'ing every directory.
+        """
+        while not self.quit.wait(POLL_INTERVAL):
+            try:
+                sc.refresh()
+            except Exception as e:  # pylint: disable-msg=W0718
+                self.log.error("Caught exception while rescanning: %s", e)
+
+
+def watch(workers: int = 0) -> None:
+    """Watch all Folders until interrupted.
+
+    Like scanner.scan, this is mainly meant for testing and debugging.
+    """
+    w: Watcher = Watcher(workers)
+    try:
+        w.run()
+    except KeyboardInterrupt:
+        w.log.info("Stop watching")
+
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #